@@ -0,0 +1,198 @@
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from qr_codes.models import QRCode
+from ticket.models import Ticket
+from .gate import GateCheckIn
+
+
+# Paid tickets carry "<ticket_number>|<ticket_code>" (see ConcertTicketGenerator)
+TICKET_SEPARATOR = '|'
+
+# kind is 'guest' or 'ticket'; key is the guest token or the ticket code,
+# number the printed ticket number (tickets only)
+Credential = namedtuple('Credential', 'kind key number')
+
+
+class CredentialError(ValueError):
+    pass
+
+
+def _ticket_key(ticket_code):
+    return f"gate:ticket:{ticket_code}"
+
+
+def _ticket_admitted_key(ticket_id):
+    return f"gate:ticket-admitted:{ticket_id}"
+
+
+def decode(raw):
+    """
+    Credential scanned from a guest invitation QR (compact credential or
+    JWT) or a paid ticket QR. Raises CredentialError for anything else,
+    or for a guest token with a bad signature or past its expiry.
+    """
+    raw = raw.strip()
+
+    if TICKET_SEPARATOR in raw:
+        number, _, code = raw.partition(TICKET_SEPARATOR)
+        try:
+            code = uuid.UUID(code)
+        except ValueError:
+            raise CredentialError('Invalid QR code')
+        return Credential('ticket', str(code), number)
+
+    payload = QRCode.verify_token(raw)
+    if 'error' in payload:
+        raise CredentialError(payload['error'])
+    return Credential('guest', raw, None)
+
+
+class CredentialVerifier:
+    """
+    Check-in for any credential a gate can be shown: guest invitation QR
+    codes and paid ticket QR codes.
+
+    A scan is decoded, resolved to (event, holder, name) through the gate's
+    cached index (guests as in GateCheckIn, tickets by ticket code), turned
+    away from the cache if the holder is already in, and admitted with one
+    conditional UPDATE, so concurrent scans of the same credential can
+    never both succeed.
+    """
+
+    def __init__(self, timeout=None):
+        self.gate = GateCheckIn(timeout)
+        self.timeout = self.gate.timeout
+
+    def open(self, event):
+        """Load an event's guest and ticket codes into the index, returns the count"""
+        count = self.gate.open(event)
+
+        rows = (
+            Ticket.objects.filter(event=event)
+            .values_list('ticket_code', 'id', 'holder_name', 'ticket_number', 'checked_in')
+            .iterator(chunk_size=2000)
+        )
+
+        entries = {}
+        not_admitted = []
+        for ticket_code, ticket_id, holder_name, ticket_number, checked_in in rows:
+            entries[_ticket_key(ticket_code)] = (event.id, ticket_id, holder_name, ticket_number)
+            if checked_in:
+                entries[_ticket_admitted_key(ticket_id)] = True
+            else:
+                not_admitted.append(_ticket_admitted_key(ticket_id))
+            count += 1
+            if len(entries) >= 1000:
+                self._store(entries, not_admitted)
+                entries, not_admitted = {}, []
+        self._store(entries, not_admitted)
+
+        return count
+
+    def resolve(self, credential):
+        """(event_id, holder_id, name) for a credential, or None if it was never issued"""
+        if credential.kind == 'guest':
+            return self.gate.lookup(credential.key)
+
+        key = _ticket_key(credential.key)
+        entry = cache.get(key)
+        if entry is None:
+            row = (
+                Ticket.objects.filter(ticket_code=credential.key)
+                .values_list('event_id', 'id', 'holder_name', 'ticket_number')
+                .first()
+            )
+            if row is None:
+                return None
+            entry = row
+            cache.set(key, entry, self.timeout)
+
+        event_id, ticket_id, holder_name, ticket_number = entry
+        if ticket_number != credential.number:
+            return None
+        return event_id, ticket_id, holder_name
+
+    def scan(self, raw, user=None, ip_address=None, event_id=None):
+        """
+        Admit the holder of a scanned credential on behalf of ``user``.
+        Returns (status, details) where status is 'admitted', 'invalid',
+        'not_found', 'wrong_event', 'forbidden' (``user`` may not scan for
+        the holder's event), 'wrong_date', 'already_checked_in' or
+        'not_valid' (a cancelled or otherwise unusable ticket). Pass
+        ``event_id`` to turn away credentials for other events.
+        """
+        try:
+            credential = decode(raw)
+        except CredentialError as e:
+            return 'invalid', {'error': str(e)}
+
+        entry = self.resolve(credential)
+        if entry is None:
+            return 'not_found', {}
+        holder_event_id, holder_id, name = entry
+        details = {'type': credential.kind, 'id': holder_id, 'name': name, 'event_id': holder_event_id}
+
+        # Before anything about the holder is given away
+        if not self.gate.may_scan(user, holder_event_id):
+            return 'forbidden', {'event_id': holder_event_id}
+
+        if event_id is not None and holder_event_id != event_id:
+            return 'wrong_event', details
+
+        event = self.gate.event(holder_event_id)
+        today = timezone.localdate()
+        if today != event['event_date']:
+            details.update(event_date=event['event_date'], current_date=today)
+            return 'wrong_date', details
+
+        # Repeat scans are turned away here without a database write
+        if not self._claim(credential.kind, holder_id):
+            return 'already_checked_in', details
+
+        try:
+            if credential.kind == 'guest':
+                checked_in_at = self.gate.admit(
+                    (holder_event_id, holder_id, name),
+                    credential.key,
+                    user=user,
+                    ip_address=ip_address
+                )
+            else:
+                checked_in_at = Ticket.admit(holder_id, user=user)
+        except Exception:
+            self._release(credential.kind, holder_id)
+            raise
+
+        if checked_in_at is None:
+            if credential.kind == 'ticket':
+                ticket_status = Ticket.objects.filter(id=holder_id).values_list('status', flat=True).first()
+                if ticket_status != 'used':
+                    # Not admitted, so do not turn the next scan away as a repeat
+                    self._release('ticket', holder_id)
+                    details['status'] = ticket_status
+                    return 'not_valid', details
+            return 'already_checked_in', details
+
+        details['checked_in_at'] = checked_in_at
+        return 'admitted', details
+
+    def _store(self, entries, not_admitted):
+        if entries:
+            cache.set_many(entries, self.timeout)
+        if not_admitted:
+            cache.delete_many(not_admitted)
+
+    def _claim(self, kind, holder_id):
+        if kind == 'guest':
+            return self.gate.claim(holder_id)
+        return cache.add(_ticket_admitted_key(holder_id), True, self.timeout)
+
+    def _release(self, kind, holder_id):
+        if kind == 'guest':
+            self.gate.release(holder_id)
+        else:
+            cache.delete(_ticket_admitted_key(holder_id))
@@ -0,0 +1,238 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from guests.models import Guest
+from qr_codes.models import QRCode
+from .models import CheckIn, ScannerChange
+
+
+# Hex characters of the token digest sent to scanners (128 bits)
+SCANNER_DIGEST_CHARS = 32
+
+
+def token_digest(token):
+    """Fixed-width key for a QR token"""
+    return QRCode.digest(token)
+
+
+def scanner_digest(token):
+    """Shortened token digest scanners match offline scans against"""
+    return token_digest(token)[:SCANNER_DIGEST_CHARS]
+
+
+def _token_key(digest):
+    return f"gate:token:{digest}"
+
+
+def _admitted_key(guest_id):
+    return f"gate:admitted:{guest_id}"
+
+
+def _event_key(event_id):
+    return f"gate:event:{event_id}"
+
+
+class GateCheckIn:
+    """
+    Check-in for busy doors.
+
+    Opening the gate for an event loads every QR token of the event into
+    the cache as token digest -> (event, guest, name), together with the
+    guests already inside. A scan is then answered from the cache: unknown
+    codes, wrong days and repeat scans are turned away without touching
+    the database, and an admission costs one conditional UPDATE (so two
+    scanners can never both admit a guest) plus the check-in log row and
+    the QR code's used flag, in one transaction.
+
+    Only tokens the event issued are looked at further; their expiry is
+    then checked as in the regular check-in (a compact credential costs one
+    short HMAC). Tokens missing from the index (guests added after the gate
+    opened, or an evicted entry) fall back to the database.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or settings.GATE_INDEX_TIMEOUT_HOURS * 3600
+
+    def open(self, event):
+        """Load the admission index for an event, returns the number of codes"""
+        cache.set(_event_key(event.id), {
+            'title': event.title,
+            'event_date': timezone.localdate(event.event_date),
+            'organizer_id': event.organizer_id,
+        }, self.timeout)
+
+        rows = (
+            QRCode.objects.filter(guest__event=event, token_digest__isnull=False)
+            .values_list('token_digest', 'guest_id', 'guest__first_name', 'guest__last_name', 'guest__has_checked_in')
+            .iterator(chunk_size=2000)
+        )
+
+        count = 0
+        entries = {}
+        not_admitted = []
+        for digest, guest_id, first_name, last_name, has_checked_in in rows:
+            entries[_token_key(digest)] = (event.id, guest_id, f"{first_name} {last_name}")
+            if has_checked_in:
+                entries[_admitted_key(guest_id)] = True
+            else:
+                # Clears admissions that were undone since the last opening
+                not_admitted.append(_admitted_key(guest_id))
+            count += 1
+            if len(entries) >= 1000:
+                self._store(entries, not_admitted)
+                entries, not_admitted = {}, []
+        self._store(entries, not_admitted)
+
+        return count
+
+    def lookup(self, token):
+        """(event_id, guest_id, name) for a token, or None if it was never issued"""
+        digest = token_digest(token)
+        key = _token_key(digest)
+        entry = cache.get(key)
+        if entry is None:
+            row = (
+                QRCode.objects.filter(token_digest=digest)
+                .values_list('guest__event_id', 'guest_id', 'guest__first_name', 'guest__last_name')
+                .first()
+            )
+            if row is None:
+                return None
+            event_id, guest_id, first_name, last_name = row
+            entry = (event_id, guest_id, f"{first_name} {last_name}")
+            cache.set(key, entry, self.timeout)
+        return entry
+
+    def may_scan(self, user, event_id):
+        """Whether ``user`` may admit people to an event: its organizer or staff"""
+        if user is None or not user.is_authenticated:
+            return False
+        return user.is_staff or self.event(event_id)['organizer_id'] == user.id
+
+    def scan(self, token, user=None, ip_address=None):
+        """
+        Admit the holder of ``token`` on behalf of ``user``. Returns (status,
+        details) where status is 'admitted', 'invalid', 'forbidden' (``user``
+        may not scan for the guest's event), 'rejected' (expired or badly
+        signed, the reason in details['error']), 'wrong_date' or
+        'already_checked_in'.
+        """
+        entry = self.lookup(token)
+        if entry is None:
+            return 'invalid', {}
+        event_id, guest_id, name = entry
+
+        # Before anything about the guest is given away
+        if not self.may_scan(user, event_id):
+            return 'forbidden', {'event_id': event_id}
+        details = {'guest_id': guest_id, 'guest': name, 'event_id': event_id}
+
+        payload = QRCode.verify_token(token)
+        if 'error' in payload:
+            details['error'] = payload['error']
+            return 'rejected', details
+
+        event = self.event(event_id)
+        today = timezone.localdate()
+        if today != event['event_date']:
+            details.update(event_date=event['event_date'], current_date=today)
+            return 'wrong_date', details
+
+        # Repeat scans are turned away here without a database write
+        if not self.claim(guest_id):
+            return 'already_checked_in', details
+
+        try:
+            checked_in_at = self.admit(entry, token, user=user, ip_address=ip_address)
+        except Exception:
+            self.release(guest_id)
+            raise
+
+        if checked_in_at is None:
+            return 'already_checked_in', details
+        details['checked_in_at'] = checked_in_at
+        return 'admitted', details
+
+    @staticmethod
+    def admit(entry, token, user=None, ip_address=None, scanned_at=None, device_id=''):
+        """
+        Record the admission, returns its time or None if the guest was
+        already checked in.
+
+        A scan with ``scanned_at`` (uploaded by an offline scanner) also
+        wins over an admission recorded for a later time, so whichever
+        scanner saw the guest first is the one on record. It then takes
+        over that admission's check-in log row rather than adding one.
+        """
+        event_id, guest_id, _ = entry
+        now = timezone.now()
+        checked_in_at = scanned_at or now
+        admission = {
+            'checked_in_by': user if user and user.is_authenticated else None,
+            'ip_address': ip_address,
+            'device_id': device_id,
+            'scanned_at': checked_in_at,
+        }
+        guest_update = {
+            'has_checked_in': True,
+            'checked_in_at': checked_in_at,
+            'checked_in_by': f'Scanner {device_id}' if device_id else 'Security',
+            'updated_at': now,
+        }
+
+        with transaction.atomic():
+            if Guest.objects.filter(id=guest_id, has_checked_in=False).update(**guest_update):
+                CheckIn.objects.create(guest_id=guest_id, check_in_method='qr_scan', **admission)
+                ScannerChange.record(event_id, 'admitted', [scanner_digest(token)])
+            elif scanned_at and Guest.objects.filter(
+                id=guest_id, has_checked_in=True, checked_in_at__gt=scanned_at
+            ).update(**guest_update):
+                later = CheckIn.objects.filter(guest_id=guest_id).order_by('-created_at', '-id').first()
+                if later is None:
+                    CheckIn.objects.create(guest_id=guest_id, check_in_method='qr_scan', **admission)
+                else:
+                    CheckIn.objects.filter(id=later.id).update(check_in_method='qr_scan', **admission)
+            else:
+                return None
+
+            QRCode.objects.filter(guest_id=guest_id).update(is_used=True, used_at=checked_in_at)
+        return checked_in_at
+
+    def event(self, event_id):
+        """Cached title, local date and organizer of an event"""
+        event = cache.get(_event_key(event_id))
+        if event is None or 'organizer_id' not in event:
+            event = self._load_event(event_id)
+        return event
+
+    def claim(self, guest_id):
+        """Mark a guest admitted in the cache, False if they already were"""
+        return cache.add(_admitted_key(guest_id), True, self.timeout)
+
+    def release(self, guest_id):
+        """Undo claim() when the admission did not go through"""
+        cache.delete(_admitted_key(guest_id))
+
+    def remember_admitted(self, guest_id):
+        """Turn away later scans of a guest admitted outside scan()"""
+        cache.set(_admitted_key(guest_id), True, self.timeout)
+
+    def _store(self, entries, not_admitted):
+        if entries:
+            cache.set_many(entries, self.timeout)
+        if not_admitted:
+            cache.delete_many(not_admitted)
+
+    def _load_event(self, event_id):
+        from events.models import Event
+
+        event = Event.objects.only('title', 'event_date', 'organizer_id').get(id=event_id)
+        data = {
+            'title': event.title,
+            'event_date': timezone.localdate(event.event_date),
+            'organizer_id': event.organizer_id,
+        }
+        cache.set(_event_key(event_id), data, self.timeout)
+        return data
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0001_initial'),
+        ('events', '0004_alter_event_organizer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkin',
+            name='device_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='checkin',
+            name='scanned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScannerSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scanner_sync_state', to='events.event')),
+            ],
+            options={
+                'verbose_name': 'Scanner sync state',
+                'verbose_name_plural': 'Scanner sync states',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScannerChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('issued', 'Issued'), ('admitted', 'Admitted')], max_length=20)),
+                ('digest', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scanner_changes', to='events.event')),
+            ],
+            options={
+                'verbose_name': 'Scanner change',
+                'verbose_name_plural': 'Scanner changes',
+                'ordering': ['version'],
+                'indexes': [models.Index(fields=['event', 'version'], name='checkin_sca_event_i_bfff7d_idx')],
+            },
+        ),
+    ]
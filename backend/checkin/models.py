@@ -30,6 +30,11 @@ class CheckIn(models.Model):
     notes = models.TextField(blank=True, null=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     
+    # Scanner that admitted the guest, and when it scanned (offline scans
+    # are uploaded later than they happen)
+    device_id = models.CharField(max_length=100, blank=True)
+    scanned_at = models.DateTimeField(blank=True, null=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -38,4 +43,73 @@ class CheckIn(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.guest.full_name} - {self.created_at}"
\ No newline at end of file
+        return f"{self.guest.full_name} - {self.created_at}"
+
+
+class ScannerSyncState(models.Model):
+    """Per-event version counter for scanner delta sync."""
+    
+    event = models.OneToOneField(
+        'events.Event',
+        on_delete=models.CASCADE,
+        related_name='scanner_sync_state'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Scanner sync state'
+        verbose_name_plural = 'Scanner sync states'
+    
+    def __str__(self):
+        return f"{self.event} - v{self.version}"
+
+
+class ScannerChange(models.Model):
+    """Change to an event's admission set, pulled by scanners as a delta."""
+    
+    KIND_CHOICES = [
+        ('issued', 'Issued'),
+        ('admitted', 'Admitted'),
+    ]
+    
+    event = models.ForeignKey(
+        'events.Event',
+        on_delete=models.CASCADE,
+        related_name='scanner_changes'
+    )
+    version = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    digest = models.CharField(max_length=64)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Scanner change'
+        verbose_name_plural = 'Scanner changes'
+        ordering = ['version']
+        indexes = [
+            models.Index(fields=['event', 'version']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} v{self.version} {self.kind}"
+    
+    @classmethod
+    def record(cls, event_id, kind, digests):
+        """
+        Log changes under the event's next version. The counter row stays
+        locked until the caller's transaction commits, so versions become
+        visible in order and a delta never skips one.
+        """
+        from django.db import transaction
+        from django.db.models import F
+        
+        with transaction.atomic():
+            ScannerSyncState.objects.get_or_create(event_id=event_id)
+            ScannerSyncState.objects.filter(event_id=event_id).update(version=F('version') + 1)
+            version = ScannerSyncState.objects.values_list('version', flat=True).get(event_id=event_id)
+            cls.objects.bulk_create([
+                cls(event_id=event_id, version=version, kind=kind, digest=digest)
+                for digest in digests
+            ])
+        return version
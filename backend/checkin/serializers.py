@@ -20,6 +20,8 @@ class CheckInSerializer(serializers.ModelSerializer):
             'check_in_method',
             'notes',
             'ip_address',
+            'device_id',
+            'scanned_at',
             'created_at',
         ]
         read_only_fields = ['id', 'created_at']
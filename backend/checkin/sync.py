@@ -0,0 +1,134 @@
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from guests.models import Guest
+from qr_codes.models import QRCode
+from .gate import SCANNER_DIGEST_CHARS, GateCheckIn
+from .models import ScannerChange, ScannerSyncState
+
+
+SNAPSHOT_SALT = 'checkin.scanner-sync'
+
+
+def sign_payload(payload):
+    """Compact signed form of a sync payload (zlib + base64 JSON)"""
+    return signing.dumps(payload, key=settings.QR_CODE_SECRET_KEY, salt=SNAPSHOT_SALT, compress=True)
+
+
+def load_payload(signed):
+    """Inverse of sign_payload, raises signing.BadSignature if tampered with"""
+    return signing.loads(signed, key=settings.QR_CODE_SECRET_KEY, salt=SNAPSHOT_SALT)
+
+
+def current_version(event_id):
+    return (
+        ScannerSyncState.objects.filter(event_id=event_id)
+        .values_list('version', flat=True)
+        .first()
+    ) or 0
+
+
+def build_sync(event, since=0):
+    """
+    What a scanner needs to catch up from version ``since``.
+
+    Scanners that have synced before get only the changes logged since
+    then; new scanners (since=0), or ones claiming a version the server
+    never handed out, get a full snapshot of every issued code and every
+    guest already admitted. Codes are sent as shortened token digests.
+    """
+    # Read the version first: anything that changes while the rest is
+    # read is sent again next time, and applying it twice is harmless
+    version = current_version(event.id)
+
+    if 0 < since <= version:
+        changes = (
+            ScannerChange.objects.filter(event=event, version__gt=since, version__lte=version)
+            .values_list('kind', 'digest')
+        )
+        issued, admitted = set(), set()
+        for kind, digest in changes:
+            (issued if kind == 'issued' else admitted).add(digest)
+        full = False
+    else:
+        issued, admitted = set(), set()
+        rows = (
+            QRCode.objects.filter(guest__event=event, token_digest__isnull=False)
+            .values_list('token_digest', 'guest__has_checked_in')
+            .iterator(chunk_size=2000)
+        )
+        for token_digest, has_checked_in in rows:
+            digest = token_digest[:SCANNER_DIGEST_CHARS]
+            issued.add(digest)
+            if has_checked_in:
+                admitted.add(digest)
+        full = True
+
+    return {
+        'event': event.id,
+        'version': version,
+        'full': full,
+        'issued': sorted(issued),
+        'admitted': sorted(admitted),
+    }
+
+
+def upload_scans(event, device_id, scans, user=None, ip_address=None):
+    """
+    Apply scans a device made offline. Each scan is {'token', 'scanned_at'}.
+
+    Scans are applied in (scanned_at, device) order and the earliest scan
+    of a guest wins, whichever device uploads first. Returns one result per
+    scan, in the order given: 'admitted', 'duplicate', 'invalid',
+    'wrong_event' or 'wrong_date' (scanned on another day than the event's).
+    """
+    gate = GateCheckIn()
+    now = timezone.now()
+    event_date = timezone.localdate(event.event_date)
+
+    pending = []
+    results = [None] * len(scans)
+    for index, scan in enumerate(scans):
+        token = scan.get('token') or ''
+        scanned_at = parse_datetime(scan.get('scanned_at') or '')
+        entry = gate.lookup(token) if token else None
+
+        if entry is None or scanned_at is None:
+            results[index] = {'status': 'invalid'}
+        elif entry[0] != event.id:
+            results[index] = {'status': 'wrong_event'}
+        else:
+            if timezone.is_naive(scanned_at):
+                scanned_at = timezone.make_aware(scanned_at, dt_timezone.utc)
+            # Scans stamped in the future (scanner clock ahead) count as now
+            scanned_at = min(scanned_at, now)
+            if timezone.localdate(scanned_at) != event_date:
+                results[index] = {'status': 'wrong_date'}
+            else:
+                pending.append((scanned_at, index, entry, token))
+
+    pending.sort(key=lambda item: (item[0], device_id, item[1]))
+    for scanned_at, index, entry, token in pending:
+        checked_in_at = gate.admit(
+            entry,
+            token,
+            user=user,
+            ip_address=ip_address,
+            scanned_at=scanned_at,
+            device_id=device_id
+        )
+        if checked_in_at is None:
+            checked_in_at = (
+                Guest.objects.filter(id=entry[1]).values_list('checked_in_at', flat=True).first()
+            )
+            results[index] = {'status': 'duplicate', 'checked_in_at': checked_in_at}
+        else:
+            gate.remember_admitted(entry[1])
+            results[index] = {'status': 'admitted', 'checked_in_at': checked_in_at}
+        results[index]['guest'] = entry[2]
+
+    return results
@@ -1,3 +1,177 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from rest_framework.test import APIClient
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from events.models import Event
+from guests.models import Guest
+from qr_codes import compact
+from qr_codes.models import QRCode
+from .gate import GateCheckIn
+from .models import CheckIn
+from .sync import upload_scans
+
+
+def make_guest(event, expires_in=timedelta(hours=1), **kwargs):
+    """Guest of ``event`` with a compact QR token expiring ``expires_in`` from now"""
+    guest = Guest.objects.create(
+        event=event, first_name='Ada', last_name='Lovelace', email='ada@example.com', **kwargs
+    )
+    QRCode.objects.create(
+        guest=guest,
+        token=compact.encode(guest.id, event.id, timezone.now() + expires_in)
+    )
+    return guest
+
+
+class GateTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create_user(
+            email='organizer@example.com',
+            password='password',
+            user_type='organizer'
+        )
+        self.event = Event.objects.create(
+            organizer=self.organizer,
+            title='Launch Night',
+            event_date=timezone.now(),
+            location='Lagos',
+        )
+        self.gate = GateCheckIn()
+
+
+class GateScanTests(GateTestCase):
+
+    def test_valid_token_is_admitted_once(self):
+        guest = make_guest(self.event)
+
+        self.assertEqual(self.gate.scan(guest.qr_code.token, user=self.organizer)[0], 'admitted')
+        self.assertEqual(self.gate.scan(guest.qr_code.token, user=self.organizer)[0], 'already_checked_in')
+        self.assertEqual(CheckIn.objects.filter(guest=guest).count(), 1)
+
+    def test_expired_token_is_rejected(self):
+        guest = make_guest(self.event, expires_in=-timedelta(minutes=1))
+        self.gate.open(self.event)
+
+        result, details = self.gate.scan(guest.qr_code.token, user=self.organizer)
+
+        self.assertEqual(result, 'rejected')
+        self.assertEqual(details['error'], 'Token has expired')
+        guest.refresh_from_db()
+        self.assertFalse(guest.has_checked_in)
+
+    def test_other_organizers_are_turned_away(self):
+        guest = make_guest(self.event)
+        other = User.objects.create_user(
+            email='other@example.com', password='password', user_type='organizer'
+        )
+
+        self.assertEqual(self.gate.scan(guest.qr_code.token), ('forbidden', {'event_id': self.event.id}))
+        self.assertEqual(self.gate.scan(guest.qr_code.token, user=other)[0], 'forbidden')
+        guest.refresh_from_db()
+        self.assertFalse(guest.has_checked_in)
+
+    def test_unknown_token_is_invalid(self):
+        token = compact.encode(999, self.event.id, timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(self.gate.scan(token, user=self.organizer), ('invalid', {}))
+
+
+class UploadScansTests(GateTestCase):
+
+    def test_earlier_offline_scan_takes_over_the_admission(self):
+        guest = make_guest(self.event)
+        token = guest.qr_code.token
+        self.gate.scan(token, user=self.organizer)
+        scanned_at = timezone.now() - timedelta(seconds=30)
+
+        results = upload_scans(
+            self.event, 'door-2', [{'token': token, 'scanned_at': scanned_at.isoformat()}]
+        )
+
+        self.assertEqual(results[0]['status'], 'admitted')
+        check_in = CheckIn.objects.get(guest=guest)
+        self.assertEqual((check_in.device_id, check_in.scanned_at), ('door-2', scanned_at))
+        guest.refresh_from_db()
+        self.assertEqual(guest.checked_in_at, scanned_at)
+
+    def test_later_offline_scan_is_a_duplicate(self):
+        guest = make_guest(self.event)
+        token = guest.qr_code.token
+        self.gate.scan(token, user=self.organizer)
+
+        results = upload_scans(
+            self.event, 'door-2', [{'token': token, 'scanned_at': timezone.now().isoformat()}]
+        )
+
+        self.assertEqual(results[0]['status'], 'duplicate')
+        self.assertEqual(CheckIn.objects.filter(guest=guest).count(), 1)
+
+    def test_scans_from_another_day_are_turned_away(self):
+        guest = make_guest(self.event)
+        scanned_at = timezone.now() - timedelta(days=1)
+
+        results = upload_scans(
+            self.event, 'door-2', [{'token': guest.qr_code.token, 'scanned_at': scanned_at.isoformat()}]
+        )
+
+        self.assertEqual(results[0]['status'], 'wrong_date')
+        guest.refresh_from_db()
+        self.assertFalse(guest.has_checked_in)
+        self.assertFalse(CheckIn.objects.exists())
+
+
+class ScanViewTests(GateTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.guest = make_guest(self.event)
+        self.url = reverse('checkin:checkin-scan')
+
+    def scan(self, user=None):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'token': self.guest.qr_code.token}, format='json')
+
+    def test_anonymous_scans_are_refused(self):
+        response = self.scan()
+
+        self.assertEqual(response.status_code, 401)
+        self.guest.refresh_from_db()
+        self.assertFalse(self.guest.has_checked_in)
+
+    def test_other_organizers_cannot_admit(self):
+        other = User.objects.create_user(
+            email='other@example.com', password='password', user_type='organizer'
+        )
+
+        response = self.scan(other)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('holder', response.data)
+        self.assertNotIn('guest', response.data)
+        self.guest.refresh_from_db()
+        self.assertFalse(self.guest.has_checked_in)
+
+    def test_organizer_and_staff_can_admit(self):
+        self.assertEqual(self.scan(self.organizer).status_code, 200)
+
+        staff = User.objects.create_user(
+            email='staff@example.com', password='password', is_staff=True
+        )
+        response = self.scan(staff)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already checked in', response.data['error'])
+
+
+class GateScanViewTests(ScanViewTests):
 
-# Create your tests here.
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('checkin:checkin-gate-scan')
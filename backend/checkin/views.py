@@ -6,7 +6,10 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import date
 
-from .models import CheckIn
+from .credentials import CredentialVerifier
+from .gate import GateCheckIn, scanner_digest
+from .models import CheckIn, ScannerChange
+from .sync import build_sync, sign_payload, upload_scans
 from .serializers import CheckInSerializer
 from guests.models import Guest
 from qr_codes.models import QRCode
@@ -63,7 +66,7 @@ class CheckInViewSet(viewsets.ModelViewSet):
         
         # Get QR code
         try:
-            qr_code = QRCode.objects.select_related('guest', 'guest__event').get(token=token)
+            qr_code = QRCode.lookup(token).select_related('guest', 'guest__event').get()
         except QRCode.DoesNotExist:
             return Response(
                 {'valid': False, 'error': 'Invalid QR code'},
@@ -133,7 +136,7 @@ class CheckInViewSet(viewsets.ModelViewSet):
         
         # Get QR code
         try:
-            qr_code = QRCode.objects.select_related('guest', 'guest__event').get(token=token)
+            qr_code = QRCode.lookup(token).select_related('guest', 'guest__event').get()
         except QRCode.DoesNotExist:
             return Response(
                 {'error': 'Invalid QR code'},
@@ -184,6 +187,7 @@ class CheckInViewSet(viewsets.ModelViewSet):
             check_in_method='qr_scan',
             ip_address=get_client_ip(request)
         )
+        ScannerChange.record(event.id, 'admitted', [scanner_digest(token)])
         
         return Response({
             'success': True,
@@ -195,4 +199,240 @@ class CheckInViewSet(viewsets.ModelViewSet):
                 'checked_in_at': guest.checked_in_at,
             },
             'checkin': CheckInSerializer(checkin).data
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def gate_open(self, request):
+        """Load an event's QR codes and tickets into the gate index before doors open."""
+        from events.models import Event
+        
+        event_id = request.data.get('event')
+        
+        if not event_id:
+            return Response(
+                {'error': 'Event is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        event = get_object_or_404(Event, id=event_id, organizer=request.user)
+        count = CredentialVerifier().open(event)
+        
+        return Response({
+            'event': event.id,
+            'codes': count,
+            'message': f'Gate open for {event.title} with {count} QR codes'
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def scan(self, request):
+        """
+        Check in any credential: guest invitation QR codes and paid ticket
+        QR codes, for events you organize. Pass 'event' to turn away
+        credentials for other events.
+        """
+        token = request.data.get('token')
+        
+        if not token:
+            return Response(
+                {'error': 'Token is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        event_id = request.data.get('event')
+        try:
+            event_id = int(event_id) if event_id else None
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Invalid event'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result, details = CredentialVerifier().scan(
+            token,
+            user=request.user,
+            ip_address=get_client_ip(request),
+            event_id=event_id
+        )
+        
+        if result == 'invalid':
+            return Response(
+                {'error': details['error']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if result == 'not_found':
+            return Response(
+                {'error': 'Invalid QR code'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if result == 'forbidden':
+            return Response(
+                {'error': 'You cannot check in guests for this event'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        holder = {'type': details['type'], 'id': details['id'], 'name': details['name']}
+        
+        if result == 'wrong_event':
+            return Response({
+                'error': 'This code is for a different event',
+                'holder': holder,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if result == 'wrong_date':
+            return Response({
+                'error': 'Check-in is only allowed on the event date',
+                'event_date': details['event_date'],
+                'current_date': details['current_date'],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if result == 'already_checked_in':
+            return Response({
+                'error': f"{details['name']} has already checked in",
+                'holder': holder,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if result == 'not_valid':
+            return Response({
+                'error': f"Ticket is {details['status']}",
+                'holder': holder,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        holder['checked_in_at'] = details['checked_in_at']
+        return Response({
+            'success': True,
+            'message': f"{details['name']} checked in successfully!",
+            'holder': holder,
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def gate_scan(self, request):
+        """
+        Gate-mode check-in: one cached lookup and one conditional update.
+        For events you organize.
+        """
+        token = request.data.get('token')
+        
+        if not token:
+            return Response(
+                {'error': 'Token is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result, details = GateCheckIn().scan(
+            token,
+            user=request.user,
+            ip_address=get_client_ip(request)
+        )
+        
+        if result == 'invalid':
+            return Response(
+                {'error': 'Invalid QR code'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if result == 'forbidden':
+            return Response(
+                {'error': 'You cannot check in guests for this event'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        if result == 'rejected':
+            return Response(
+                {'error': details['error']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if result == 'wrong_date':
+            return Response({
+                'error': 'Check-in is only allowed on the event date',
+                'event_date': details['event_date'],
+                'current_date': details['current_date'],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if result == 'already_checked_in':
+            return Response({
+                'error': 'Guest has already checked in',
+                'guest': details['guest'],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'message': f"{details['guest']} checked in successfully!",
+            'guest': {
+                'id': details['guest_id'],
+                'full_name': details['guest'],
+                'checked_in_at': details['checked_in_at'],
+            }
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def scanner_sync(self, request):
+        """
+        Signed snapshot of an event's QR codes for offline scanners.
+        Pass ?since=<version> from the last sync to get only what changed.
+        """
+        from events.models import Event
+        
+        event_id = request.query_params.get('event')
+        
+        if not event_id:
+            return Response(
+                {'error': 'Event is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response(
+                {'error': 'since must be a version number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        event = get_object_or_404(Event, id=event_id, organizer=request.user)
+        payload = build_sync(event, since)
+        
+        return Response({
+            'event': event.id,
+            'version': payload['version'],
+            'full': payload['full'],
+            'snapshot': sign_payload(payload),
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def scanner_upload(self, request):
+        """Upload scans a device made while offline."""
+        from events.models import Event
+        
+        event_id = request.data.get('event')
+        device_id = request.data.get('device_id')
+        scans = request.data.get('scans')
+        
+        if not event_id or not device_id or not isinstance(scans, list):
+            return Response(
+                {'error': 'event, device_id and a list of scans are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not all(isinstance(scan, dict) for scan in scans):
+            return Response(
+                {'error': 'Each scan needs a token and scanned_at'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        event = get_object_or_404(Event, id=event_id, organizer=request.user)
+        results = upload_scans(
+            event,
+            str(device_id)[:100],
+            scans,
+            user=request.user,
+            ip_address=get_client_ip(request)
+        )
+        
+        return Response({
+            'event': event.id,
+            'admitted': sum(1 for result in results if result['status'] == 'admitted'),
+            'results': results,
+        }, status=status.HTTP_200_OK)
@@ -191,6 +191,8 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-queue-token',
+    'idempotency-key',
 ]
 
 # CSRF Settings - FIXED: Added production URL
@@ -209,6 +211,30 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@eventinvite.com')
 
+# Bulk mail: recipients per SMTP connection, and messages per second allowed
+# per provider (EMAIL_RATE_LIMITS="smtp.gmail.com=10,smtp.sendgrid.net=100")
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', '50'))
+EMAIL_DEFAULT_RATE_LIMIT = int(os.environ.get('EMAIL_DEFAULT_RATE_LIMIT', '10'))
+EMAIL_RATE_LIMITS = {
+    host.strip(): int(rate)
+    for host, rate in (
+        entry.split('=') for entry in os.environ.get('EMAIL_RATE_LIMITS', '').split(',') if entry
+    )
+}
+# Deliveries still 'sending' after this are taken to be interrupted
+EMAIL_SENDING_TIMEOUT_MINUTES = int(os.environ.get('EMAIL_SENDING_TIMEOUT_MINUTES', '30'))
+
+# Email bodies pre-rendered per event: seconds kept in the shared cache, and
+# templates kept in memory per process
+EMAIL_RENDER_CACHE_TIMEOUT = int(os.environ.get('EMAIL_RENDER_CACHE_TIMEOUT', '86400'))
+EMAIL_RENDER_CACHE_SIZE = int(os.environ.get('EMAIL_RENDER_CACHE_SIZE', '256'))
+
+# Transactional outbox: messages per relay batch, publish attempts before a
+# message is given up, and days relayed messages (and their dedupe keys) are kept
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', '7'))
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get(
     'CELERY_BROKER_URL'
@@ -221,11 +247,96 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'sweep-inventory-holds': {
+        'task': 'ticket.tasks.sweep_inventory_holds',
+        'schedule': 60.0,
+    },
+    'reconcile-inventory': {
+        'task': 'ticket.tasks.reconcile_inventory',
+        'schedule': 300.0,
+    },
+    'purge-idempotency-keys': {
+        'task': 'ticket.tasks.purge_idempotency_keys',
+        'schedule': 3600.0,
+    },
+    'retry-payment-webhooks': {
+        'task': 'ticket.tasks.retry_payment_webhooks',
+        'schedule': 300.0,
+    },
+    'reconcile-pending-orders': {
+        'task': 'ticket.tasks.reconcile_pending_orders',
+        'schedule': 600.0,
+    },
+    'relay-outbox': {
+        'task': 'notifications.tasks.relay_outbox',
+        'schedule': 10.0,
+    },
+    'purge-outbox': {
+        'task': 'notifications.tasks.purge_outbox',
+        'schedule': 3600.0,
+    },
+    'sweep-stale-deliveries': {
+        'task': 'notifications.tasks.sweep_stale_deliveries',
+        'schedule': 600.0,
+    },
+}
+
+# Redis for inventory counters and the shared cache (when unset the cache is
+# per process and the inventory counters are disabled)
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# How long checkout seat holds last before the sweeper releases them
+INVENTORY_HOLD_SECONDS = int(os.environ.get('INVENTORY_HOLD_SECONDS', '600'))
+
+# How long responses are kept for replaying Idempotency-Key retries
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+# How long an unfinished request holds its key before a retry may take it over
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+# Received payment webhooks still unprocessed after this are queued again
+PAYMENT_WEBHOOK_RETRY_MINUTES = int(os.environ.get('PAYMENT_WEBHOOK_RETRY_MINUTES', '10'))
+
+# Pending orders older than this are verified with Paystack and cancelled if unpaid
+PENDING_ORDER_TIMEOUT_MINUTES = int(os.environ.get('PENDING_ORDER_TIMEOUT_MINUTES', '60'))
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.environ.get('PAYMENT_RECONCILE_BATCH_SIZE', '200'))
+PAYMENT_RECONCILE_CONCURRENCY = int(os.environ.get('PAYMENT_RECONCILE_CONCURRENCY', '8'))
 
 # QR Code Settings
 QR_CODE_EXPIRY_HOURS = int(os.environ.get('QR_CODE_EXPIRY_HOURS', '48'))
 QR_CODE_SECRET_KEY = os.environ.get('QR_CODE_SECRET_KEY', SECRET_KEY)
 QR_CODE_DIR = MEDIA_ROOT / 'qr_codes'
+# Format of newly issued QR tokens: 'compact' (short base32 credential) or
+# 'jwt'; both are accepted when scanned
+QR_CODE_TOKEN_FORMAT = os.environ.get('QR_CODE_TOKEN_FORMAT', 'compact')
+
+# How long a gate's admission index (QR token digests) stays in the cache
+GATE_INDEX_TIMEOUT_HOURS = int(os.environ.get('GATE_INDEX_TIMEOUT_HOURS', '24'))
+
+# Rendered QR PNGs: entries kept in memory per process, and storage folder
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', '2048'))
+QR_CACHE_LOCATION = os.environ.get('QR_CACHE_LOCATION', 'qr_cache')
+
+# Bulk ticket PDF rendering: processes per batch (0 = one per core) and
+# orders per reminder task
+TICKET_PDF_WORKERS = int(os.environ.get('TICKET_PDF_WORKERS', '0'))
+TICKET_REMINDER_BATCH_SIZE = int(os.environ.get('TICKET_REMINDER_BATCH_SIZE', '100'))
+
+# How ticket PDFs draw QR codes: 'vector' (rectangles) or 'image' (embedded PNG)
+TICKET_PDF_QR_MODE = os.environ.get('TICKET_PDF_QR_MODE', 'vector')
+
+# Order/ticket number allocation (dotted path to a NumberAllocator subclass)
+TICKET_NUMBER_ALLOCATOR = os.environ.get(
+    'TICKET_NUMBER_ALLOCATOR', 'ticket.numbering.SequenceBlockAllocator'
+)
 
 # Frontend URL (for email links)
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:5173')
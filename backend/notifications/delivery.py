@@ -0,0 +1,298 @@
+import base64
+import logging
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import EmailDelivery
+from .outbox import enqueue
+from .rendering import EmailTemplate
+
+
+logger = logging.getLogger(__name__)
+
+INVITATION_EMAIL = EmailTemplate(
+    'notifications/invitation_email.html',
+    fields=('guest.first_name', 'qr_image_base64', 'validation_url'),
+)
+
+REMINDER_EMAIL = EmailTemplate(
+    'notifications/reminder_email.html',
+    fields=('guest.first_name', 'validation_url'),
+)
+
+
+def current_provider():
+    """Name of the mail provider outgoing mail goes through"""
+    return settings.EMAIL_HOST or 'default'
+
+
+class ProviderRateLimiter:
+    """
+    Shared per-provider send rate, counted in the cache so that every
+    Celery worker sending through the same provider draws from one budget
+    of EMAIL_RATE_LIMITS[provider] messages per second.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.rate = settings.EMAIL_RATE_LIMITS.get(provider, settings.EMAIL_DEFAULT_RATE_LIMIT)
+
+    def acquire(self):
+        """Block until one more message may be sent this second"""
+        while True:
+            second = int(time.time())
+            key = f"mail_rate:{self.provider}:{second}"
+            cache.add(key, 0, timeout=2)
+            if cache.incr(key) <= self.rate:
+                return
+            time.sleep(max(0.0, second + 1 - time.time()))
+
+
+def get_invitation_qr(guest):
+    """
+    Return (qr_code, png bytes) for a guest's invitation, creating the
+    token and stored image the first time
+    """
+    from qr_codes.models import QRCode
+    from qr_codes.renderer import render_qr_png
+
+    qr_code, created = QRCode.objects.get_or_create(guest=guest)
+
+    if not qr_code.token:
+        qr_code.token = QRCode.generate_token(guest)
+
+    # Validation URL that is embedded in the QR code
+    validation_url = f"{settings.FRONTEND_URL}/validate-qr/{qr_code.token}"
+    png = render_qr_png(validation_url)
+
+    if created or not qr_code.qr_image:
+        from django.core.files.base import ContentFile
+
+        file_name = f'qr_{guest.id}_{guest.event.id}.png'
+        qr_code.qr_image.save(file_name, ContentFile(png), save=False)
+        qr_code.save()
+
+    return qr_code, png
+
+
+def build_invitation_email(guest, qr_code, png, connection=None):
+    """Invitation email with the QR code embedded and attached"""
+    html_message = INVITATION_EMAIL.render(guest.event, {
+        'guest.first_name': guest.first_name,
+        'qr_image_base64': base64.b64encode(png).decode(),
+        'validation_url': f"{settings.FRONTEND_URL}/validate-qr/{qr_code.token}",
+    })
+
+    email = EmailMultiAlternatives(
+        subject=f"You're invited to {guest.event.title}",
+        body=f"You're invited to {guest.event.title}. Please view this email in HTML format.",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[guest.email],
+        connection=connection
+    )
+    email.attach_alternative(html_message, "text/html")
+
+    # Attach QR code as file as well (for backup)
+    email.attach(
+        f'qr_code_{guest.first_name}_{guest.last_name}.png',
+        png,
+        'image/png'
+    )
+    return email
+
+
+def reminder_url(guest):
+    """Link to the guest's QR code, or the site when they have none yet"""
+    qr_code = getattr(guest, 'qr_code', None)
+    if qr_code is None:
+        return settings.FRONTEND_URL
+    return f"{settings.FRONTEND_URL}/validate-qr/{qr_code.token}"
+
+
+def build_reminder_email(guest, connection=None):
+    """Reminder email with a link to the guest's QR code"""
+    html_message = REMINDER_EMAIL.render(guest.event, {
+        'guest.first_name': guest.first_name,
+        'validation_url': reminder_url(guest),
+    })
+
+    event = guest.event
+    email = EmailMultiAlternatives(
+        subject=f"Reminder: {event.title}",
+        body=(
+            f"This is a reminder that {event.title} takes place on "
+            f"{event.event_date:%B %d, %Y} at {event.location}. Please view this email in HTML format."
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[guest.email],
+        connection=connection
+    )
+    email.attach_alternative(html_message, "text/html")
+    return email
+
+
+def _dispatch(delivery_ids):
+    """Queue the deliveries in EMAIL_BATCH_SIZE batches through the outbox"""
+    batch_size = settings.EMAIL_BATCH_SIZE
+    for start in range(0, len(delivery_ids), batch_size):
+        enqueue('notifications.tasks.send_email_batch', delivery_ids[start:start + batch_size])
+
+
+def queue_invitations(guests):
+    """
+    Record a queued delivery per guest and send them in batches once the
+    records are committed. Returns the number of emails queued.
+    """
+    provider = current_provider()
+    with transaction.atomic():
+        deliveries = EmailDelivery.objects.bulk_create([
+            EmailDelivery(guest=guest, kind='invitation', recipient=guest.email, provider=provider)
+            for guest in guests
+        ])
+        delivery_ids = [delivery.id for delivery in deliveries]
+        _dispatch(delivery_ids)
+    return len(delivery_ids)
+
+
+def queue_reminders(event):
+    """
+    Queue a reminder for every confirmed guest of an event who has not
+    been sent one yet. Failed reminders are queued again, sent ones never
+    are. Returns the number of reminders queued.
+    """
+    from guests.models import Guest
+
+    provider = current_provider()
+    batch_size = settings.EMAIL_BATCH_SIZE
+    guests = (
+        Guest.objects.filter(event=event, status='confirmed')
+        .exclude(Exists(EmailDelivery.objects.filter(
+            guest=OuterRef('pk'), kind='reminder', status='sent'
+        )))
+        .order_by('id')
+        .values_list('id', 'email')
+        .iterator(chunk_size=batch_size)
+    )
+
+    delivery_ids = []
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(guests, batch_size))
+            if not chunk:
+                break
+            guest_ids = [guest_id for guest_id, _ in chunk]
+
+            # The unique reminder constraint skips guests already queued
+            EmailDelivery.objects.bulk_create([
+                EmailDelivery(guest_id=guest_id, kind='reminder', recipient=email, provider=provider)
+                for guest_id, email in chunk
+            ], ignore_conflicts=True)
+            reminders = EmailDelivery.objects.filter(kind='reminder', guest_id__in=guest_ids)
+            reminders.filter(status='failed').update(status='queued', updated_at=timezone.now())
+            delivery_ids.extend(reminders.filter(status='queued').values_list('id', flat=True))
+
+        _dispatch(delivery_ids)
+    return len(delivery_ids)
+
+
+def _record(delivery, status, error='', sent_at=None):
+    EmailDelivery.objects.filter(id=delivery.id).update(
+        status=status, error=error, sent_at=sent_at, updated_at=timezone.now()
+    )
+    delivery.status = status
+
+
+def deliver_batch(delivery_ids):
+    """
+    Send one batch of queued deliveries over a single SMTP connection,
+    recording the outcome per recipient. Returns (sent, failed).
+
+    The rows are claimed ('sending') in a short transaction, so a batch
+    dispatched twice is only sent once, and each outcome is saved as soon
+    as it is known rather than in one transaction held open for the whole
+    batch.
+    """
+    from guests.models import Guest
+
+    with transaction.atomic():
+        deliveries = list(
+            EmailDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=delivery_ids, status='queued')
+            .select_related('guest__event__organizer', 'guest__qr_code')
+            .order_by('id')
+        )
+        if not deliveries:
+            return 0, 0
+        EmailDelivery.objects.filter(id__in=[delivery.id for delivery in deliveries]).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now()
+        )
+        for delivery in deliveries:
+            delivery.status = 'sending'
+
+    limiter = ProviderRateLimiter(deliveries[0].provider)
+    connection = get_connection()
+    try:
+        connection.open()
+        for delivery in deliveries:
+            guest = delivery.guest
+            try:
+                if delivery.kind == 'reminder':
+                    email = build_reminder_email(guest, connection=connection)
+                else:
+                    qr_code, png = get_invitation_qr(guest)
+                    email = build_invitation_email(guest, qr_code, png, connection=connection)
+
+                limiter.acquire()
+                if connection.send_messages([email]):
+                    now = timezone.now()
+                    _record(delivery, 'sent', sent_at=now)
+                    if delivery.kind == 'invitation':
+                        Guest.objects.filter(id=guest.id).update(
+                            invitation_sent=True,
+                            invitation_sent_at=now
+                        )
+                else:
+                    _record(delivery, 'failed', 'Not accepted by the mail server')
+            except Exception as e:
+                logger.warning("%s to %s failed: %s", delivery.kind, delivery.recipient, e)
+                _record(delivery, 'failed', str(e))
+                # The connection may be unusable after an SMTP error
+                connection.close()
+                connection.open()
+    except Exception as e:
+        # Could not (re)connect: nothing left in the batch was sent
+        logger.warning("Mail connection to %s failed: %s", limiter.provider, e)
+        unsent = [delivery for delivery in deliveries if delivery.status == 'sending']
+        EmailDelivery.objects.filter(id__in=[delivery.id for delivery in unsent]).update(
+            status='failed', error=f"Connection failed: {e}", updated_at=timezone.now()
+        )
+        for delivery in unsent:
+            delivery.status = 'failed'
+    finally:
+        connection.close()
+
+    sent = sum(1 for delivery in deliveries if delivery.status == 'sent')
+    return sent, len(deliveries) - sent
+
+
+def fail_stale_deliveries():
+    """
+    Mark deliveries stuck in 'sending' (their worker died mid-batch) as
+    failed, so reminders can be queued again. Returns the number marked.
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.EMAIL_SENDING_TIMEOUT_MINUTES)
+    return EmailDelivery.objects.filter(status='sending', updated_at__lt=cutoff).update(
+        status='failed',
+        error='Interrupted while sending',
+        updated_at=timezone.now()
+    )
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('guests', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('invitation', 'Invitation'), ('reminder', 'Reminder')], max_length=20)),
+                ('recipient', models.EmailField(max_length=254)),
+                ('provider', models.CharField(help_text='Mail provider the message goes through, used for rate limits', max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('guest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_deliveries', to='guests.guest')),
+            ],
+            options={
+                'verbose_name': 'email delivery',
+                'verbose_name_plural': 'email deliveries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='notificatio_status_4cbb98_idx'), models.Index(fields=['guest', 'kind'], name='notificatio_guest_i_d18b48_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guests', '0001_initial'),
+        ('notifications', '0001_emaildelivery'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='emaildelivery',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'reminder')), fields=('guest', 'kind'), name='unique_guest_reminder'),
+        ),
+    ]
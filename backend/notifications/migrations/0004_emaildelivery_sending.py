@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-17 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emaildelivery',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+    ]
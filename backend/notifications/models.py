@@ -1,3 +1,117 @@
 from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from guests.models import Guest
 
-# Create your models here.
+
+class EmailDelivery(models.Model):
+    """Delivery record for one email to one guest, sent as part of a batch."""
+    
+    KIND_CHOICES = [
+        ('invitation', 'Invitation'),
+        ('reminder', 'Reminder'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    guest = models.ForeignKey(
+        Guest,
+        on_delete=models.CASCADE,
+        related_name='email_deliveries'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    recipient = models.EmailField()
+    provider = models.CharField(
+        max_length=255,
+        help_text='Mail provider the message goes through, used for rate limits'
+    )
+    
+    # Delivery state
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('email delivery')
+        verbose_name_plural = _('email deliveries')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['guest', 'kind']),
+        ]
+        constraints = [
+            # Re-triggering event reminders must not email a guest twice
+            models.UniqueConstraint(
+                fields=['guest', 'kind'],
+                condition=models.Q(kind='reminder'),
+                name='unique_guest_reminder'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} ({self.status})"
+
+
+class OutboxMessage(models.Model):
+    """
+    A Celery task to run once the transaction that recorded it commits.
+    
+    Written in the same transaction as the order or guest change it belongs
+    to, so a rollback discards it and a commit guarantees it is sent; the
+    relay task publishes pending messages to Celery.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=255, help_text='Registered Celery task name')
+    args = models.JSONField(default=list)
+    dedupe_key = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True,
+        help_text='Messages with the same key are only enqueued once'
+    )
+    
+    # Relay state
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('outbox message')
+        verbose_name_plural = _('outbox messages')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.task}{tuple(self.args)} ({self.status})"
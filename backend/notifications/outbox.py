@@ -0,0 +1,103 @@
+import logging
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args, dedupe_key=None):
+    """
+    Record a Celery task to run after the current transaction commits.
+
+    Call it inside the transaction that makes the change the task is about:
+    the message is only relayed if that transaction commits. With a
+    ``dedupe_key`` a message that was already enqueued is not added again.
+    """
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(task=task, args=list(args), dedupe_key=dedupe_key)],
+        ignore_conflicts=dedupe_key is not None
+    )
+    # Relay straight away instead of waiting for the next scheduled run
+    transaction.on_commit(_kick_relay)
+
+
+def forget(dedupe_key):
+    """
+    Drop the message recorded under ``dedupe_key``, so the same work can be
+    enqueued again (e.g. after the task gave up without doing it)
+    """
+    OutboxMessage.objects.filter(dedupe_key=dedupe_key).delete()
+
+
+def _kick_relay():
+    from .tasks import relay_outbox
+
+    try:
+        relay_outbox.delay()
+    except Exception as e:
+        # The scheduled relay picks the message up instead
+        logger.warning("Could not trigger the outbox relay: %s", e)
+
+
+def relay(batch_size=None):
+    """
+    Publish pending messages to Celery in batches, returns (sent, failed).
+
+    Each batch is locked with SKIP LOCKED, so relays running side by side
+    take different messages. Delivery is at least once: a relay that dies
+    between publishing and committing publishes its batch again.
+    """
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    sent = failed = 0
+
+    while True:
+        batch_sent, batch_failed, handled = _relay_batch(batch_size)
+        sent += batch_sent
+        failed += batch_failed
+        if handled < batch_size:
+            return sent, failed
+
+
+def _relay_batch(batch_size):
+    now = timezone.now()
+    sent = failed = 0
+
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+
+        for message in messages:
+            message.attempts += 1
+            try:
+                current_app.tasks[message.task].apply_async(args=message.args)
+            except Exception as e:
+                logger.warning("Could not relay outbox message %s: %s", message.id, e)
+                message.error = str(e)
+                if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    message.status = 'failed'
+                    failed += 1
+                else:
+                    # Back off 2, 4, 8... seconds, capped at ten minutes
+                    message.available_at = now + timedelta(seconds=min(2 ** message.attempts, 600))
+                continue
+
+            message.status = 'sent'
+            message.sent_at = now
+            message.error = ''
+            sent += 1
+
+        OutboxMessage.objects.bulk_update(
+            messages, ['status', 'attempts', 'error', 'available_at', 'sent_at']
+        )
+
+    return sent, failed, len(messages)
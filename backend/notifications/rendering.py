@@ -0,0 +1,122 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import escape
+
+
+# Bump when templates change so cached renders are not reused
+RENDER_VERSION = 1
+
+FIELD_PATTERN = re.compile(r'\[\[!([\w.]+)!\]\]')
+
+# Organizer details the templates print next to the event's own fields
+ORGANIZER_FIELDS = ('first_name', 'last_name', 'email', 'phone_number')
+
+
+def _marker(field):
+    return f"[[!{field}!]]"
+
+
+class EmailTemplate:
+    """
+    An email template rendered once per event and then merged per recipient.
+
+    ``fields`` are the context entries that differ between recipients,
+    as dotted paths (``guest.first_name``). The template is rendered with
+    a marker in place of each of them and split on the markers; the result
+    is cached per event and event version, in-process and in the shared
+    cache. Sending to a recipient is then a join of the cached pieces with
+    their escaped values. ``raw_fields`` are inserted as given, for HTML
+    fragments the caller rendered itself.
+
+    Cached renders are keyed by the values the templates read (the event's
+    fields and its organizer's contact details), not by updated_at, so
+    edits made with ``QuerySet.update()`` are picked up too.
+
+    Per-recipient fields must only be printed by the template, not used in
+    tags such as ``{% if %}``: those are evaluated once, with the marker.
+    """
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, name, fields=(), raw_fields=()):
+        self.name = name
+        self.fields = tuple(fields)
+        self.raw_fields = frozenset(raw_fields)
+
+    def render(self, event, values):
+        """Render for one recipient, ``values`` maps each field to its value"""
+        parts = self.compile(event)
+        merged = []
+        for index, part in enumerate(parts):
+            if index % 2 == 0:
+                merged.append(part)
+            elif part in self.raw_fields:
+                merged.append(str(values[part]))
+            else:
+                merged.append(escape(values[part]))
+        return ''.join(merged)
+
+    def compile(self, event):
+        """
+        Literal text and field names for an event, alternating (even
+        indexes are text)
+        """
+        key = self.cache_key(event)
+        parts = self._local_get(key)
+        if parts is None:
+            parts = cache.get(key)
+            if parts is None:
+                parts = FIELD_PATTERN.split(render_to_string(self.name, self.context(event)))
+                cache.set(key, parts, settings.EMAIL_RENDER_CACHE_TIMEOUT)
+            self._local_put(key, parts)
+        return parts
+
+    def context(self, event):
+        """Template context for an event, with markers for the recipient fields"""
+        context = {
+            'event': event,
+            'frontend_url': settings.FRONTEND_URL,
+        }
+        for field in self.fields + tuple(self.raw_fields):
+            *path, name = field.split('.')
+            target = context
+            for step in path:
+                target = target.setdefault(step, {})
+            target[name] = _marker(field)
+        return context
+
+    def cache_key(self, event):
+        organizer = event.organizer
+        raw = json.dumps(
+            [
+                [field.value_from_object(event) for field in event._meta.concrete_fields],
+                [getattr(organizer, name) for name in ORGANIZER_FIELDS],
+            ],
+            default=str
+        )
+        version = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+        return f"email_render:{RENDER_VERSION}:{self.name}:{event.pk}:{version}"
+
+    @classmethod
+    def _local_get(cls, key):
+        with cls._lock:
+            parts = cls._local.get(key)
+            if parts is not None:
+                cls._local.move_to_end(key)
+            return parts
+
+    @classmethod
+    def _local_put(cls, key, parts):
+        with cls._lock:
+            cls._local[key] = parts
+            cls._local.move_to_end(key)
+            while len(cls._local) > settings.EMAIL_RENDER_CACHE_SIZE:
+                cls._local.popitem(last=False)
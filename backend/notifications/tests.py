@@ -1,3 +1,245 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from events.models import Event
+from guests.models import Guest
+from .delivery import deliver_batch, fail_stale_deliveries, queue_reminders
+from .models import EmailDelivery
+from .rendering import EmailTemplate
+
+
+class RefusingBackend(locmem.EmailBackend):
+    """locmem backend that refuses mail to addresses at refused.example.com"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(to.endswith('@refused.example.com') for to in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+class ReconnectFailingBackend(RefusingBackend):
+    """Refuses like RefusingBackend, and cannot connect a second time"""
+    opened = 0
+
+    def open(self):
+        ReconnectFailingBackend.opened += 1
+        if ReconnectFailingBackend.opened > 1:
+            raise ConnectionRefusedError('Connection refused')
+
+
+@override_settings(
+    EMAIL_BACKEND='notifications.tests.RefusingBackend',
+    EMAIL_DEFAULT_RATE_LIMIT=1000,
+)
+class DeliverBatchTests(TestCase):
+
+    def setUp(self):
+        organizer = User.objects.create_user(
+            email='organizer@example.com',
+            password='password',
+            user_type='organizer'
+        )
+        self.event = Event.objects.create(
+            organizer=organizer,
+            title='Launch Night',
+            event_date=timezone.now() + timedelta(days=7),
+            location='Lagos',
+        )
+
+    def guest(self, email, **kwargs):
+        return Guest.objects.create(
+            event=self.event, first_name='Ada', last_name='Lovelace', email=email, **kwargs
+        )
+
+    def deliveries(self, kind, *guests):
+        return [
+            EmailDelivery.objects.create(guest=guest, kind=kind, recipient=guest.email, provider='default')
+            for guest in guests
+        ]
+
+    def test_batch_is_sent_over_one_connection(self):
+        guests = [self.guest(f"guest{i}@example.com") for i in range(3)]
+        deliveries = self.deliveries('invitation', *guests)
+
+        with mock.patch('notifications.delivery.get_connection', wraps=get_connection) as connect:
+            sent, failed = deliver_batch([delivery.id for delivery in deliveries])
+
+        self.assertEqual((sent, failed), (3, 0))
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [guest.email for guest in guests]
+        )
+
+    def test_outcome_is_recorded_per_recipient(self):
+        accepted = self.guest('ada@example.com')
+        refused = self.guest('ada@refused.example.com')
+        deliveries = self.deliveries('invitation', accepted, refused)
+
+        sent, failed = deliver_batch([delivery.id for delivery in deliveries])
+
+        self.assertEqual((sent, failed), (1, 1))
+        delivered = EmailDelivery.objects.get(guest=accepted)
+        self.assertEqual((delivered.status, delivered.attempts, delivered.error), ('sent', 1, ''))
+        self.assertIsNotNone(delivered.sent_at)
+        bounced = EmailDelivery.objects.get(guest=refused)
+        self.assertEqual((bounced.status, bounced.attempts), ('failed', 1))
+        self.assertIn('No such user', bounced.error)
+        self.assertIsNone(bounced.sent_at)
+
+    def test_only_sent_invitations_mark_the_guest(self):
+        accepted = self.guest('ada@example.com')
+        refused = self.guest('ada@refused.example.com')
+        deliveries = self.deliveries('invitation', accepted, refused)
+
+        deliver_batch([delivery.id for delivery in deliveries])
+
+        accepted.refresh_from_db()
+        refused.refresh_from_db()
+        self.assertTrue(accepted.invitation_sent)
+        self.assertIsNotNone(accepted.invitation_sent_at)
+        self.assertFalse(refused.invitation_sent)
+
+    def test_reminders_do_not_mark_the_invitation(self):
+        guest = self.guest('ada@example.com', status='confirmed')
+        deliveries = self.deliveries('reminder', guest)
+
+        self.assertEqual(deliver_batch([deliveries[0].id]), (1, 0))
+        guest.refresh_from_db()
+        self.assertFalse(guest.invitation_sent)
+        self.assertIn(self.event.title, mail.outbox[0].subject)
+
+    def test_batch_dispatched_twice_is_sent_once(self):
+        deliveries = self.deliveries('invitation', self.guest('ada@example.com'))
+        delivery_ids = [delivery.id for delivery in deliveries]
+
+        deliver_batch(delivery_ids)
+        self.assertEqual(deliver_batch(delivery_ids), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reminders_are_queued_again_only_after_failing(self):
+        failed, sent, new = (
+            self.guest(f"guest{i}@example.com", status='confirmed') for i in range(3)
+        )
+        EmailDelivery.objects.create(
+            guest=failed, kind='reminder', recipient=failed.email, provider='default', status='failed'
+        )
+        EmailDelivery.objects.create(
+            guest=sent, kind='reminder', recipient=sent.email, provider='default', status='sent'
+        )
+
+        self.assertEqual(queue_reminders(self.event), 2)
+        self.assertEqual(
+            set(EmailDelivery.objects.filter(status='queued').values_list('guest_id', flat=True)),
+            {failed.id, new.id}
+        )
+
+    def test_reconnect_failure_marks_the_rest_of_the_batch(self):
+        accepted = self.guest('ada@example.com')
+        refused = self.guest('ada@refused.example.com')
+        unsent = self.guest('grace@example.com')
+        deliveries = self.deliveries('invitation', accepted, refused, unsent)
+        ReconnectFailingBackend.opened = 0
+
+        with self.settings(EMAIL_BACKEND='notifications.tests.ReconnectFailingBackend'):
+            sent, failed = deliver_batch([delivery.id for delivery in deliveries])
+
+        self.assertEqual((sent, failed), (1, 2))
+        statuses = dict(EmailDelivery.objects.values_list('guest_id', 'status'))
+        self.assertEqual(statuses, {accepted.id: 'sent', refused.id: 'failed', unsent.id: 'failed'})
+        self.assertIn('No such user', EmailDelivery.objects.get(guest=refused).error)
+        self.assertIn('Connection failed', EmailDelivery.objects.get(guest=unsent).error)
+        accepted.refresh_from_db()
+        self.assertTrue(accepted.invitation_sent)
+
+    def test_claimed_deliveries_are_not_sent_again(self):
+        deliveries = self.deliveries('invitation', self.guest('ada@example.com'))
+        EmailDelivery.objects.filter(id=deliveries[0].id).update(status='sending')
+
+        self.assertEqual(deliver_batch([deliveries[0].id]), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_interrupted_deliveries_are_failed_after_the_timeout(self):
+        stale, recent = self.deliveries(
+            'reminder', self.guest('ada@example.com'), self.guest('grace@example.com')
+        )
+        EmailDelivery.objects.filter(id=stale.id).update(
+            status='sending', updated_at=timezone.now() - timedelta(hours=1)
+        )
+        EmailDelivery.objects.filter(id=recent.id).update(status='sending')
+
+        self.assertEqual(fail_stale_deliveries(), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, recent.status), ('failed', 'sending'))
+
+
+def render_test_template(name, context):
+    return (
+        f"<h1>{context['event'].title}</h1><p>{context['event'].organizer.email}</p>"
+        f"<b>{context['guest']['first_name']}</b><table>{context['rows']}</table>"
+    )
+
+
+@mock.patch('notifications.rendering.render_to_string', side_effect=render_test_template)
+class EmailTemplateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        EmailTemplate._local.clear()
+        self.organizer = User.objects.create_user(
+            email='organizer@example.com',
+            password='password',
+            user_type='organizer'
+        )
+        Event.objects.create(
+            organizer=self.organizer,
+            title='Launch Night',
+            event_date=timezone.now() + timedelta(days=7),
+            location='Lagos',
+        )
+        self.template = EmailTemplate('test.html', fields=('guest.first_name',), raw_fields=('rows',))
+
+    def event(self):
+        return Event.objects.select_related('organizer').get()
+
+    def render(self, first_name='Ada', rows=''):
+        return self.template.render(self.event(), {'guest.first_name': first_name, 'rows': rows})
+
+    def test_template_is_split_on_the_field_markers(self, render_to_string):
+        self.assertEqual(self.template.compile(self.event()), [
+            '<h1>Launch Night</h1><p>organizer@example.com</p><b>', 'guest.first_name',
+            '</b><table>', 'rows', '</table>',
+        ])
+
+    def test_fields_are_escaped_and_raw_fields_are_not(self, render_to_string):
+        html = self.render(first_name='<Ada & Co>', rows='<tr><td>VIP</td></tr>')
+
+        self.assertIn('<b>&lt;Ada &amp; Co&gt;</b>', html)
+        self.assertIn('<table><tr><td>VIP</td></tr></table>', html)
+
+    def test_event_is_rendered_once_for_every_recipient(self, render_to_string):
+        self.render(first_name='Ada')
+        html = self.render(first_name='Grace')
+
+        self.assertIn('<b>Grace</b>', html)
+        self.assertEqual(render_to_string.call_count, 1)
+
+    def test_edits_made_without_save_are_picked_up(self, render_to_string):
+        self.render()
+        User.objects.filter(id=self.organizer.id).update(email='desk@example.com')
+        self.assertIn('desk@example.com', self.render())
+
+        Event.objects.update(title='Launch Night II')
+        self.assertIn('Launch Night II', self.render())
+        self.assertEqual(render_to_string.call_count, 3)
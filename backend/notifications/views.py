@@ -5,7 +5,8 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
-from .tasks import send_invitation_email, send_reminder_email
+from .delivery import queue_invitations
+from .outbox import enqueue
 from .serializers import (
     SendInviteSerializer,
     SendBulkInvitesSerializer,
@@ -45,7 +46,7 @@ def send_invite(request):
     )
     
     # Trigger async task
-    send_invitation_email(guest_id)
+    enqueue('notifications.tasks.send_invitation_email', guest_id)
     
     return Response({
         'message': f'Invitation will be sent to {guest.email}'
@@ -85,11 +86,11 @@ def send_bulk_invites(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    for guest in guests:
-        send_invitation_email(guest.id)
+    # Sent in batches by Celery, one SMTP connection per batch
+    queued = queue_invitations(guests.select_related('event'))
     
     return Response({
-        'message': f'Invitations will be sent to {guests.count()} guests'
+        'message': f'Invitations will be sent to {queued} guests'
     }, status=status.HTTP_200_OK)
 
 
@@ -122,7 +123,7 @@ def send_event_reminder(request):
     )
     
     # Trigger async task
-    send_reminder_email.delay(event_id)
+    enqueue('notifications.tasks.send_reminder_email', event_id)
     
     return Response({
         'message': f'Reminder will be sent to all confirmed guests'
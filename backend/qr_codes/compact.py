@@ -0,0 +1,108 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# Marks a compact credential and its format version. '1' is not a base32
+# character, so the prefix cannot be mistaken for the start of the body,
+# and JWTs always start with 'eyJ'
+PREFIX = 'Q1'
+
+# Bytes of the HMAC-SHA256 kept (80 bits)
+MAC_BYTES = 10
+
+
+class CredentialError(ValueError):
+    pass
+
+
+class ExpiredCredential(CredentialError):
+    pass
+
+
+def _pack_uint(value):
+    """Unsigned LEB128: 7 bits per byte, high bit set on all but the last"""
+    if value < 0:
+        raise ValueError('Credential ids must not be negative')
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _unpack_uint(data, offset):
+    value = shift = 0
+    while True:
+        if offset >= len(data) or shift > 63:
+            raise CredentialError('Invalid token')
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _mac(body):
+    key = settings.QR_CODE_SECRET_KEY.encode('utf-8')
+    return hmac.new(key, PREFIX.encode('ascii') + body, hashlib.sha256).digest()[:MAC_BYTES]
+
+
+def is_compact(token):
+    return token.startswith(PREFIX)
+
+
+def encode(guest_id, event_id, expires_at):
+    """
+    Compact credential for a guest: the prefix followed by unpadded base32
+    of the guest and event ids (variable length), the expiry (unix seconds,
+    4 bytes) and a truncated HMAC of all of it.
+
+    Base32 keeps the credential in the QR alphanumeric character set, so a
+    typical one (~30 characters against ~250 for the JWT) fits a small,
+    low-density symbol.
+    """
+    body = _pack_uint(guest_id) + _pack_uint(event_id) + struct.pack('>I', int(expires_at.timestamp()))
+    return PREFIX + base64.b32encode(body + _mac(body)).decode('ascii').rstrip('=')
+
+
+def decode(token, now=None):
+    """
+    Payload of a compact credential ({'guest_id', 'event_id', 'exp'}), like
+    a decoded JWT. Raises ExpiredCredential or CredentialError.
+    """
+    encoded = token[len(PREFIX):]
+    try:
+        raw = base64.b32decode(encoded + '=' * (-len(encoded) % 8))
+    except (binascii.Error, ValueError):
+        raise CredentialError('Invalid token')
+
+    # Unpadded base32 leaves spare bits in the last character, so several
+    # strings decode to the same bytes; only the one encode() makes is valid
+    if base64.b32encode(raw).decode('ascii').rstrip('=') != encoded:
+        raise CredentialError('Invalid token')
+
+    body, mac = raw[:-MAC_BYTES], raw[-MAC_BYTES:]
+    if len(body) < 6 or not hmac.compare_digest(mac, _mac(body)):
+        raise CredentialError('Invalid token')
+
+    guest_id, offset = _unpack_uint(body, 0)
+    event_id, offset = _unpack_uint(body, offset)
+    if len(body) - offset != 4:
+        raise CredentialError('Invalid token')
+    exp, = struct.unpack('>I', body[offset:])
+
+    if exp <= (now or timezone.now()).timestamp():
+        raise ExpiredCredential('Token has expired')
+
+    return {'guest_id': guest_id, 'event_id': event_id, 'exp': exp}
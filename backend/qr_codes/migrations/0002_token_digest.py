@@ -0,0 +1,43 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:48
+
+import hashlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_token_digests(apps, schema_editor):
+    QRCode = apps.get_model('qr_codes', 'QRCode')
+    batch = []
+    for qr_code in QRCode.objects.exclude(token='').only('id', 'token').iterator(chunk_size=BATCH_SIZE):
+        # Must match QRCode.digest
+        qr_code.token_digest = hashlib.sha256(qr_code.token.encode('utf-8')).hexdigest()
+        batch.append(qr_code)
+        if len(batch) >= BATCH_SIZE:
+            QRCode.objects.bulk_update(batch, ['token_digest'])
+            batch = []
+    if batch:
+        QRCode.objects.bulk_update(batch, ['token_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qr_codes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcode',
+            name='token_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_token_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='qrcode',
+            name='token',
+            field=models.CharField(max_length=500),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from guests.models import Guest
+import hashlib
 import jwt
 from datetime import datetime, timedelta
 
@@ -13,7 +14,16 @@ class QRCode(models.Model):
         on_delete=models.CASCADE,
         related_name='qr_code'
     )
-    token = models.CharField(max_length=500, unique=True)
+    token = models.CharField(max_length=500)
+    # sha256 of the token, what scans are looked up by (a 64-char key
+    # instead of a 500-char one); empty until the token is issued
+    token_digest = models.CharField(
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False
+    )
     qr_image = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     is_used = models.BooleanField(default=False)
     used_at = models.DateTimeField(blank=True, null=True)
@@ -26,19 +36,78 @@ class QRCode(models.Model):
         verbose_name_plural = 'QR Codes'
         ordering = ['-created_at']
     
+    # Token as last loaded or saved, to tell when a new one is issued
+    _saved_token = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Left unset while the token is deferred, so it isn't loaded for this
+        instance._saved_token = instance.__dict__.get('token')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'token' in fields:
+            self._saved_token = self.token
+    
     def __str__(self):
         return f"QR Code for {self.guest.full_name}"
     
+    def save(self, *args, **kwargs):
+        if 'token' in self.get_deferred_fields():
+            # Never loaded, so not changed either
+            return super().save(*args, **kwargs)
+        
+        issued = bool(self.token) and self.token != self._saved_token
+        self.token_digest = self.digest(self.token) if self.token else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'token' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'token_digest'}
+        super().save(*args, **kwargs)
+        self._saved_token = self.token
+        
+        if issued:
+            # Scanners pick new codes up on their next delta sync
+            from checkin.gate import scanner_digest
+            from checkin.models import ScannerChange
+            ScannerChange.record(self._event_id(), 'issued', [scanner_digest(self.token)])
+    
+    def _event_id(self):
+        """The guest's event, without loading the guest if it isn't already"""
+        if QRCode.guest.is_cached(self):
+            return self.guest.event_id
+        return Guest.objects.filter(id=self.guest_id).values_list('event_id', flat=True).get()
+    
+    @staticmethod
+    def digest(token):
+        """Lookup key for a token"""
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def lookup(cls, token):
+        """QRCode queryset for a scanned token, by digest"""
+        return cls.objects.filter(token_digest=cls.digest(token))
+    
     @staticmethod
     def generate_token(guest):
-        """Generate a secure JWT token for the guest."""
+        """
+        Generate a signed token for the guest, a compact credential unless
+        QR_CODE_TOKEN_FORMAT is 'jwt'.
+        """
         from django.utils import timezone
         
+        expires_at = timezone.now() + timedelta(hours=settings.QR_CODE_EXPIRY_HOURS)
+        
+        if settings.QR_CODE_TOKEN_FORMAT == 'compact':
+            from . import compact
+            return compact.encode(guest.id, guest.event_id, expires_at)
+        
         payload = {
             'guest_id': guest.id,
             'event_id': guest.event.id,
             'email': guest.email,
-            'exp': timezone.now() + timedelta(hours=settings.QR_CODE_EXPIRY_HOURS),
+            'exp': expires_at,
             'iat': timezone.now()
         }
         
@@ -52,7 +121,15 @@ class QRCode(models.Model):
     
     @staticmethod
     def verify_token(token):
-        """Verify and decode a QR code token."""
+        """Verify and decode a QR code token (compact credential or JWT)."""
+        from . import compact
+        
+        if compact.is_compact(token):
+            try:
+                return compact.decode(token)
+            except compact.CredentialError as e:
+                return {'error': str(e)}
+        
         try:
             payload = jwt.decode(
                 token,
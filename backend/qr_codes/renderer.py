@@ -0,0 +1,127 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Bump when the rendering itself changes so old cached files are not reused
+RENDER_VERSION = 1
+
+
+class QRRenderer:
+    """
+    Content-addressed cache of QR code PNGs.
+    
+    A PNG is identified by a hash of its payload and rendering options, so
+    the same ticket or invitation is only ever encoded once: repeats are
+    served from an in-process LRU, then from storage (shared by every web
+    and Celery process), and only rendered on a miss in both.
+    """
+    
+    def __init__(self, max_entries=None, storage=None, location=None):
+        self.max_entries = max_entries or settings.QR_CACHE_SIZE
+        self.storage = storage or default_storage
+        self.location = location or settings.QR_CACHE_LOCATION
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def cache_key(data, error_correction='L', box_size=10, border=4):
+        raw = f"{RENDER_VERSION}|{error_correction}|{box_size}|{border}|{data}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def render_png(self, data, error_correction='L', box_size=10, border=4):
+        """Return the PNG bytes for a QR code holding ``data``"""
+        key = self.cache_key(data, error_correction, box_size, border)
+        
+        png = self._memory_get(key)
+        if png is not None:
+            return png
+        
+        path = f"{self.location}/{key[:2]}/{key}.png"
+        try:
+            with self.storage.open(path, 'rb') as f:
+                png = f.read()
+        except (FileNotFoundError, OSError):
+            png = self._render(data, error_correction, box_size, border)
+            if not self.storage.exists(path):
+                self.storage.save(path, ContentFile(png))
+        
+        self._memory_put(key, png)
+        return png
+    
+    def _render(self, data, error_correction, box_size, border):
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+        
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    def _memory_get(self, key):
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+            return png
+    
+    def _memory_put(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_qr_renderer():
+    """Return the process-wide QRRenderer"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = QRRenderer()
+        return _renderer
+
+
+def render_qr_png(data, error_correction='L', box_size=10, border=4):
+    """PNG bytes for a QR code, rendered at most once per payload and options"""
+    return get_qr_renderer().render_png(data, error_correction, box_size, border)
+
+
+@lru_cache(maxsize=4096)
+def qr_matrix(data, error_correction='L'):
+    """
+    Module matrix of a QR code (rows of booleans, True = dark) without the
+    quiet zone, for drawing it as vectors instead of a raster image
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        border=0,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
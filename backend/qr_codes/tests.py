@@ -1,3 +1,115 @@
-from django.test import TestCase
+import base64
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from checkin.models import ScannerChange
+from events.models import Event
+from guests.models import Guest
+from . import compact
+from .models import QRCode
+
+
+class CompactCredentialTests(SimpleTestCase):
+
+    def setUp(self):
+        self.expires_at = timezone.now() + timedelta(hours=1)
+        self.token = compact.encode(42, 7, self.expires_at)
+
+    def test_round_trip(self):
+        payload = compact.decode(self.token)
+
+        self.assertEqual(payload, {
+            'guest_id': 42, 'event_id': 7, 'exp': int(self.expires_at.timestamp())
+        })
+
+    def test_expired_credential(self):
+        with self.assertRaises(compact.ExpiredCredential):
+            compact.decode(self.token, now=self.expires_at + timedelta(seconds=1))
+
+    def test_tampered_credential(self):
+        body = self.token[len(compact.PREFIX):]
+        tampered = compact.PREFIX + ('A' if body[0] != 'A' else 'B') + body[1:]
+
+        with self.assertRaises(compact.CredentialError):
+            compact.decode(tampered)
+
+    def test_only_the_canonical_encoding_is_accepted(self):
+        body = self.token[len(compact.PREFIX):]
+        alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+        raw = base64.b32decode(body + '=' * (-len(body) % 8))
+        # Same bytes, different spare bits in the last character
+        variants = [
+            compact.PREFIX + body[:-1] + char for char in alphabet
+            if char != body[-1]
+            and base64.b32decode(body[:-1] + char + '=' * (-len(body) % 8)) == raw
+        ]
+        self.assertTrue(variants)
+
+        for variant in variants:
+            with self.assertRaises(compact.CredentialError):
+                compact.decode(variant)
+
+
+class QRCodeTests(TestCase):
+
+    def setUp(self):
+        organizer = User.objects.create_user(
+            email='organizer@example.com',
+            password='password',
+            user_type='organizer'
+        )
+        self.event = Event.objects.create(
+            organizer=organizer,
+            title='Launch Night',
+            event_date=timezone.now() + timedelta(days=7),
+            location='Lagos',
+        )
+        self.guests = [
+            Guest.objects.create(
+                event=self.event, first_name='Ada', last_name='Lovelace', email=f"ada{i}@example.com"
+            )
+            for i in range(3)
+        ]
+
+    def issue(self, guest):
+        return compact.encode(guest.id, self.event.id, timezone.now() + timedelta(hours=1))
+
+    def issued(self):
+        return ScannerChange.objects.filter(event=self.event, kind='issued').count()
+
+    def test_deferred_tokens_are_not_loaded(self):
+        for guest in self.guests:
+            QRCode.objects.create(guest=guest, token=self.issue(guest))
+
+        with self.assertNumQueries(1):
+            qr_codes = list(QRCode.objects.only('id', 'is_used'))
+        qr_codes[0].is_used = True
+        with self.assertNumQueries(1):
+            qr_codes[0].save(update_fields=['is_used'])
+
+    def test_new_tokens_are_recorded_for_scanners(self):
+        guest = self.guests[0]
+        QRCode.objects.create(guest=guest)
+        qr_code = QRCode.objects.get(guest=guest)
+
+        qr_code.token = self.issue(guest)
+        qr_code.save()
+        self.assertEqual(self.issued(), 1)
+        self.assertEqual(qr_code.token_digest, QRCode.digest(qr_code.token))
+
+        qr_code.is_used = True
+        qr_code.save()
+        self.assertEqual(self.issued(), 1)
+
+    def test_lazily_loaded_token_is_not_issued_again(self):
+        guest = self.guests[0]
+        QRCode.objects.create(guest=guest, token=self.issue(guest))
+        qr_code = QRCode.objects.only('id', 'guest_id').get(guest=guest)
+
+        self.assertTrue(qr_code.token)
+        qr_code.save()
+
+        self.assertEqual(self.issued(), 1)
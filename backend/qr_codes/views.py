@@ -4,11 +4,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 
 from .models import QRCode
+from .renderer import render_qr_png
 from .serializers import QRCodeSerializer
 from guests.models import Guest
 
@@ -55,23 +54,12 @@ class QRCodeViewSet(viewsets.ModelViewSet):
         if created or not qr_code.token:
             qr_code.token = QRCode.generate_token(guest)
         
-        # Generate QR code image
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_code.token)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
+        # Generate QR code image (cached by content)
+        png = render_qr_png(qr_code.token)
         
         # Save image to model
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
         file_name = f'qr_{guest.id}_{guest.event.id}.png'
-        qr_code.qr_image.save(file_name, File(buffer), save=False)
+        qr_code.qr_image.save(file_name, ContentFile(png), save=False)
         qr_code.save()
         
         serializer = self.get_serializer(qr_code)
@@ -99,7 +87,7 @@ class QRCodeViewSet(viewsets.ModelViewSet):
         
         # Get QR code
         try:
-            qr_code = QRCode.objects.get(token=token)
+            qr_code = QRCode.lookup(token).get()
         except QRCode.DoesNotExist:
             return Response(
                 {'error': 'Invalid QR code'},
@@ -0,0 +1,136 @@
+# tickets/idempotency.py
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    """Hash of everything that makes two requests 'the same request'"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method}\n{request.get_full_path()}\n{body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR') or ''
+
+
+def _scope(name, request):
+    user = request.user
+    if user and user.is_authenticated:
+        caller = f"user:{user.pk}"
+    else:
+        # Anonymous buyers are told apart by address so their keys cannot collide
+        caller = f"anon:{_client_ip(request)}"
+    return f"{name}:{caller}"
+
+
+def claim_key(key, scope, fingerprint):
+    """
+    Reserve ``key`` for this request. Returns (record, created); when
+    created is False the record belongs to an earlier request.
+
+    A request that never finished (its worker died) holds the key for
+    IDEMPOTENCY_LEASE_SECONDS; after that a retry of the same request
+    takes the key over instead of getting 409 until the key expires.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(key=key, scope=scope, expires_at__lt=now).delete()
+    record, created = IdempotencyKey.objects.get_or_create(
+        key=key,
+        scope=scope,
+        defaults={
+            'fingerprint': fingerprint,
+            'expires_at': now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+        }
+    )
+
+    if not created and record.status_code is None:
+        lease_start = now - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS)
+        taken_over = IdempotencyKey.objects.filter(
+            id=record.id,
+            fingerprint=fingerprint,
+            status_code__isnull=True,
+            created_at__lt=lease_start
+        ).update(created_at=now)
+        if taken_over:
+            record.created_at = now
+            created = True
+
+    return record, created
+
+
+def idempotent(name):
+    """
+    Make a viewset action safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs normally and its response is stored.
+    Retries with the same key and the same request get the stored response
+    back without running the view, so a retried checkout does not create a
+    second order or take more inventory. Requests without the header are
+    not affected.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+
+            if len(key) > 255:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fingerprint = request_fingerprint(request)
+            record, created = claim_key(key, _scope(name, request), fingerprint)
+
+            if not created:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record.status_code is None:
+                    return Response(
+                        {'error': 'A request with this Idempotency-Key is still in progress'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                return Response(
+                    record.response_body,
+                    status=record.status_code,
+                    headers={'Idempotent-Replayed': 'true'}
+                )
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                # Nothing was committed, let the client retry for real
+                record.delete()
+                raise
+
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                record.status_code = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['status_code', 'response_body'])
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,415 @@
+# tickets/inventory.py
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a hold cannot be granted for a ticket type"""
+
+    def __init__(self, ticket_type_id):
+        self.ticket_type_id = ticket_type_id
+        super().__init__(f"Not enough tickets available for ticket type {ticket_type_id}")
+
+
+# Keys, all declared through KEYS so the scripts also run on Redis Cluster.
+# The {inventory} hash tag puts every key in one slot, since a hold spans
+# several ticket types:
+#   {inventory}:stock:<ticket_type_id>  seats still on sale (not sold, not held)
+#   {inventory}:held:<ticket_type_id>   seats currently held by open checkouts
+#   {inventory}:hold:<hold_id>          hash of ticket_type_id -> quantity
+#   {inventory}:holds                   sorted set of hold ids by expiry time
+# Per ticket type, KEYS holds the stock key followed by the held key.
+
+PRIME_SCRIPT = """
+local only_missing = ARGV[1] == '1'
+for n = 1, #KEYS / 2 do
+    local held = tonumber(redis.call('GET', KEYS[2 * n]) or '0')
+    local remaining = tonumber(ARGV[n + 1]) - held
+    if only_missing then
+        redis.call('SET', KEYS[2 * n - 1], remaining, 'NX')
+    else
+        redis.call('SET', KEYS[2 * n - 1], remaining)
+    end
+end
+return 1
+"""
+
+# KEYS: holds, hold, then stock/held pairs. ARGV: hold id, expiry, then
+# ticket type id/quantity pairs
+HOLD_SCRIPT = """
+local missing = {}
+for n = 1, (#KEYS - 2) / 2 do
+    local stock = redis.call('GET', KEYS[2 * n + 1])
+    if not stock then
+        table.insert(missing, ARGV[2 * n + 1])
+    elseif tonumber(stock) < tonumber(ARGV[2 * n + 2]) then
+        return {'short', ARGV[2 * n + 1]}
+    end
+end
+if #missing > 0 then
+    return {'missing', unpack(missing)}
+end
+for n = 1, (#KEYS - 2) / 2 do
+    redis.call('DECRBY', KEYS[2 * n + 1], ARGV[2 * n + 2])
+    redis.call('INCRBY', KEYS[2 * n + 2], ARGV[2 * n + 2])
+    redis.call('HSET', KEYS[2], ARGV[2 * n + 1], ARGV[2 * n + 2])
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return {'ok'}
+"""
+
+# KEYS: holds, hold, then stock/held pairs. ARGV: hold id, then quantities
+CONFIRM_SCRIPT = """
+local exists = redis.call('EXISTS', KEYS[2])
+for n = 1, (#KEYS - 2) / 2 do
+    if exists == 1 then
+        redis.call('DECRBY', KEYS[2 * n + 2], ARGV[n + 1])
+    elseif redis.call('EXISTS', KEYS[2 * n + 1]) == 1 then
+        -- The hold expired and was swept back into stock: take it out again
+        redis.call('DECRBY', KEYS[2 * n + 1], ARGV[n + 1])
+    end
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return exists
+"""
+
+# Same KEYS and ARGV as CONFIRM_SCRIPT, for the items read from the hold.
+# A hold is never changed once written, so reading it first is safe; the
+# EXISTS check makes sure only one release gives the seats back.
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    return 0
+end
+for n = 1, (#KEYS - 2) / 2 do
+    if redis.call('EXISTS', KEYS[2 * n + 1]) == 1 then
+        redis.call('INCRBY', KEYS[2 * n + 1], ARGV[n + 1])
+    end
+    redis.call('DECRBY', KEYS[2 * n + 2], ARGV[n + 1])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: stock keys. ARGV: quantities
+RESTOCK_SCRIPT = """
+for n = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[n]) == 1 then
+        redis.call('INCRBY', KEYS[n], ARGV[n])
+    end
+end
+return 1
+"""
+
+
+class RedisInventoryBackend:
+    """Inventory counters kept in Redis and updated by Lua scripts"""
+
+    KEY_PREFIX = '{inventory}:'
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self._prime = self.client.register_script(PRIME_SCRIPT)
+        self._hold = self.client.register_script(HOLD_SCRIPT)
+        self._confirm = self.client.register_script(CONFIRM_SCRIPT)
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+        self._restock = self.client.register_script(RESTOCK_SCRIPT)
+
+    def _key(self, *parts):
+        return self.KEY_PREFIX + ':'.join(str(part) for part in parts)
+
+    def _counter_keys(self, ticket_type_ids):
+        keys = []
+        for ticket_type_id in ticket_type_ids:
+            keys.extend([self._key('stock', ticket_type_id), self._key('held', ticket_type_id)])
+        return keys
+
+    def prime(self, remaining, only_missing=True):
+        self._prime(
+            keys=self._counter_keys(remaining),
+            args=['1' if only_missing else '0'] + [int(quantity) for quantity in remaining.values()]
+        )
+
+    def hold(self, hold_id, quantities, expires_at):
+        args = [hold_id, expires_at]
+        for ticket_type_id, quantity in quantities.items():
+            args.extend([str(ticket_type_id), int(quantity)])
+        result = self._hold(
+            keys=[self._key('holds'), self._key('hold', hold_id)] + self._counter_keys(quantities),
+            args=args
+        )
+        return result[0], [int(value) for value in result[1:]]
+
+    def confirm(self, hold_id, quantities):
+        self._confirm(
+            keys=[self._key('holds'), self._key('hold', hold_id)] + self._counter_keys(quantities),
+            args=[hold_id] + [int(quantity) for quantity in quantities.values()]
+        )
+
+    def release(self, hold_ids):
+        if not hold_ids:
+            return 0
+
+        pipe = self.client.pipeline(transaction=False)
+        for hold_id in hold_ids:
+            pipe.hgetall(self._key('hold', hold_id))
+        holds = pipe.execute()
+
+        pipe = self.client.pipeline(transaction=False)
+        for hold_id, items in zip(hold_ids, holds):
+            self._release(
+                keys=[self._key('holds'), self._key('hold', hold_id)] + self._counter_keys(items),
+                args=[hold_id] + [int(quantity) for quantity in items.values()],
+                client=pipe
+            )
+        return sum(pipe.execute())
+
+    def expired_holds(self, now, limit):
+        return self.client.zrangebyscore(
+            self._key('holds'), '-inf', now, start=0, num=limit
+        )
+
+    def restock(self, quantities):
+        self._restock(
+            keys=[self._key('stock', ticket_type_id) for ticket_type_id in quantities],
+            args=[int(quantity) for quantity in quantities.values()]
+        )
+
+
+class LocalInventoryBackend:
+    """
+    In-process stand-in for RedisInventoryBackend.
+
+    Same semantics, guarded by a lock instead of Lua. The counters are not
+    shared between processes (the sweeper and reconciler run in Celery),
+    so this is only for tests; get_inventory() never falls back to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stock = {}
+        self.held = {}
+        self.holds = {}
+
+    def prime(self, remaining, only_missing=True):
+        with self._lock:
+            for ticket_type_id, quantity in remaining.items():
+                if only_missing and ticket_type_id in self.stock:
+                    continue
+                self.stock[ticket_type_id] = quantity - self.held.get(ticket_type_id, 0)
+
+    def hold(self, hold_id, quantities, expires_at):
+        with self._lock:
+            missing = []
+            for ticket_type_id, quantity in quantities.items():
+                if ticket_type_id not in self.stock:
+                    missing.append(ticket_type_id)
+                elif self.stock[ticket_type_id] < quantity:
+                    return 'short', [ticket_type_id]
+            if missing:
+                return 'missing', missing
+
+            for ticket_type_id, quantity in quantities.items():
+                self.stock[ticket_type_id] -= quantity
+                self.held[ticket_type_id] = self.held.get(ticket_type_id, 0) + quantity
+            self.holds[hold_id] = (expires_at, dict(quantities))
+            return 'ok', []
+
+    def confirm(self, hold_id, quantities):
+        with self._lock:
+            exists = self.holds.pop(hold_id, None) is not None
+            for ticket_type_id, quantity in quantities.items():
+                if exists:
+                    self.held[ticket_type_id] -= quantity
+                elif ticket_type_id in self.stock:
+                    self.stock[ticket_type_id] -= quantity
+
+    def release(self, hold_ids):
+        released = 0
+        with self._lock:
+            for hold_id in hold_ids:
+                hold = self.holds.pop(hold_id, None)
+                if hold is None:
+                    continue
+                for ticket_type_id, quantity in hold[1].items():
+                    if ticket_type_id in self.stock:
+                        self.stock[ticket_type_id] += quantity
+                    self.held[ticket_type_id] -= quantity
+                released += 1
+        return released
+
+    def expired_holds(self, now, limit):
+        with self._lock:
+            expired = sorted(
+                (expires_at, hold_id)
+                for hold_id, (expires_at, _) in self.holds.items()
+                if expires_at <= now
+            )
+        return [hold_id for _, hold_id in expired[:limit]]
+
+    def restock(self, quantities):
+        with self._lock:
+            for ticket_type_id, quantity in quantities.items():
+                if ticket_type_id in self.stock:
+                    self.stock[ticket_type_id] += quantity
+
+
+class InventoryService:
+    """
+    Seat holds layered over TicketType.
+
+    Remaining stock lives in atomic counters, so checkouts for a sold-out
+    tier are turned away without touching the database, and the
+    TicketType row lock is only taken by buyers who already hold seats.
+    The database stays the source of truth: holds expire after
+    INVENTORY_HOLD_SECONDS and are swept back into stock, and the counters
+    are periodically reset from quantity_available - quantity_sold.
+
+    If the counter store is unreachable the service fails open and the
+    conditional UPDATE in OrderPlacementEngine remains the only guard.
+    Without a backend (no shared Redis configured) the counters are off
+    altogether: per-process counters would never see the seats the
+    sweeper, reconciler or cancellations give back.
+    """
+
+    SWEEP_BATCH_SIZE = 500
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hold(self, quantities, ttl=None):
+        """
+        Hold seats for an order. ``quantities`` maps ticket type id to
+        quantity. Returns a hold id, or None if the counters are unavailable.
+        """
+        if self.backend is None:
+            return None
+
+        ttl = ttl or settings.INVENTORY_HOLD_SECONDS
+        hold_id = uuid.uuid4().hex
+        expires_at = int(time.time()) + ttl
+
+        try:
+            result, ticket_type_ids = self.backend.hold(hold_id, quantities, expires_at)
+            if result == 'missing':
+                self._prime(ticket_type_ids)
+                result, ticket_type_ids = self.backend.hold(hold_id, quantities, expires_at)
+        except Exception as e:
+            logger.warning("Inventory hold skipped, counters unavailable: %s", e)
+            return None
+
+        if result != 'ok':
+            raise InsufficientStock(ticket_type_ids[0])
+        return hold_id
+
+    def confirm(self, hold_id, quantities):
+        """Turn a hold into a sale once the order has been committed"""
+        if hold_id is None:
+            return
+        try:
+            self.backend.confirm(hold_id, quantities)
+        except Exception as e:
+            logger.warning("Could not confirm inventory hold %s: %s", hold_id, e)
+
+    def release(self, hold_id):
+        """Give held seats back, e.g. when the checkout failed"""
+        if hold_id is None:
+            return
+        try:
+            self.backend.release([hold_id])
+        except Exception as e:
+            logger.warning("Could not release inventory hold %s: %s", hold_id, e)
+
+    def restock(self, quantities):
+        """Return seats of a cancelled order to the counters"""
+        if self.backend is None:
+            return
+        try:
+            self.backend.restock(quantities)
+        except Exception as e:
+            logger.warning("Could not restock inventory counters: %s", e)
+
+    def sweep_expired(self):
+        """Release every hold past its expiry. Returns the number released."""
+        if self.backend is None:
+            return 0
+        released = 0
+        now = int(time.time())
+        while True:
+            hold_ids = self.backend.expired_holds(now, self.SWEEP_BATCH_SIZE)
+            if not hold_ids:
+                return released
+            released += self.backend.release(hold_ids)
+            if len(hold_ids) < self.SWEEP_BATCH_SIZE:
+                return released
+
+    def reconcile(self, ticket_types=None):
+        """
+        Reset the counters from the database (quantity_available -
+        quantity_sold - currently held). Returns the number of tiers synced.
+        """
+        from .models import TicketType
+
+        if self.backend is None:
+            return 0
+        if ticket_types is None:
+            ticket_types = TicketType.objects.filter(is_active=True)
+
+        remaining = {
+            ticket_type_id: quantity_available - quantity_sold
+            for ticket_type_id, quantity_available, quantity_sold in ticket_types.values_list(
+                'id', 'quantity_available', 'quantity_sold'
+            )
+        }
+        if remaining:
+            self.backend.prime(remaining, only_missing=False)
+        return len(remaining)
+
+    def refresh(self, ticket_type_ids):
+        """Reset the counters of some tiers, e.g. after their capacity changed"""
+        from .models import TicketType
+
+        try:
+            self.reconcile(TicketType.objects.filter(id__in=ticket_type_ids))
+        except Exception as e:
+            logger.warning("Could not refresh inventory counters: %s", e)
+
+    def _prime(self, ticket_type_ids):
+        from .models import TicketType
+
+        remaining = dict.fromkeys(ticket_type_ids, 0)  # unknown types have no stock
+        for ticket_type_id, quantity_available, quantity_sold in TicketType.objects.filter(
+            id__in=ticket_type_ids
+        ).values_list('id', 'quantity_available', 'quantity_sold'):
+            remaining[ticket_type_id] = quantity_available - quantity_sold
+        self.backend.prime(remaining, only_missing=True)
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_inventory():
+    """
+    Return the process-wide InventoryService. The counters need a Redis
+    every process shares, so without REDIS_URL they are disabled.
+    """
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            backend = RedisInventoryBackend(settings.REDIS_URL) if settings.REDIS_URL else None
+            _inventory = InventoryService(backend)
+        return _inventory
@@ -0,0 +1,114 @@
+# tickets/management/commands/benchmark_gateway.py
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from ticket.payment_handlers import AsyncPaystackClient, PaystackClient
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Answers every request like /transaction/verify after a fixed delay"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+    latency = 0.05
+    
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({
+            'status': True,
+            'data': {'status': 'success', 'amount': 100000, 'reference': self.path.rsplit('/', 1)[-1]},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync and async Paystack client throughput against a local "
+        "stub gateway. Sync callers are limited to --workers threads, as a "
+        "sync worker pool is; async callers to --concurrency in-flight calls "
+        "on one event loop."
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Sync threads, i.e. requests a sync deployment serves at once')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='In-flight calls for the async client')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Stub gateway response time in seconds')
+    
+    def handle(self, *args, **options):
+        # Per-call logging would dominate the numbers
+        for name in ('ticket.payment_handlers', 'httpx'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        
+        StubGatewayHandler.latency = options['latency']
+        server = StubGatewayServer(('127.0.0.1', 0), StubGatewayHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        
+        try:
+            sync_elapsed = self._run_sync(base_url, options['requests'], options['workers'])
+            async_elapsed = asyncio.run(
+                self._run_async(base_url, options['requests'], options['concurrency'])
+            )
+        finally:
+            server.shutdown()
+        
+        total = options['requests']
+        self.stdout.write(
+            f"Stub gateway latency {options['latency'] * 1000:.0f}ms, {total} verify calls"
+        )
+        self.stdout.write(
+            f"  sync  ({options['workers']} workers): "
+            f"{sync_elapsed:.2f}s, {total / sync_elapsed:.0f} req/s"
+        )
+        self.stdout.write(
+            f"  async ({options['concurrency']} in flight): "
+            f"{async_elapsed:.2f}s, {total / async_elapsed:.0f} req/s"
+        )
+    
+    def _run_sync(self, base_url, total, workers):
+        client = PaystackClient('sk_benchmark', base_url=base_url)
+        
+        def call(i):
+            client.get(f"/transaction/verify/BENCH-{i}", 'verify_payment').raise_for_status()
+        
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(call, range(total)))
+        return time.monotonic() - start
+    
+    async def _run_async(self, base_url, total, concurrency):
+        client = AsyncPaystackClient('sk_benchmark', base_url=base_url)
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def call(i):
+            async with semaphore:
+                response = await client.get(f"/transaction/verify/BENCH-{i}", 'verify_payment')
+                response.raise_for_status()
+        
+        start = time.monotonic()
+        try:
+            await asyncio.gather(*(call(i) for i in range(total)))
+        finally:
+            await client.aclose()
+        return time.monotonic() - start
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+SEQUENCES = ['ticket_order_number_seq', 'ticket_ticket_number_seq']
+
+# Must match ticket.numbering.SEQUENCE_BLOCK_SIZE
+BLOCK_SIZE = 1000
+
+
+def create_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEQUENCES:
+        schema_editor.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS {name} INCREMENT BY {BLOCK_SIZE} START WITH 1"
+        )
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEQUENCES:
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_alter_event_organizer'),
+        ('ticket', '0002_numbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingRoom',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('opens_at', models.DateTimeField()),
+                ('admit_per_minute', models.PositiveIntegerField(default=100)),
+                ('admission_window_minutes', models.PositiveIntegerField(default=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='waiting_room', to='events.event')),
+            ],
+        ),
+    ]
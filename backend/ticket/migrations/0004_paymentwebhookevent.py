@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0003_waitingroom'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('provider', models.CharField(default='paystack', max_length=20)),
+                ('event_type', models.CharField(max_length=100)),
+                ('reference', models.CharField(max_length=200)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('received', 'Received'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='received', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'unique_together': {('provider', 'event_type', 'reference')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-17 06:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0005_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketPDF',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to='ticket_pdfs/')),
+                ('input_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_pdf', to='ticket.order')),
+            ],
+        ),
+    ]
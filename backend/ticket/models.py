@@ -1,5 +1,6 @@
 # tickets/models.py
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 import uuid
@@ -134,6 +135,9 @@ class Order(models.Model):
     payment_reference = models.CharField(max_length=200, blank=True)
     payment_date = models.DateTimeField(null=True, blank=True)
     
+    # Set when the confirmation email goes out, so it is only ever sent once
+    confirmation_sent_at = models.DateTimeField(null=True, blank=True)
+    
     # Additional info
     notes = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
@@ -155,16 +159,51 @@ class Order(models.Model):
     
     def generate_order_number(self):
         """Generate unique order number"""
-        import string
-        import random
-        prefix = 'ORD'
-        random_string = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        return f"{prefix}-{random_string}"
+        from .numbering import order_numbers
+        return order_numbers().allocate()[0]
     
     @property
     def total_tickets(self):
         """Total number of tickets in order"""
         return self.items.aggregate(total=models.Sum('quantity'))['total'] or 0
+    
+    def mark_as_paid(self, payment_method='', payment_reference=''):
+        """Complete the order and add the customer to the event's guest list"""
+        from django.utils import timezone
+        from guests.models import Guest
+        
+        self.payment_status = 'successful'
+        self.status = 'completed'
+        self.payment_date = timezone.now()
+        self.payment_method = payment_method
+        self.payment_reference = payment_reference
+        self.save()
+        
+        first_name, _, last_name = self.customer_name.partition(' ')
+        guest, created = Guest.objects.get_or_create(
+            event_id=self.event_id,
+            email=self.customer_email,
+            defaults={
+                'first_name': first_name,
+                'last_name': last_name,
+                'phone_number': self.customer_phone,
+                'status': 'confirmed',
+                'rsvp_status': True,
+                'rsvp_date': timezone.now(),
+                'invitation_sent': True,
+            }
+        )
+        
+        # If guest already exists, update their info
+        if not created:
+            guest.first_name = first_name
+            guest.last_name = last_name
+            guest.phone_number = self.customer_phone or guest.phone_number
+            guest.status = 'confirmed'
+            guest.rsvp_status = True
+            guest.save()
+        
+        return guest
 
 
 class OrderItem(models.Model):
@@ -246,11 +285,27 @@ class Ticket(models.Model):
     
     def generate_ticket_number(self):
         """Generate unique ticket number"""
-        import string
-        import random
-        prefix = 'TKT'
-        random_string = ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
-        return f"{prefix}-{random_string}"
+        from .numbering import ticket_numbers
+        return ticket_numbers().allocate()[0]
+    
+    @classmethod
+    def admit(cls, ticket_id, user=None):
+        """
+        Check a valid ticket in, returns the check-in time or None if it
+        was already used or is not valid. One conditional UPDATE, so two
+        scanners can never both admit the same ticket.
+        """
+        from django.utils import timezone
+        
+        now = timezone.now()
+        admitted = cls.objects.filter(id=ticket_id, checked_in=False, status='valid').update(
+            checked_in=True,
+            checked_in_at=now,
+            checked_in_by=user if user and user.is_authenticated else None,
+            status='used',
+            updated_at=now
+        )
+        return now if admitted else None
 
 
 class DiscountCode(models.Model):
@@ -321,4 +376,120 @@ class TicketSale(models.Model):
         ordering = ['-sale_date']
     
     def __str__(self):
-        return f"{self.event.title} - {self.ticket_type.name} - {self.quantity_sold} tickets"
\ No newline at end of file
+        return f"{self.event.title} - {self.ticket_type.name} - {self.quantity_sold} tickets"
+
+
+class WaitingRoom(models.Model):
+    """Admission queue in front of checkout for high-demand launches"""
+    
+    id = models.AutoField(primary_key=True)
+    event = models.OneToOneField('events.Event', on_delete=models.CASCADE, related_name='waiting_room')
+    is_active = models.BooleanField(default=True)
+    
+    # Admission starts at opens_at and lets buyers in at a fixed rate
+    opens_at = models.DateTimeField()
+    admit_per_minute = models.PositiveIntegerField(default=100)
+    
+    # How long an admitted buyer has to place their order
+    admission_window_minutes = models.PositiveIntegerField(default=15)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Waiting room - {self.event.title}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .waiting_room import invalidate_config
+        invalidate_config(self.event_id)
+    
+    def delete(self, *args, **kwargs):
+        event_id = self.event_id
+        result = super().delete(*args, **kwargs)
+        from .waiting_room import invalidate_config
+        invalidate_config(event_id)
+        return result
+
+
+class PaymentWebhookEvent(models.Model):
+    """Raw payment gateway webhook, stored before it is processed"""
+    
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.AutoField(primary_key=True)
+    provider = models.CharField(max_length=20, default='paystack')
+    event_type = models.CharField(max_length=100)
+    reference = models.CharField(max_length=200)
+    payload = models.JSONField()
+    
+    # Processing state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    
+    # Timestamps
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+        unique_together = ['provider', 'event_type', 'reference']
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_type} - {self.reference}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response for a client-supplied Idempotency-Key"""
+    
+    id = models.BigAutoField(primary_key=True)
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=100)  # endpoint + caller
+    fingerprint = models.CharField(max_length=64)  # hash of the request
+    
+    # Empty until the first request finishes
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ['key', 'scope']
+    
+    def __str__(self):
+        return f"{self.scope} - {self.key}"
+
+
+class NumberSequence(models.Model):
+    """Counter rows for order/ticket numbers on databases without sequences"""
+    
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
+
+
+class TicketPDF(models.Model):
+    """Rendered ticket PDF for an order, reused until its inputs change"""
+    
+    id = models.AutoField(primary_key=True)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='ticket_pdf')
+    file = models.FileField(upload_to='ticket_pdfs/')
+    input_hash = models.CharField(max_length=64)  # hash of everything drawn on the PDF
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Ticket PDF for {self.order.order_number}"
@@ -0,0 +1,189 @@
+# tickets/order_placement.py
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from rest_framework import serializers
+
+from .models import TicketType, Order, OrderItem, Ticket, DiscountCode, TicketSale
+from .numbering import ticket_numbers
+
+
+class OrderPlacementEngine:
+    """
+    Place a ticket order with a fixed number of queries.
+
+    All ticket types in the order are locked with one ordered
+    SELECT ... FOR UPDATE, the stock is taken with one conditional UPDATE
+    and the order items, tickets and sales records are written with
+    bulk_create, so the lock is held for the same handful of round-trips
+    whether the order has one ticket or fifty.
+
+    Pass ``ticket_types`` (id -> TicketType) when the rows were already
+    locked during validation, so they are not fetched a second time.
+
+    Must be called inside transaction.atomic().
+    """
+
+    def __init__(self, event_id, items, discount_code=None, ticket_types=None):
+        self.event_id = event_id
+        self.discount_code = discount_code
+        self.quantities = self.merge_quantities(items)
+        self.ticket_types = ticket_types
+
+    @staticmethod
+    def merge_quantities(items):
+        """
+        Merge repeated ticket types and sort by id so concurrent orders
+        always lock rows in the same order (no deadlocks)
+        """
+        quantities = {}
+        for item in items:
+            ticket_type_id = item['ticket_type_id']
+            quantities[ticket_type_id] = quantities.get(ticket_type_id, 0) + item['quantity']
+        return OrderedDict(sorted(quantities.items()))
+
+    def place(self, customer_name, customer_email, customer_phone='', ip_address=None):
+        """Create the order and return it"""
+        ticket_types = self.ticket_types
+        if ticket_types is None:
+            ticket_types = self._lock_ticket_types()
+        self._take_stock(ticket_types)
+
+        subtotal = sum(
+            (ticket_types[ticket_type_id].price * quantity
+             for ticket_type_id, quantity in self.quantities.items()),
+            Decimal('0.00')
+        )
+
+        discount = self._get_discount()
+        discount_amount = self._discount_amount(discount, subtotal)
+
+        tax_amount = Decimal('0.00')  # Add tax calculation if needed
+        total_amount = subtotal - discount_amount + tax_amount
+
+        order = Order.objects.create(
+            event_id=self.event_id,
+            customer_name=customer_name,
+            customer_email=customer_email,
+            customer_phone=customer_phone,
+            ip_address=ip_address,
+            subtotal=subtotal,
+            discount_amount=discount_amount,
+            tax_amount=tax_amount,
+            total_amount=total_amount,
+        )
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                ticket_type=ticket_types[ticket_type_id],
+                quantity=quantity,
+                unit_price=ticket_types[ticket_type_id].price,
+                # bulk_create skips OrderItem.save(), so compute it here
+                total_price=ticket_types[ticket_type_id].price * quantity,
+            )
+            for ticket_type_id, quantity in self.quantities.items()
+        ])
+
+        tickets = []
+        sales = []
+        for order_item in order_items:
+            ticket_type = order_item.ticket_type
+            for _ in range(order_item.quantity):
+                tickets.append(Ticket(
+                    order_item=order_item,
+                    ticket_type=ticket_type,
+                    event_id=ticket_type.event_id,
+                    holder_name=customer_name,
+                    holder_email=customer_email,
+                    holder_phone=customer_phone,
+                ))
+            sales.append(TicketSale(
+                event_id=ticket_type.event_id,
+                ticket_type=ticket_type,
+                order=order,
+                quantity_sold=order_item.quantity,
+                revenue=order_item.total_price,
+            ))
+
+        # bulk_create skips Ticket.save(), so number the tickets here
+        for ticket, ticket_number in zip(tickets, ticket_numbers().allocate(len(tickets))):
+            ticket.ticket_number = ticket_number
+
+        Ticket.objects.bulk_create(tickets)
+        TicketSale.objects.bulk_create(sales)
+
+        if discount:
+            DiscountCode.objects.filter(pk=discount.pk).update(times_used=F('times_used') + 1)
+
+        return order
+
+    def _lock_ticket_types(self):
+        """Lock every ticket type in the order with a single query"""
+        ticket_types = {
+            ticket_type.id: ticket_type
+            for ticket_type in TicketType.objects.select_for_update().filter(
+                id__in=list(self.quantities)
+            ).order_by('id')
+        }
+
+        for ticket_type_id in self.quantities:
+            if ticket_type_id not in ticket_types:
+                raise serializers.ValidationError(f"Ticket type {ticket_type_id} not found")
+
+        return ticket_types
+
+    def _take_stock(self, ticket_types):
+        """
+        Increment quantity_sold for all ticket types in one conditional UPDATE.
+        Rows that would be oversold don't match the WHERE clause, so a short
+        row count means at least one tier ran out.
+        """
+        condition = Q()
+        increments = []
+        for ticket_type_id, quantity in self.quantities.items():
+            condition |= Q(id=ticket_type_id, quantity_available__gte=F('quantity_sold') + quantity)
+            increments.append(When(id=ticket_type_id, then=F('quantity_sold') + quantity))
+
+        updated = TicketType.objects.filter(condition).update(
+            quantity_sold=Case(
+                *increments,
+                default=F('quantity_sold'),
+                output_field=PositiveIntegerField()
+            )
+        )
+
+        if updated != len(self.quantities):
+            for ticket_type_id, quantity in self.quantities.items():
+                ticket_type = ticket_types[ticket_type_id]
+                if ticket_type.quantity_sold + quantity > ticket_type.quantity_available:
+                    raise serializers.ValidationError(
+                        f"Not enough tickets available for {ticket_type.name}"
+                    )
+            raise serializers.ValidationError("Not enough tickets available")
+
+        for ticket_type_id, quantity in self.quantities.items():
+            ticket_types[ticket_type_id].quantity_sold += quantity
+
+    def _get_discount(self):
+        """Return the discount code if one was given and it is still valid"""
+        if not self.discount_code:
+            return None
+
+        discount = DiscountCode.objects.filter(
+            code=self.discount_code,
+            is_active=True
+        ).first()
+
+        if discount and discount.is_valid:
+            return discount
+        return None
+
+    @staticmethod
+    def _discount_amount(discount, subtotal):
+        if not discount:
+            return Decimal('0.00')
+        if discount.discount_type == 'percentage':
+            return subtotal * (discount.discount_value / 100)
+        return discount.discount_value
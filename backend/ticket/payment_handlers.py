@@ -1,33 +1,302 @@
 # tickets/payment_handlers.py
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from decimal import Decimal
 
 
+logger = logging.getLogger(__name__)
+
+
+class GatewayUnavailable(requests.exceptions.ConnectionError):
+    """Raised without calling the gateway while its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a gateway that keeps failing.
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail immediately. After ``reset_timeout`` seconds a single trial
+    call is let through; success closes the circuit again.
+    """
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+    
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+    
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: restart the clock so only this call gets through
+                self._opened_at = time.monotonic()
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class GatewayMetrics:
+    """Per-operation call counts and latency for a gateway client"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def record(self, operation, elapsed_ms, ok):
+        with self._lock:
+            stats = self._stats.setdefault(
+                operation, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            )
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+    
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: {
+                    **stats,
+                    'avg_ms': stats['total_ms'] / stats['calls'] if stats['calls'] else 0.0,
+                }
+                for operation, stats in self._stats.items()
+            }
+
+
+class PaystackClient:
+    """
+    Shared HTTP client for the Paystack API.
+    
+    Keeps connections alive in a pool (no TLS handshake per checkout),
+    retries connection failures, and retries 429/5xx on GETs, with jittered
+    backoff. A circuit breaker fails fast while Paystack is down instead of
+    tying up workers until the timeout.
+    """
+    BASE_URL = "https://api.paystack.co"
+    
+    POOL_SIZE = 20
+    MAX_RETRIES = 3
+    BACKOFF_FACTOR = 0.3
+    BACKOFF_JITTER = 0.3
+    TIMEOUT = (3.05, 10)  # (connect, read) seconds
+    
+    def __init__(self, secret_key, base_url=None):
+        self.base_url = base_url or self.BASE_URL
+        self.breaker = CircuitBreaker()
+        self.metrics = GatewayMetrics()
+        
+        # Connection errors are retried for every method (the request was
+        # never sent); 429/5xx only for GETs, so a payment is never
+        # initialized twice.
+        retry = Retry(
+            total=self.MAX_RETRIES,
+            connect=self.MAX_RETRIES,
+            read=self.MAX_RETRIES,
+            status=self.MAX_RETRIES,
+            backoff_factor=self.BACKOFF_FACTOR,
+            backoff_jitter=self.BACKOFF_JITTER,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE, max_retries=retry)
+        
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "Content-Type": "application/json",
+        })
+    
+    def request(self, method, path, operation, **kwargs):
+        if not self.breaker.allow():
+            self.metrics.record(operation, 0.0, False)
+            raise GatewayUnavailable('Payment gateway is unavailable, try again shortly')
+        
+        kwargs.setdefault('timeout', self.TIMEOUT)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.exceptions.RequestException:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            self.breaker.record_failure()
+            self.metrics.record(operation, elapsed_ms, False)
+            logger.warning("paystack %s failed after %.0fms", operation, elapsed_ms)
+            raise
+        
+        elapsed_ms = (time.monotonic() - start) * 1000
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self.metrics.record(operation, elapsed_ms, response.ok)
+        logger.info("paystack %s %s in %.0fms", operation, response.status_code, elapsed_ms)
+        return response
+    
+    def get(self, path, operation, **kwargs):
+        return self.request('GET', path, operation, **kwargs)
+    
+    def post(self, path, operation, **kwargs):
+        return self.request('POST', path, operation, **kwargs)
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_paystack_client():
+    """Return the process-wide PaystackClient (rebuilt after a fork)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = PaystackClient(settings.PAYSTACK_SECRET_KEY)
+            _client_pid = os.getpid()
+        return _client
+
+
+class AsyncPaystackClient:
+    """
+    Non-blocking counterpart of PaystackClient, built on httpx.
+    
+    Keeps a pool of keep-alive connections for one event loop so a single
+    ASGI process can have hundreds of gateway calls in flight. Retry rules
+    and the circuit breaker match PaystackClient.
+    """
+    BASE_URL = PaystackClient.BASE_URL
+    
+    MAX_CONNECTIONS = 200
+    MAX_KEEPALIVE_CONNECTIONS = 50
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    
+    def __init__(self, secret_key, base_url=None):
+        self.breaker = CircuitBreaker()
+        self.metrics = GatewayMetrics()
+        
+        connect_timeout, read_timeout = PaystackClient.TIMEOUT
+        # The transport retries failed connects, whatever the method
+        transport = httpx.AsyncHTTPTransport(
+            retries=PaystackClient.MAX_RETRIES,
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONNECTIONS,
+                max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=base_url or self.BASE_URL,
+            transport=transport,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            headers={
+                "Authorization": f"Bearer {secret_key}",
+                "Content-Type": "application/json",
+            },
+        )
+    
+    async def request(self, method, path, operation, **kwargs):
+        if not self.breaker.allow():
+            self.metrics.record(operation, 0.0, False)
+            raise GatewayUnavailable('Payment gateway is unavailable, try again shortly')
+        
+        start = time.monotonic()
+        try:
+            for attempt in range(PaystackClient.MAX_RETRIES + 1):
+                if attempt:
+                    await asyncio.sleep(_backoff(attempt))
+                response = await self.client.request(method, path, **kwargs)
+                # Only GETs are retried on 429/5xx, as in PaystackClient
+                if method != 'GET' or response.status_code not in self.RETRY_STATUSES:
+                    break
+        except httpx.HTTPError:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            self.breaker.record_failure()
+            self.metrics.record(operation, elapsed_ms, False)
+            logger.warning("paystack %s failed after %.0fms", operation, elapsed_ms)
+            raise
+        
+        elapsed_ms = (time.monotonic() - start) * 1000
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self.metrics.record(operation, elapsed_ms, response.is_success)
+        logger.info("paystack %s %s in %.0fms", operation, response.status_code, elapsed_ms)
+        return response
+    
+    async def get(self, path, operation, **kwargs):
+        return await self.request('GET', path, operation, **kwargs)
+    
+    async def post(self, path, operation, **kwargs):
+        return await self.request('POST', path, operation, **kwargs)
+    
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _backoff(attempt):
+    """Jittered exponential backoff, same curve as urllib3's Retry"""
+    delay = PaystackClient.BACKOFF_FACTOR * (2 ** (attempt - 1))
+    return delay + random.uniform(0, PaystackClient.BACKOFF_JITTER)
+
+
+# httpx connections belong to the loop that opened them, so one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_paystack_client():
+    """Return the AsyncPaystackClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncPaystackClient(settings.PAYSTACK_SECRET_KEY)
+    return client
+
+
 class PaystackPaymentHandler:
     """Handler for Paystack payment integration"""
-    BASE_URL = "https://api.paystack.co"
+    BASE_URL = PaystackClient.BASE_URL
     USD_TO_NGN_RATE = Decimal('1600.00')
 
     @staticmethod
-    def initialize_payment(order):
-        """
-        Initialize Paystack payment transaction
-        Returns payment authorization URL and access code
-        """
-        url = f"{PaystackPaymentHandler.BASE_URL}/transaction/initialize"
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        # Convert USD to NGN at fixed rate
-        amount_in_ngn = order.total_amount * PaystackPaymentHandler.USD_TO_NGN_RATE
+    def amount_in_kobo(total_amount):
+        """Amount Paystack charges for a USD total: NGN at the fixed rate, in kobo"""
+        return int(total_amount * PaystackPaymentHandler.USD_TO_NGN_RATE * 100)
 
-        # Prepare payment data
-        data = {
+    @staticmethod
+    def build_initialize_data(order):
+        """Request body for /transaction/initialize (needs order.event loaded)"""
+        return {
             "email": order.customer_email,
-            "amount": int(amount_in_ngn * 100),  # Convert to kobo (smallest unit)
+            "amount": PaystackPaymentHandler.amount_in_kobo(order.total_amount),
             "currency": "NGN",
             "reference": order.order_number,
             "callback_url": f"{settings.FRONTEND_URL}/event/payment/callback",
@@ -43,25 +312,55 @@ class PaystackPaymentHandler:
             "channels": ["card", "bank", "ussd", "qr", "mobile_money", "bank_transfer"],
         }
 
+    @staticmethod
+    def parse_initialize(result):
+        if result.get('status'):
+            return {
+                'status': True,
+                'message': 'Payment initialized',
+                'data': result.get('data', {}),
+                'authorization_url': result.get('data', {}).get('authorization_url'),
+                'access_code': result.get('data', {}).get('access_code'),
+                'reference': result.get('data', {}).get('reference'),
+            }
+        return {
+            'status': False,
+            'message': result.get('message', 'Payment initialization failed'),
+        }
+
+    @staticmethod
+    def parse_verify(result):
+        if result.get('status'):
+            data = result.get('data', {})
+            return {
+                'status': True,
+                'message': 'Payment verified',
+                'data': data,
+                'amount': data.get('amount', 0) / 100,  # Convert from kobo
+                'reference': data.get('reference'),
+                'paid_at': data.get('paid_at'),
+                'channel': data.get('channel'),
+                'transaction_status': data.get('status'),
+            }
+        return {
+            'status': False,
+            'message': result.get('message', 'Payment verification failed'),
+        }
+
+    @staticmethod
+    def initialize_payment(order):
+        """
+        Initialize Paystack payment transaction
+        Returns payment authorization URL and access code
+        """
+        data = PaystackPaymentHandler.build_initialize_data(order)
+
         try:
-            response = requests.post(url, json=data, headers=headers, timeout=10)
+            response = get_paystack_client().post(
+                "/transaction/initialize", 'initialize_payment', json=data
+            )
             response.raise_for_status()
-            result = response.json()
-
-            if result.get('status'):
-                return {
-                    'status': True,
-                    'message': 'Payment initialized',
-                    'data': result.get('data', {}),
-                    'authorization_url': result.get('data', {}).get('authorization_url'),
-                    'access_code': result.get('data', {}).get('access_code'),
-                    'reference': result.get('data', {}).get('reference'),
-                }
-            else:
-                return {
-                    'status': False,
-                    'message': result.get('message', 'Payment initialization failed'),
-                }
+            return PaystackPaymentHandler.parse_initialize(response.json())
 
         except requests.exceptions.RequestException as e:
             return {
@@ -75,38 +374,18 @@ class PaystackPaymentHandler:
         Verify Paystack payment transaction
         Returns transaction details if successful
         """
-        url = f"{PaystackPaymentHandler.BASE_URL}/transaction/verify/{reference}"
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"
-        }
-
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_paystack_client().get(
+                f"/transaction/verify/{reference}", 'verify_payment'
+            )
             response.raise_for_status()
-            result = response.json()
-
-            if result.get('status'):
-                data = result.get('data', {})
-                return {
-                    'status': True,
-                    'message': 'Payment verified',
-                    'data': data,
-                    'amount': data.get('amount', 0) / 100,  # Convert from kobo
-                    'reference': data.get('reference'),
-                    'paid_at': data.get('paid_at'),
-                    'channel': data.get('channel'),
-                    'transaction_status': data.get('status'),
-                }
-            else:
-                return {
-                    'status': False,
-                    'message': result.get('message', 'Payment verification failed'),
-                }
+            return PaystackPaymentHandler.parse_verify(response.json())
 
         except requests.exceptions.RequestException as e:
             return {
                 'status': False,
                 'message': f'Payment verification error: {str(e)}',
+                'http_status': getattr(e.response, 'status_code', None),
             }
 
     @staticmethod
@@ -114,13 +393,10 @@ class PaystackPaymentHandler:
         """
         Get transaction details from Paystack
         """
-        url = f"{PaystackPaymentHandler.BASE_URL}/transaction/{reference}"
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"
-        }
-
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_paystack_client().get(
+                f"/transaction/{reference}", 'get_transaction'
+            )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -130,6 +406,48 @@ class PaystackPaymentHandler:
             }
 
 
+class AsyncPaystackPaymentHandler:
+    """
+    Non-blocking variant of PaystackPaymentHandler for async views.
+    Returns the same dicts; callers must load ``order.event`` up front
+    (select_related) since lazy relations can't be fetched from async code.
+    """
+
+    @staticmethod
+    async def initialize_payment(order):
+        data = PaystackPaymentHandler.build_initialize_data(order)
+
+        try:
+            response = await get_async_paystack_client().post(
+                "/transaction/initialize", 'initialize_payment', json=data
+            )
+            response.raise_for_status()
+            return PaystackPaymentHandler.parse_initialize(response.json())
+
+        except (httpx.HTTPError, GatewayUnavailable) as e:
+            return {
+                'status': False,
+                'message': f'Payment gateway error: {str(e)}',
+            }
+
+    @staticmethod
+    async def verify_payment(reference):
+        try:
+            response = await get_async_paystack_client().get(
+                f"/transaction/verify/{reference}", 'verify_payment'
+            )
+            response.raise_for_status()
+            return PaystackPaymentHandler.parse_verify(response.json())
+
+        except (httpx.HTTPError, GatewayUnavailable) as e:
+            response = getattr(e, 'response', None)
+            return {
+                'status': False,
+                'message': f'Payment verification error: {str(e)}',
+                'http_status': getattr(response, 'status_code', None),
+            }
+
+
 # class StripePaymentHandler:
 #     """Handler for Stripe payment integration (Alternative)"""
     
@@ -6,13 +6,25 @@ from reportlab.lib import colors
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import qrcode
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
 from django.conf import settings
 
 
+# Unit five-pointed star, drawn in one stroke order (every 144 degrees)
+STAR_POINTS = [
+    (math.cos(math.radians(i * 144 - 90)), math.sin(math.radians(i * 144 - 90)))
+    for i in range(5)
+]
+
+
 class ConcertTicketGenerator:
     """Generate concert-style PDF tickets with QR codes"""
     
@@ -20,64 +32,138 @@ class ConcertTicketGenerator:
     TICKET_WIDTH = 8.5
     TICKET_HEIGHT = 3.5
     
+    # Drawn ticket size (in points)
+    TICKET_W = 7.5 * inch
+    TICKET_H = 3 * inch
+    TICKETS_PER_PAGE = 2
+    
+    # 'vector' or 'image'; None follows settings.TICKET_PDF_QR_MODE
+    qr_mode = None
+    
     def __init__(self):
         self.buffer = BytesIO()
+        self._forms = set()
         
     def generate_qr_code(self, data):
         """Generate QR code image"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
+        from qr_codes.renderer import render_qr_png
         
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to BytesIO
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
+        png = render_qr_png(data, error_correction='H')
+        return ImageReader(BytesIO(png))
+    
+    def draw_qr_vector(self, c, data, x, y, size, border=4):
+        """
+        Draw a QR code as filled rectangles, one per horizontal run of dark
+        modules, in a single path. No raster image is created or embedded.
+        ``size`` includes the ``border`` module quiet zone, like the PNG.
+        """
+        from qr_codes.renderer import qr_matrix
+        
+        matrix = qr_matrix(data, error_correction='H')
+        count = len(matrix)
+        module = size / (count + 2 * border)
+        origin_x = x + border * module
+        top = y + size - border * module
         
-        return ImageReader(img_buffer)
+        path = c.beginPath()
+        for row_index, row in enumerate(matrix):
+            row_y = top - (row_index + 1) * module
+            col = 0
+            while col < count:
+                if not row[col]:
+                    col += 1
+                    continue
+                run_start = col
+                while col < count and row[col]:
+                    col += 1
+                path.rect(origin_x + run_start * module, row_y, (col - run_start) * module, module)
+        
+        c.setFillColorRGB(0, 0, 0)
+        c.drawPath(path, fill=1, stroke=0)
     
     def draw_ticket(self, c, ticket, y_position):
         """Draw a single concert ticket"""
-        # Get QR code
-        qr_data = f"{ticket.ticket_number}|{ticket.ticket_code}"
-        qr_image = self.generate_qr_code(qr_data)
+        # Everything except holder, number and QR code is the same for every
+        # ticket of a tier, so it is drawn once into a form and reused
+        form_name = self._ticket_form(c, ticket)
         
-        # Ticket background - gradient effect with rectangles
         ticket_x = 0.5 * inch
         ticket_y = y_position
-        ticket_w = 7.5 * inch
-        ticket_h = 3 * inch
+        ticket_w = self.TICKET_W
+        
+        c.saveState()
+        c.translate(ticket_x, ticket_y)
+        c.doForm(form_name)
+        c.restoreState()
+        
+        # Holder name
+        c.setFillColorRGB(1, 1, 1)
+        c.setFont("Helvetica", 11)
+        c.drawString(ticket_x + 1.5*inch, ticket_y + 0.5*inch, ticket.holder_name)
+        
+        # QR code
+        qr_data = f"{ticket.ticket_number}|{ticket.ticket_code}"
+        qr_section_x = ticket_x + ticket_w - 2.5*inch
+        qr_section_y = ticket_y + 0.4*inch
+        if (self.qr_mode or settings.TICKET_PDF_QR_MODE) == 'vector':
+            self.draw_qr_vector(c, qr_data, qr_section_x + 0.1*inch, qr_section_y + 0.1*inch, 1.8*inch)
+            c.setFillColorRGB(1, 1, 1)
+        else:
+            qr_image = self.generate_qr_code(qr_data)
+            c.drawImage(qr_image, qr_section_x + 0.1*inch, qr_section_y + 0.1*inch, 
+                       width=1.8*inch, height=1.8*inch, mask='auto')
+        
+        # Ticket number
+        c.setFont("Helvetica", 8)
+        c.drawCentredString(qr_section_x + 1*inch, qr_section_y - 0.25*inch, ticket.ticket_number)
+        
+        # Used, cancelled... tickets stay on the order PDF, marked as such
+        if ticket.status != 'valid':
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(ticket_x + 1.5*inch, ticket_y + 0.25*inch, ticket.status.upper())
+    
+    def _ticket_form(self, c, ticket):
+        """
+        Return the name of the form XObject holding the static ticket
+        design for the ticket's event and tier, drawing it on first use.
+        Forms live in the PDF being written, so they are cached per canvas.
+        """
+        form_name = f"ticket_{ticket.event_id}_{ticket.ticket_type_id}"
+        if form_name not in self._forms:
+            c.beginForm(form_name, 0, 0, self.TICKET_W, self.TICKET_H)
+            self._draw_ticket_chrome(c, ticket.event, ticket.ticket_type)
+            c.endForm()
+            self._forms.add(form_name)
+        return form_name
+    
+    def _draw_ticket_chrome(self, c, event, ticket_type):
+        """Draw the static ticket design with its lower left corner at (0, 0)"""
+        ticket_w = self.TICKET_W
+        ticket_h = self.TICKET_H
         
         # Main ticket background
         c.setFillColorRGB(0.1, 0.1, 0.15)  # Dark background
-        c.rect(ticket_x, ticket_y, ticket_w, ticket_h, fill=1, stroke=0)
+        c.rect(0, 0, ticket_w, ticket_h, fill=1, stroke=0)
         
         # Gradient bars
         c.setFillColorRGB(0.4, 0.25, 0.6)  # Purple
-        c.rect(ticket_x, ticket_y + ticket_h - 0.5*inch, ticket_w, 0.5*inch, fill=1, stroke=0)
+        c.rect(0, ticket_h - 0.5*inch, ticket_w, 0.5*inch, fill=1, stroke=0)
         
         c.setFillColorRGB(0.5, 0.3, 0.7)  # Lighter purple
-        c.rect(ticket_x, ticket_y + ticket_h - 0.6*inch, ticket_w, 0.1*inch, fill=1, stroke=0)
+        c.rect(0, ticket_h - 0.6*inch, ticket_w, 0.1*inch, fill=1, stroke=0)
         
         # Bottom accent
         c.setFillColorRGB(0.4, 0.25, 0.6)
-        c.rect(ticket_x, ticket_y, ticket_w, 0.3*inch, fill=1, stroke=0)
+        c.rect(0, 0, ticket_w, 0.3*inch, fill=1, stroke=0)
         
         # Left section (Event details)
-        left_section_x = ticket_x + 0.3*inch
-        left_section_y = ticket_y + ticket_h - 0.8*inch
+        left_section_x = 0.3*inch
+        left_section_y = ticket_h - 0.8*inch
         
         # Event title
         c.setFillColorRGB(1, 1, 1)  # White
         c.setFont("Helvetica-Bold", 20)
-        c.drawString(left_section_x, left_section_y, ticket.event.title[:35])
+        c.drawString(left_section_x, left_section_y, event.title[:35])
         
         # Ticket type badge
         c.setFillColorRGB(0.95, 0.8, 0.2)  # Gold
@@ -87,67 +173,54 @@ class ConcertTicketGenerator:
         
         c.setFillColorRGB(0.1, 0.1, 0.15)  # Dark text
         c.setFont("Helvetica-Bold", 12)
-        c.drawString(badge_x + 0.1*inch, badge_y + 0.08*inch, ticket.ticket_type.name.upper())
+        c.drawString(badge_x + 0.1*inch, badge_y + 0.08*inch, ticket_type.name.upper())
         
         # Date and time
         c.setFillColorRGB(1, 1, 1)
         c.setFont("Helvetica", 11)
-        event_date = ticket.event.date.strftime("%B %d, %Y")
-        event_time = ticket.event.date.strftime("%I:%M %p")
+        event_date = event.event_date.strftime("%B %d, %Y")
+        event_time = event.event_date.strftime("%I:%M %p")
         c.drawString(left_section_x, badge_y - 0.35*inch, f"📅 {event_date}")
         c.drawString(left_section_x, badge_y - 0.6*inch, f"🕐 {event_time}")
         
         # Location
         c.setFont("Helvetica", 10)
-        location_lines = self._wrap_text(ticket.event.location, 40)
+        location_lines = self._wrap_text(event.location, 40)
         location_y = badge_y - 0.85*inch
         for line in location_lines[:2]:  # Max 2 lines
             c.drawString(left_section_x, location_y, f"📍 {line}")
             location_y -= 0.2*inch
         
-        # Holder name
+        # Holder label
         c.setFont("Helvetica-Bold", 11)
-        c.drawString(left_section_x, ticket_y + 0.5*inch, "TICKET HOLDER:")
-        c.setFont("Helvetica", 11)
-        c.drawString(left_section_x + 1.2*inch, ticket_y + 0.5*inch, ticket.holder_name)
+        c.drawString(left_section_x, 0.5*inch, "TICKET HOLDER:")
         
-        # Right section (QR Code and ticket number)
-        qr_section_x = ticket_x + ticket_w - 2.5*inch
-        qr_section_y = ticket_y + 0.4*inch
-        
-        # QR code background
+        # Right section (QR Code background)
+        qr_section_x = ticket_w - 2.5*inch
+        qr_section_y = 0.4*inch
         c.setFillColorRGB(1, 1, 1)
         c.rect(qr_section_x, qr_section_y, 2*inch, 2*inch, fill=1, stroke=0)
         
-        # QR code
-        c.drawImage(qr_image, qr_section_x + 0.1*inch, qr_section_y + 0.1*inch, 
-                   width=1.8*inch, height=1.8*inch, mask='auto')
-        
-        # Ticket number
-        c.setFillColorRGB(1, 1, 1)
-        c.setFont("Helvetica", 8)
-        c.drawCentredString(qr_section_x + 1*inch, qr_section_y - 0.25*inch, ticket.ticket_number)
-        
         # Barcode separator line
         c.setStrokeColorRGB(0.4, 0.25, 0.6)
         c.setLineWidth(2)
         separator_x = qr_section_x - 0.3*inch
-        c.line(separator_x, ticket_y + 0.3*inch, separator_x, ticket_y + ticket_h - 0.3*inch)
+        c.line(separator_x, 0.3*inch, separator_x, ticket_h - 0.3*inch)
         
         # Perforation marks on separator
         c.setStrokeColorRGB(0.6, 0.6, 0.6)
         c.setDash(3, 3)
-        c.line(separator_x, ticket_y + 0.3*inch, separator_x, ticket_y + ticket_h - 0.3*inch)
+        c.line(separator_x, 0.3*inch, separator_x, ticket_h - 0.3*inch)
         c.setDash()  # Reset dash
         
         # Instructions
         c.setFillColorRGB(0.7, 0.7, 0.7)
         c.setFont("Helvetica", 7)
-        c.drawCentredString(qr_section_x + 1*inch, ticket_y + 0.15*inch, 
+        c.drawCentredString(qr_section_x + 1*inch, 0.15*inch, 
                           "Present this QR code at entrance")
         
         # Decorative elements
-        self._draw_decorative_elements(c, ticket_x, ticket_y, ticket_w, ticket_h)
+        self._draw_decorative_elements(c, 0, 0, ticket_w, ticket_h)
         
     def _draw_decorative_elements(self, c, x, y, w, h):
         """Add decorative elements to ticket"""
@@ -163,21 +236,14 @@ class ConcertTicketGenerator:
         
     def _draw_star(self, c, x, y, size):
         """Draw a simple star"""
-        c.saveState()
-        c.translate(x, y)
         path = c.beginPath()
-        for i in range(5):
-            angle = i * 144 - 90
-            import math
-            px = size * math.cos(math.radians(angle))
-            py = size * math.sin(math.radians(angle))
+        for i, (px, py) in enumerate(STAR_POINTS):
             if i == 0:
-                path.moveTo(px, py)
+                path.moveTo(x + px * size, y + py * size)
             else:
-                path.lineTo(px, py)
+                path.lineTo(x + px * size, y + py * size)
         path.close()
         c.drawPath(path, fill=1, stroke=0)
-        c.restoreState()
         
     def _wrap_text(self, text, max_length):
         """Wrap text to multiple lines"""
@@ -206,7 +272,7 @@ class ConcertTicketGenerator:
         c = canvas.Canvas(self.buffer, pagesize=letter)
         page_width, page_height = letter
         
-        tickets_per_page = 2
+        tickets_per_page = self.TICKETS_PER_PAGE
         current_ticket = 0
         
         for i, ticket in enumerate(tickets):
@@ -225,40 +291,149 @@ class ConcertTicketGenerator:
         return self.buffer
 
 
-def generate_order_tickets_pdf(order):
+def ticket_render_data(ticket):
     """
-    Generate a PDF with all tickets for an order
-    Returns BytesIO buffer with PDF
+    Plain, picklable copy of everything the generator reads from a ticket,
+    so rendering can happen in another process without the ORM
     """
-    from .models import Ticket
+    return {
+        'ticket_number': ticket.ticket_number,
+        'ticket_code': str(ticket.ticket_code),
+        'holder_name': ticket.holder_name,
+        'status': ticket.status,
+        'event_id': ticket.event_id,
+        'ticket_type_id': ticket.ticket_type_id,
+        'event': {
+            'title': ticket.event.title,
+            'event_date': ticket.event.event_date,
+            'location': ticket.event.location,
+        },
+        'ticket_type': {
+            'name': ticket.ticket_type.name,
+        },
+    }
+
+
+def render_tickets_pdf(tickets_data):
+    """Render a PDF from ticket_render_data() dicts, returns the PDF bytes"""
+    tickets = [
+        SimpleNamespace(
+            **{**data, 'event': SimpleNamespace(**data['event']),
+               'ticket_type': SimpleNamespace(**data['ticket_type'])}
+        )
+        for data in tickets_data
+    ]
+    return ConcertTicketGenerator().generate_tickets_pdf(tickets).getvalue()
+
+
+def render_pdfs_batch(jobs, workers=None):
+    """
+    Render many PDFs at once, spread over a process pool.
+    
+    ``jobs`` maps a key (e.g. order id) to a list of ticket_render_data()
+    dicts; returns a dict of key -> PDF bytes. Rendering is pure CPU work,
+    so it scales with cores rather than threads. Inside a daemonic process
+    (a Celery prefork child cannot start its own children) or with a
+    single worker it renders serially; shard across Celery tasks instead.
+    """
+    workers = workers or settings.TICKET_PDF_WORKERS or os.cpu_count() or 1
+    keys = list(jobs)
     
-    tickets = Ticket.objects.filter(
-        order_item__order=order
-    ).select_related('ticket_type', 'event')
+    if workers <= 1 or len(keys) <= 1 or multiprocessing.current_process().daemon:
+        return {key: render_tickets_pdf(jobs[key]) for key in keys}
     
-    generator = ConcertTicketGenerator()
-    pdf_buffer = generator.generate_tickets_pdf(tickets)
+    # Children only get plain data; don't let them inherit open DB sockets
+    from django.db import connections
+    connections.close_all()
     
-    return pdf_buffer
+    with ProcessPoolExecutor(max_workers=min(workers, len(keys))) as executor:
+        chunksize = max(1, len(keys) // (workers * 4))
+        pdfs = executor.map(render_tickets_pdf, [jobs[key] for key in keys], chunksize=chunksize)
+        return dict(zip(keys, pdfs))
+
 
+# Bump when the ticket design changes so stored PDFs are re-rendered
+PDF_RENDER_VERSION = 2
 
-def save_ticket_pdf(order, filename=None):
+
+def pdf_input_hash(tickets_data):
+    """Hash of everything that ends up on an order's PDF"""
+    raw = json.dumps(
+        [PDF_RENDER_VERSION, settings.TICKET_PDF_QR_MODE, tickets_data],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def order_pdf_tickets(order_ids, admittable_only=False):
+    """
+    The tickets printed on order PDFs: every ticket of the orders, with
+    its status, so an order whose tickets were all scanned still downloads
+    them. Reminders pass ``admittable_only=True`` to print only valid
+    tickets not yet checked in; before the doors open that is the same
+    set, so the stored PDF is shared with the confirmation email and
+    downloads.
     """
-    Generate and save ticket PDF to file
-    Returns file path
+    from .models import Ticket
+    
+    tickets = Ticket.objects.filter(order_item__order_id__in=order_ids)
+    if admittable_only:
+        tickets = tickets.filter(status='valid', checked_in=False)
+    return tickets.select_related('order_item', 'ticket_type', 'event').order_by('id')
+
+
+def get_order_pdfs(jobs):
     """
-    if not filename:
-        filename = f"tickets_{order.order_number}.pdf"
+    Return stored PDFs for many orders, rendering only the ones whose
+    inputs changed since they were last stored.
     
-    pdf_buffer = generate_order_tickets_pdf(order)
+    ``jobs`` maps order id -> ticket_render_data() dicts; returns order
+    id -> PDF bytes. A PDF is re-rendered only when a ticket's holder or
+    status, the tier or the event details changed, because those are
+    exactly what the input hash covers.
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from .models import TicketPDF
     
-    # Create tickets directory if it doesn't exist
-    tickets_dir = os.path.join(settings.MEDIA_ROOT, 'tickets')
-    os.makedirs(tickets_dir, exist_ok=True)
+    hashes = {order_id: pdf_input_hash(data) for order_id, data in jobs.items()}
+    artifacts = TicketPDF.objects.in_bulk(list(jobs), field_name='order_id')
     
-    file_path = os.path.join(tickets_dir, filename)
+    pdfs = {}
+    stale = {}
+    for order_id, data in jobs.items():
+        artifact = artifacts.get(order_id)
+        if artifact and artifact.input_hash == hashes[order_id]:
+            try:
+                with artifact.file.open('rb') as f:
+                    pdfs[order_id] = f.read()
+                continue
+            except (FileNotFoundError, OSError, ValueError):
+                pass
+        stale[order_id] = data
     
-    with open(file_path, 'wb') as f:
-        f.write(pdf_buffer.getvalue())
+    if stale:
+        rendered = render_pdfs_batch(stale)
+        for order_id, pdf in rendered.items():
+            name = default_storage.save(
+                f"ticket_pdfs/order_{order_id}_{hashes[order_id][:16]}.pdf",
+                ContentFile(pdf)
+            )
+            TicketPDF.objects.update_or_create(
+                order_id=order_id,
+                defaults={'file': name, 'input_hash': hashes[order_id]}
+            )
+            
+            old = artifacts.get(order_id)
+            if old and old.file.name and old.file.name != name:
+                default_storage.delete(old.file.name)
+        pdfs.update(rendered)
     
-    return file_path
\ No newline at end of file
+    return pdfs
+
+
+def get_order_pdf(order):
+    """Stored ticket PDF bytes for one order, rendered only if out of date"""
+    tickets_data = [ticket_render_data(ticket) for ticket in order_pdf_tickets([order.id])]
+    return get_order_pdfs({order.id: tickets_data})[order.id]
@@ -0,0 +1,159 @@
+# tickets/reconciliation.py
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Sum, When
+from django.utils import timezone
+
+from .models import Order, OrderItem, Ticket, TicketType
+
+
+logger = logging.getLogger(__name__)
+
+# Paystack transaction statuses that mean the customer did not pay
+UNPAID_STATUSES = ('failed', 'abandoned', 'reversed')
+
+
+class PaymentReconciler:
+    """
+    Settle pending orders whose payment webhook never arrived.
+
+    Stale pending orders are read in keyset-paginated batches (id > last id,
+    so each page is an index range scan however deep the backlog goes) and
+    verified against the gateway from a small thread pool. Outcomes are then
+    applied per batch inside one transaction: paid orders are completed,
+    unpaid ones are cancelled and their seats go back on sale with a single
+    UPDATE per table.
+
+    ``gateway`` only needs a ``verify_payment(reference)`` method returning
+    the dict shape of PaystackPaymentHandler.verify_payment.
+    """
+
+    def __init__(self, gateway=None, batch_size=None, concurrency=None, stale_after=None):
+        if gateway is None:
+            from .payment_handlers import PaystackPaymentHandler
+            gateway = PaystackPaymentHandler
+        self.gateway = gateway
+        self.batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+        self.concurrency = concurrency or settings.PAYMENT_RECONCILE_CONCURRENCY
+        self.stale_after = stale_after or timedelta(minutes=settings.PENDING_ORDER_TIMEOUT_MINUTES)
+
+    def run(self):
+        """Reconcile every stale pending order, returns counts per outcome"""
+        counts = defaultdict(int)
+        cutoff = timezone.now() - self.stale_after
+        last_id = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                batch = list(
+                    Order.objects.filter(
+                        id__gt=last_id,
+                        status='pending',
+                        payment_status='pending',
+                        created_at__lt=cutoff,
+                    ).order_by('id').values_list('id', 'order_number', 'total_amount')[:self.batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                references = [order_number for _, order_number, _ in batch]
+                verifications = executor.map(self.gateway.verify_payment, references)
+
+                outcomes = {}
+                for (order_id, _, total_amount), verification in zip(batch, verifications):
+                    outcomes[order_id] = self.classify(verification, total_amount)
+
+                for outcome, applied in self.apply(outcomes).items():
+                    counts[outcome] += applied
+
+        return dict(counts)
+
+    def classify(self, verification, total_amount):
+        """Map a gateway verification to 'paid', 'unpaid' or 'unknown'"""
+        if not verification.get('status'):
+            # Paystack answers 404 for references that never reached checkout
+            return 'unpaid' if verification.get('http_status') == 404 else 'unknown'
+
+        transaction_status = verification.get('transaction_status')
+        if transaction_status == 'success':
+            from .payment_handlers import PaystackPaymentHandler
+
+            expected = PaystackPaymentHandler.amount_in_kobo(total_amount)
+            if verification.get('data', {}).get('amount') != expected:
+                logger.warning("Amount mismatch for order %s", verification.get('reference'))
+                return 'unknown'
+            return 'paid'
+        if transaction_status in UNPAID_STATUSES:
+            return 'unpaid'
+        return 'unknown'
+
+    def apply(self, outcomes):
+        """Apply one batch of outcomes (order id -> outcome)"""
+        from .tasks import enqueue_ticket_confirmation
+
+        applied = defaultdict(int)
+
+        with transaction.atomic():
+            # Re-check under lock: a webhook may have settled some of these
+            # while the gateway was being asked
+            orders = Order.objects.select_for_update().filter(
+                id__in=[order_id for order_id, outcome in outcomes.items() if outcome != 'unknown'],
+                status='pending',
+                payment_status='pending',
+            ).order_by('id')
+
+            unpaid_ids = []
+            for order in orders:
+                if outcomes[order.id] == 'paid':
+                    order.mark_as_paid(payment_method='paystack', payment_reference=order.order_number)
+                    enqueue_ticket_confirmation(order.id)
+                    applied['paid'] += 1
+                else:
+                    unpaid_ids.append(order.id)
+
+            if unpaid_ids:
+                applied['cancelled'] = self.release(unpaid_ids)
+
+        applied['unknown'] = sum(1 for outcome in outcomes.values() if outcome == 'unknown')
+        return applied
+
+    @staticmethod
+    def release(order_ids):
+        """
+        Cancel unpaid orders and put their seats back on sale.
+        Must be called inside transaction.atomic() with the orders locked.
+        """
+        returned = dict(
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .values_list('ticket_type_id')
+            .annotate(quantity=Sum('quantity'))
+            .order_by('ticket_type_id')
+        )
+
+        cancelled = Order.objects.filter(id__in=order_ids).update(
+            status='cancelled',
+            payment_status='failed',
+            updated_at=timezone.now(),
+        )
+        Ticket.objects.filter(order_item__order_id__in=order_ids).update(status='cancelled')
+
+        if returned:
+            TicketType.objects.filter(id__in=list(returned)).update(
+                quantity_sold=Case(
+                    *[When(id=ticket_type_id, then=F('quantity_sold') - quantity)
+                      for ticket_type_id, quantity in returned.items()],
+                    default=F('quantity_sold'),
+                    output_field=PositiveIntegerField()
+                )
+            )
+
+            from .inventory import get_inventory
+            transaction.on_commit(lambda: get_inventory().restock(returned))
+
+        return cancelled
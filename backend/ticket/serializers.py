@@ -1,8 +1,8 @@
 # tickets/serializers.py
-from rest_framework import serializers
+from rest_framework import serializers, exceptions
 from .models import (
     TicketType, TicketBenefit, Order, OrderItem, 
-    Ticket, DiscountCode, TicketSale
+    Ticket, DiscountCode, TicketSale, WaitingRoom
 )
 
 
@@ -111,32 +111,65 @@ class OrderCreateSerializer(serializers.Serializer):
         return items
     
     def validate(self, data):
-        """Validate ticket availability and purchase limits"""
-        from .models import TicketType
+        """
+        Validate ticket availability and purchase limits.
         
-        for item in data['items']:
+        All requested ticket types are loaded with one query and handed to
+        the view through the context (``ticket_types``). With
+        ``lock_ticket_types`` in the context the rows are locked, so the
+        caller must be inside a transaction. With ``hold_inventory`` the
+        seats are held first (``hold_id``), so sold-out tiers are rejected
+        before the database is touched. A waiting room token is claimed
+        (``queue_claim``); the caller gives it back if the order fails.
+        """
+        from .inventory import get_inventory, InsufficientStock
+        from .order_placement import OrderPlacementEngine
+        from . import waiting_room
+        
+        # Check the waiting room first, it only needs the cache
+        request = self.context.get('request')
+        queue_token = request.headers.get('X-Queue-Token') if request else None
+        try:
+            self.context['queue_claim'] = waiting_room.check_admission(data['event'], queue_token)
+        except waiting_room.QueueTokenError as e:
+            raise exceptions.PermissionDenied(str(e))
+        
+        quantities = OrderPlacementEngine.merge_quantities(data['items'])
+        
+        if self.context.get('hold_inventory'):
             try:
-                ticket_type = TicketType.objects.get(id=item['ticket_type_id'])
-            except TicketType.DoesNotExist:
-                raise serializers.ValidationError(f"Ticket type {item['ticket_type_id']} not found")
+                self.context['hold_id'] = get_inventory().hold(quantities)
+            except InsufficientStock as e:
+                raise serializers.ValidationError(str(e))
+        
+        queryset = TicketType.objects.all()
+        if self.context.get('lock_ticket_types'):
+            queryset = queryset.select_for_update().order_by('id')
+        ticket_types = queryset.in_bulk(list(quantities))
+        self.context['ticket_types'] = ticket_types
+        
+        for ticket_type_id, quantity in quantities.items():
+            ticket_type = ticket_types.get(ticket_type_id)
+            if ticket_type is None:
+                raise serializers.ValidationError(f"Ticket type {ticket_type_id} not found")
             
             # Check availability
             if not ticket_type.is_available:
                 raise serializers.ValidationError(f"{ticket_type.name} is not available")
             
             # Check quantity
-            if item['quantity'] > ticket_type.quantity_remaining:
+            if quantity > ticket_type.quantity_remaining:
                 raise serializers.ValidationError(
                     f"Only {ticket_type.quantity_remaining} tickets remaining for {ticket_type.name}"
                 )
             
             # Check purchase limits
-            if item['quantity'] < ticket_type.min_purchase:
+            if quantity < ticket_type.min_purchase:
                 raise serializers.ValidationError(
                     f"Minimum purchase for {ticket_type.name} is {ticket_type.min_purchase}"
                 )
             
-            if item['quantity'] > ticket_type.max_purchase:
+            if quantity > ticket_type.max_purchase:
                 raise serializers.ValidationError(
                     f"Maximum purchase for {ticket_type.name} is {ticket_type.max_purchase}"
                 )
@@ -180,6 +213,24 @@ class DiscountCodeValidateSerializer(serializers.Serializer):
     order_total = serializers.DecimalField(max_digits=10, decimal_places=2)
 
 
+class WaitingRoomSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitingRoom
+        fields = [
+            'id', 'event', 'is_active', 'opens_at', 'admit_per_minute',
+            'admission_window_minutes', 'created_at', 'updated_at'
+        ]
+    
+    def validate(self, data):
+        """Rooms cannot be switched on where they would not be enforced"""
+        from . import waiting_room
+        
+        default = self.instance.is_active if self.instance else True
+        if data.get('is_active', default) and not waiting_room.available():
+            raise serializers.ValidationError({'is_active': waiting_room.UNAVAILABLE_MESSAGE})
+        return data
+
+
 class TicketSaleSerializer(serializers.ModelSerializer):
     event_title = serializers.CharField(source='event.title', read_only=True)
     ticket_type_name = serializers.CharField(source='ticket_type.name', read_only=True)
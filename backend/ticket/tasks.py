@@ -1,41 +1,93 @@
 # tickets/tasks.py
-# from celery import shared_task
-from django.core.mail import EmailMessage
+from collections import defaultdict
+from datetime import timedelta
+from celery import shared_task
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import Order, Ticket
-from .pdf_generator import generate_order_tickets_pdf
+from django.db import transaction
+from django.utils import timezone
+from notifications.outbox import enqueue, forget
+from notifications.rendering import EmailTemplate
+from .models import Order, Ticket, PaymentWebhookEvent
+from .payment_handlers import PaystackPaymentHandler
+from .pdf_generator import get_order_pdf
 
 
-# @shared_task
-def send_ticket_confirmation_email(order_id):
+CONFIRMATION_EMAIL = EmailTemplate(
+    'tickets/ticket_confirmation_email.html',
+    fields=('customer_name', 'order_number', 'total_amount', 'ticket_count', 'order.customer_email'),
+    raw_fields=('payment_reference_row', 'ticket_rows'),
+)
+
+# Failed confirmation emails are retried with backoff (1, 2, 4... minutes)
+CONFIRMATION_EMAIL_MAX_RETRIES = 5
+
+REMINDER_EMAIL = EmailTemplate(
+    'tickets/ticket_reminder_email.html',
+    fields=('customer_name', 'order.customer_email'),
+    raw_fields=('ticket_rows',),
+)
+
+
+def enqueue_ticket_confirmation(order_id):
     """
-    Send ticket confirmation email with PDF tickets attached
+    Queue the confirmation email in the current transaction's outbox.
+    An order only ever gets one, however many payment paths confirm it:
+    the dedupe key covers the outbox retention period, confirmation_sent_at
+    everything after it.
+    """
+    if Order.objects.filter(id=order_id, confirmation_sent_at__isnull=False).exists():
+        return
+    enqueue(
+        'ticket.tasks.send_ticket_confirmation_email',
+        order_id,
+        dedupe_key=_confirmation_dedupe_key(order_id)
+    )
+
+
+def _confirmation_dedupe_key(order_id):
+    return f"ticket-confirmation:{order_id}"
+
+
+@shared_task(bind=True, max_retries=CONFIRMATION_EMAIL_MAX_RETRIES)
+def send_ticket_confirmation_email(self, order_id):
+    """
+    Send ticket confirmation email with PDF tickets attached.
+    Failures are retried; once retries run out the outbox entry is dropped
+    so the next payment path to confirm the order queues the email again.
     """
     try:
         order = Order.objects.get(id=order_id)
-        tickets = Ticket.objects.filter(order_item__order=order)
         
-        # Generate PDF tickets
-        pdf_buffer = generate_order_tickets_pdf(order)
+        # Claimed before sending, so a message relayed twice is sent once
+        claimed = Order.objects.filter(id=order_id, confirmation_sent_at__isnull=True).update(
+            confirmation_sent_at=timezone.now()
+        )
+        if not claimed:
+            return f"Confirmation email for order {order.order_number} already sent"
+        
+        tickets = list(Ticket.objects.filter(order_item__order=order).select_related('ticket_type'))
         
-        # Email context
-        context = {
-            'order': order,
-            'tickets': tickets,
-            'event': order.event,
+        # Stored PDF tickets (only rendered if something changed)
+        pdf_content = get_order_pdf(order)
+        
+        # Render HTML email (event parts are rendered once per event)
+        html_message = CONFIRMATION_EMAIL.render(order.event, {
             'customer_name': order.customer_name,
             'order_number': order.order_number,
             'total_amount': order.total_amount,
-            'payment_reference': order.payment_reference,
-            'frontend_url': settings.FRONTEND_URL,
-        }
-        
-        # Render HTML email
-        html_message = render_to_string(
-            'tickets/ticket_confirmation_email.html',
-            context
-        )
+            'ticket_count': len(tickets),
+            'order.customer_email': order.customer_email,
+            'payment_reference_row': render_to_string(
+                'tickets/confirmation_payment_row.html',
+                {'payment_reference': order.payment_reference}
+            ),
+            'ticket_rows': render_to_string(
+                'tickets/confirmation_ticket_rows.html',
+                {'tickets': tickets}
+            ),
+        })
         
         # Plain text fallback
         plain_message = f"""
@@ -43,7 +95,7 @@ def send_ticket_confirmation_email(order_id):
         
         Order Number: {order.order_number}
         Event: {order.event.title}
-        Date: {order.event.date.strftime('%B %d, %Y at %I:%M %p')}
+        Date: {order.event.event_date.strftime('%B %d, %Y at %I:%M %p')}
         Location: {order.event.location}
         Total: ${order.total_amount}
         
@@ -58,7 +110,7 @@ def send_ticket_confirmation_email(order_id):
         """
         
         # Create email with attachment
-        email = EmailMessage(
+        email = EmailMultiAlternatives(
             subject=f"Your Tickets for {order.event.title} 🎫",
             body=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
@@ -70,7 +122,7 @@ def send_ticket_confirmation_email(order_id):
         
         # Attach PDF tickets
         pdf_filename = f"Tickets_{order.order_number}.pdf"
-        email.attach(pdf_filename, pdf_buffer.getvalue(), 'application/pdf')
+        email.attach(pdf_filename, pdf_content, 'application/pdf')
         
         # Send email
         email.send(fail_silently=False)
@@ -80,58 +132,156 @@ def send_ticket_confirmation_email(order_id):
     except Order.DoesNotExist:
         return f"Order {order_id} not found"
     except Exception as e:
-        return f"Error sending confirmation email: {str(e)}"
+        # Not sent, so a retry or a later confirmation may try again
+        Order.objects.filter(id=order_id).update(confirmation_sent_at=None)
+        if self.request.retries >= self.max_retries:
+            forget(_confirmation_dedupe_key(order_id))
+            raise
+        raise self.retry(exc=e, countdown=60 * 2 ** self.request.retries)
 
 
-# @shared_task
+@shared_task
+def process_payment_webhook(webhook_event_id):
+    """
+    Apply a stored payment webhook: complete the order, add the guest and
+    queue the ticket email once the transaction has committed
+    """
+    with transaction.atomic():
+        try:
+            webhook_event = PaymentWebhookEvent.objects.select_for_update().get(id=webhook_event_id)
+        except PaymentWebhookEvent.DoesNotExist:
+            return f"Webhook event {webhook_event_id} not found"
+        
+        if webhook_event.status in ('processed', 'ignored'):
+            return f"Webhook event {webhook_event_id} already handled"
+        
+        webhook_event.attempts += 1
+        webhook_event.processed_at = timezone.now()
+        data = webhook_event.payload.get('data', {})
+        amount = data.get('amount')  # In kobo, as charged by initialize_payment
+        
+        order = Order.objects.select_for_update().filter(
+            order_number=webhook_event.reference
+        ).first()
+        
+        if order is None:
+            webhook_event.status = 'failed'
+            webhook_event.error = 'Order not found'
+        elif order.payment_status == 'successful':
+            # Prevent double processing
+            webhook_event.status = 'ignored'
+            webhook_event.error = 'Order already paid'
+        elif amount != PaystackPaymentHandler.amount_in_kobo(order.total_amount):
+            webhook_event.status = 'failed'
+            webhook_event.error = 'Amount mismatch'
+        else:
+            order.mark_as_paid(
+                payment_method='paystack',
+                payment_reference=webhook_event.reference
+            )
+            webhook_event.status = 'processed'
+            webhook_event.error = ''
+            
+            enqueue_ticket_confirmation(order.id)
+        
+        webhook_event.save()
+    
+    return f"Webhook event {webhook_event_id} {webhook_event.status}"
+
+
+@shared_task
+def retry_payment_webhooks():
+    """
+    Queue stored webhooks again that were received but never processed
+    within PAYMENT_WEBHOOK_RETRY_MINUTES, e.g. because their task was lost
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.PAYMENT_WEBHOOK_RETRY_MINUTES)
+    webhook_event_ids = list(
+        PaymentWebhookEvent.objects.filter(status='received', received_at__lt=cutoff)
+        .order_by('received_at')
+        .values_list('id', flat=True)[:500]
+    )
+    
+    for webhook_event_id in webhook_event_ids:
+        process_payment_webhook.delay(webhook_event_id)
+    
+    return f"Retried {len(webhook_event_ids)} payment webhooks"
+
+
+@shared_task
 def send_ticket_reminder_email(event_id):
     """
-    Send reminder emails to all ticket holders for an upcoming event
+    Send reminder emails to all ticket holders for an upcoming event.
+    Orders are split into batches of TICKET_REMINDER_BATCH_SIZE, each sent
+    by its own task, so PDF rendering spreads over every Celery worker.
     """
     from events.models import Event
     
     try:
         event = Event.objects.get(id=event_id)
-        
-        # Get all orders for this event with valid tickets
-        orders = Order.objects.filter(
+    except Event.DoesNotExist:
+        return f"Event {event_id} not found"
+    
+    # Orders for this event with at least one valid, unused ticket
+    order_ids = list(
+        Order.objects.filter(
             event=event,
             status='completed',
-            payment_status='successful'
-        ).distinct()
+            payment_status='successful',
+            items__tickets__status='valid',
+            items__tickets__checked_in=False,
+        ).order_by('id').values_list('id', flat=True).distinct()
+    )
+    
+    batch_size = settings.TICKET_REMINDER_BATCH_SIZE
+    for start in range(0, len(order_ids), batch_size):
+        send_ticket_reminder_batch.delay(event_id, order_ids[start:start + batch_size])
+    
+    return f"Queued reminder emails for {len(order_ids)} orders of {event.title}"
+
+
+@shared_task
+def send_ticket_reminder_batch(event_id, order_ids):
+    """
+    Send ticket reminders for one batch of orders. All tickets are loaded
+    in one query; stored PDFs are reused and the rest rendered together
+    from plain ticket data.
+    """
+    from events.models import Event
+    from .pdf_generator import get_order_pdfs, order_pdf_tickets, ticket_render_data
+    
+    try:
+        event = Event.objects.get(id=event_id)
+        orders = Order.objects.in_bulk(order_ids)
+        
+        tickets_by_order = defaultdict(list)
+        for ticket in order_pdf_tickets(order_ids, admittable_only=True):
+            tickets_by_order[ticket.order_item.order_id].append(ticket)
+        
+        # Unchanged orders are read from storage, the rest rendered together
+        pdfs = get_order_pdfs({
+            order_id: [ticket_render_data(ticket) for ticket in order_tickets]
+            for order_id, order_tickets in tickets_by_order.items()
+        })
         
         sent_count = 0
         
-        for order in orders:
-            tickets = Ticket.objects.filter(
-                order_item__order=order,
-                status='valid',
-                checked_in=False
-            )
-            
-            if not tickets.exists():
-                continue
-            
-            # Generate fresh PDF tickets
-            pdf_buffer = generate_order_tickets_pdf(order)
+        for order_id, order_tickets in tickets_by_order.items():
+            order = orders[order_id]
             
-            context = {
-                'event': event,
-                'order': order,
-                'tickets': tickets,
+            html_message = REMINDER_EMAIL.render(event, {
                 'customer_name': order.customer_name,
-                'frontend_url': settings.FRONTEND_URL,
-            }
-            
-            html_message = render_to_string(
-                'tickets/ticket_reminder_email.html',
-                context
-            )
+                'order.customer_email': order.customer_email,
+                'ticket_rows': render_to_string(
+                    'tickets/reminder_ticket_rows.html',
+                    {'tickets': order_tickets}
+                ),
+            })
             
             plain_message = f"""
             Reminder: {event.title} is coming up soon!
             
-            Date: {event.date.strftime('%B %d, %Y at %I:%M %p')}
+            Date: {event.event_date.strftime('%B %d, %Y at %I:%M %p')}
             Location: {event.location}
             
             Your tickets are attached to this email.
@@ -144,7 +294,7 @@ def send_ticket_reminder_email(event_id):
             We can't wait to see you there!
             """
             
-            email = EmailMessage(
+            email = EmailMultiAlternatives(
                 subject=f"Reminder: {event.title} is Tomorrow! 🎉",
                 body=plain_message,
                 from_email=settings.DEFAULT_FROM_EMAIL,
@@ -155,7 +305,7 @@ def send_ticket_reminder_email(event_id):
             
             # Attach PDF tickets
             pdf_filename = f"Tickets_{order.order_number}.pdf"
-            email.attach(pdf_filename, pdf_buffer.getvalue(), 'application/pdf')
+            email.attach(pdf_filename, pdfs[order_id], 'application/pdf')
             
             email.send(fail_silently=True)
             sent_count += 1
@@ -176,13 +326,60 @@ def generate_and_save_tickets_pdf(order_id):
     """
     try:
         order = Order.objects.get(id=order_id)
-        from .pdf_generator import save_ticket_pdf
         
-        file_path = save_ticket_pdf(order)
+        get_order_pdf(order)
         
-        return f"Tickets PDF saved to {file_path}"
+        return f"Tickets PDF saved to {order.ticket_pdf.file.name}"
         
     except Order.DoesNotExist:
         return f"Order {order_id} not found"
     except Exception as e:
-        return f"Error generating PDF: {str(e)}"
\ No newline at end of file
+        return f"Error generating PDF: {str(e)}"
+
+
+@shared_task
+def sweep_inventory_holds():
+    """
+    Release seat holds whose checkout never finished
+    """
+    from .inventory import get_inventory
+    
+    released = get_inventory().sweep_expired()
+    return f"Released {released} expired inventory holds"
+
+
+@shared_task
+def reconcile_inventory():
+    """
+    Reset the inventory counters from TicketType
+    """
+    from .inventory import get_inventory
+    
+    synced = get_inventory().reconcile()
+    return f"Reconciled inventory for {synced} ticket types"
+
+
+@shared_task
+def reconcile_pending_orders():
+    """
+    Verify stale pending orders with Paystack, complete the paid ones and
+    release the seats of the rest
+    """
+    from .reconciliation import PaymentReconciler
+    
+    counts = PaymentReconciler().run()
+    return (
+        f"Reconciled pending orders: {counts.get('paid', 0)} paid, "
+        f"{counts.get('cancelled', 0)} cancelled, {counts.get('unknown', 0)} left pending"
+    )
+
+
+@shared_task
+def purge_idempotency_keys():
+    """
+    Delete stored Idempotency-Key responses past their expiry
+    """
+    from .models import IdempotencyKey
+    
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()
+    return f"Purged {deleted} expired idempotency keys"
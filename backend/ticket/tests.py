@@ -1,3 +1,939 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from events.models import Event
+from notifications.models import OutboxMessage
+from notifications.outbox import relay
+from . import idempotency, inventory, waiting_room
+from .inventory import (
+    InsufficientStock, InventoryService, LocalInventoryBackend, RedisInventoryBackend
+)
+from .pdf_generator import get_order_pdf, order_pdf_tickets, render_pdfs_batch
+from .pdf_stream import StreamingTicketGenerator
+from .payment_handlers import CircuitBreaker, GatewayUnavailable, PaystackClient, PaystackPaymentHandler
+from .models import (
+    DiscountCode, IdempotencyKey, Order, OrderItem, PaymentWebhookEvent, Ticket, TicketSale,
+    TicketType, WaitingRoom
+)
+from .order_placement import OrderPlacementEngine
+from .views import OrderViewSet
+from .reconciliation import PaymentReconciler
+from .tasks import (
+    CONFIRMATION_EMAIL_MAX_RETRIES, enqueue_ticket_confirmation, process_payment_webhook,
+    retry_payment_webhooks, send_ticket_confirmation_email
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+
+def make_event(**kwargs):
+    organizer = User.objects.create_user(
+        email=kwargs.pop('organizer_email', 'organizer@example.com'),
+        password='password',
+        user_type='organizer'
+    )
+    defaults = {
+        'title': 'Launch Night',
+        'event_date': timezone.now() + timedelta(days=7),
+        'location': 'Lagos',
+    }
+    defaults.update(kwargs)
+    return Event.objects.create(organizer=organizer, **defaults)
+
+
+def make_ticket_type(event, **kwargs):
+    now = timezone.now()
+    defaults = {
+        'name': 'General',
+        'price': Decimal('5000.00'),
+        'quantity_available': 10,
+        'sale_start_date': now - timedelta(days=1),
+        'sale_end_date': now + timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    return TicketType.objects.create(event=event, **defaults)
+
+
+def make_order(event, *items, **kwargs):
+    """Order with tickets for (ticket_type, quantity) items"""
+    defaults = {
+        'customer_name': 'Ada Lovelace',
+        'customer_email': 'ada@example.com',
+        'total_amount': sum(ticket_type.price * quantity for ticket_type, quantity in items),
+    }
+    defaults.update(kwargs)
+    order = Order.objects.create(event=event, **defaults)
+    for ticket_type, quantity in items:
+        item = OrderItem.objects.create(
+            order=order, ticket_type=ticket_type, quantity=quantity, unit_price=ticket_type.price
+        )
+        for _ in range(quantity):
+            Ticket.objects.create(
+                order_item=item, ticket_type=ticket_type, event=event,
+                holder_name=order.customer_name, holder_email=order.customer_email
+            )
+    return order
+
+
+class InventoryServiceTests:
+    """Behaviour every inventory backend must share"""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def stock(self, ticket_type_id):
+        raise NotImplementedError
+
+    def setUp(self):
+        event = make_event()
+        self.ticket_type = make_ticket_type(event, quantity_available=10, quantity_sold=2)
+        self.other_type = make_ticket_type(event, name='VIP', quantity_available=3)
+        self.service = InventoryService(self.make_backend())
+
+    def test_hold_primes_counters_from_database(self):
+        hold_id = self.service.hold({self.ticket_type.id: 3})
+        self.assertIsNotNone(hold_id)
+        self.assertEqual(self.stock(self.ticket_type.id), 5)
+
+    def test_hold_rejects_more_than_remaining(self):
+        self.service.hold({self.ticket_type.id: 6})
+        with self.assertRaises(InsufficientStock) as raised:
+            self.service.hold({self.ticket_type.id: 3})
+        self.assertEqual(raised.exception.ticket_type_id, self.ticket_type.id)
+        self.assertEqual(self.stock(self.ticket_type.id), 2)
+
+    def test_short_tier_holds_nothing(self):
+        self.service.hold({self.ticket_type.id: 1})
+        with self.assertRaises(InsufficientStock):
+            self.service.hold({self.ticket_type.id: 2, self.other_type.id: 4})
+        self.assertEqual(self.stock(self.ticket_type.id), 7)
+        self.assertEqual(self.stock(self.other_type.id), 3)
+
+    def test_release_returns_seats(self):
+        hold_id = self.service.hold({self.ticket_type.id: 4, self.other_type.id: 1})
+        self.service.release(hold_id)
+        self.assertEqual(self.stock(self.ticket_type.id), 8)
+        self.assertEqual(self.stock(self.other_type.id), 3)
+
+        # A second release of the same hold is a no-op
+        self.service.release(hold_id)
+        self.assertEqual(self.stock(self.ticket_type.id), 8)
+
+    def test_confirm_keeps_seats_taken(self):
+        hold_id = self.service.hold({self.ticket_type.id: 4})
+        self.service.confirm(hold_id, {self.ticket_type.id: 4})
+        self.service.release(hold_id)
+        self.assertEqual(self.stock(self.ticket_type.id), 4)
+
+    def test_sweep_releases_expired_holds_only(self):
+        expired = self.service.hold({self.ticket_type.id: 2}, ttl=-60)
+        self.service.hold({self.ticket_type.id: 3})
+        self.assertEqual(self.service.sweep_expired(), 1)
+        self.assertEqual(self.stock(self.ticket_type.id), 5)
+
+        # Confirming after the sweep takes the seats out of stock again
+        self.service.confirm(expired, {self.ticket_type.id: 2})
+        self.assertEqual(self.stock(self.ticket_type.id), 3)
+
+    def test_restock(self):
+        self.service.hold({self.ticket_type.id: 8})
+        self.service.restock({self.ticket_type.id: 2})
+        self.assertEqual(self.stock(self.ticket_type.id), 2)
+
+    def test_reconcile_subtracts_open_holds(self):
+        self.service.hold({self.ticket_type.id: 3})
+        TicketType.objects.filter(id=self.ticket_type.id).update(quantity_available=20)
+        self.service.refresh([self.ticket_type.id])
+        self.assertEqual(self.stock(self.ticket_type.id), 15)
+
+
+class LocalInventoryTests(InventoryServiceTests, TestCase):
+
+    def make_backend(self):
+        self.backend = LocalInventoryBackend()
+        return self.backend
+
+    def stock(self, ticket_type_id):
+        return self.backend.stock[ticket_type_id]
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisInventoryTests(InventoryServiceTests, TestCase):
+
+    def make_backend(self):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        client.flushall()
+        self.backend = RedisInventoryBackend(client=client)
+        return self.backend
+
+    def stock(self, ticket_type_id):
+        return int(self.backend.client.get(self.backend._key('stock', ticket_type_id)))
+
+    def test_keys_share_one_cluster_slot(self):
+        self.service.hold({self.ticket_type.id: 1, self.other_type.id: 1})
+        keys = self.backend.client.keys('*')
+        self.assertTrue(keys)
+        self.assertTrue(all(key.startswith('{inventory}:') for key in keys))
+
+
+class DisabledInventoryTests(TestCase):
+
+    def setUp(self):
+        inventory._inventory = None
+        self.addCleanup(setattr, inventory, '_inventory', None)
+
+    @override_settings(REDIS_URL=None)
+    def test_counters_are_off_without_shared_redis(self):
+        service = inventory.get_inventory()
+        self.assertIsNone(service.backend)
+        self.assertIsNone(service.hold({1: 1}))
+        self.assertEqual(service.sweep_expired(), 0)
+        self.assertEqual(service.reconcile(), 0)
+        service.restock({1: 1})
+
+
+@override_settings(REDIS_URL='redis://cache:6379/0')
+class WaitingRoomTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.event = make_event()
+        self.opens_at = time.time() - 21 * 60
+        WaitingRoom.objects.create(
+            event=self.event,
+            opens_at=timezone.now() - timedelta(minutes=21),
+            admit_per_minute=100,
+            admission_window_minutes=15
+        )
+
+    def join(self, at):
+        with mock.patch('ticket.waiting_room.time.time', return_value=at):
+            return waiting_room.join(self.event.id)[0]
+
+    def test_late_joiner_is_admitted_from_join_time(self):
+        # 500 buyers joined in the first minutes; buyer 501's slot
+        # (minute 5) is long past when they join at minute 21
+        cache.set(f"waiting_room:{self.event.id}:tail", 500, None)
+        token = self.join(self.opens_at + 21 * 60)
+
+        self.assertTrue(waiting_room.get_status(token)['admitted'])
+        self.assertIsNotNone(waiting_room.check_admission(self.event.id, token))
+
+    def test_window_still_closes_after_join(self):
+        cache.set(f"waiting_room:{self.event.id}:tail", 500, None)
+        token = self.join(self.opens_at + 5 * 60)
+
+        with self.assertRaisesMessage(waiting_room.QueueTokenError, 'expired'):
+            waiting_room.check_admission(self.event.id, token)
+
+    def test_token_is_claimed_once_until_released(self):
+        token = self.join(time.time())
+        claim = waiting_room.check_admission(self.event.id, token)
+
+        with self.assertRaisesMessage(waiting_room.QueueTokenError, 'already been used'):
+            waiting_room.check_admission(self.event.id, token)
+
+        waiting_room.release(claim)
+        self.assertEqual(waiting_room.check_admission(self.event.id, token), claim)
+
+
+@override_settings(REDIS_URL=None)
+class WaitingRoomWithoutRedisTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.event = make_event()
+
+    def test_rooms_are_not_enforced(self):
+        WaitingRoom.objects.create(event=self.event, opens_at=timezone.now())
+
+        self.assertIsNone(waiting_room.join(self.event.id))
+        self.assertIsNone(waiting_room.check_admission(self.event.id, None))
+
+    def test_rooms_cannot_be_activated(self):
+        client = APIClient()
+        client.force_authenticate(self.event.organizer)
+
+        response = client.post(reverse('waiting-room-list'), {
+            'event': self.event.id,
+            'opens_at': timezone.now().isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('REDIS_URL', str(response.data['is_active']))
+        self.assertFalse(WaitingRoom.objects.exists())
+
+
+@override_settings(PAYSTACK_SECRET_KEY='test-secret')
+class PaystackWebhookTests(TestCase):
+
+    def setUp(self):
+        self.order = Order.objects.create(
+            event=make_event(),
+            customer_name='Ada Obi',
+            customer_email='ada@example.com',
+            total_amount=Decimal('5000.00')
+        )
+
+    def deliver(self, amount=...):
+        if amount is ...:
+            amount = PaystackPaymentHandler.amount_in_kobo(self.order.total_amount)
+        body = json.dumps({
+            'event': 'charge.success',
+            'data': {'reference': self.order.order_number, 'amount': amount},
+        }).encode()
+        signature = hmac.new(b'test-secret', body, hashlib.sha512).hexdigest()
+        return self.client.post(
+            reverse('paystack-webhook'),
+            body,
+            content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature
+        )
+
+    def relayed(self):
+        return OutboxMessage.objects.filter(task='ticket.tasks.process_payment_webhook').count()
+
+    def test_redelivery_requeues_unprocessed_event(self):
+        self.assertEqual(self.deliver().data['status'], 'success')
+        self.assertEqual(self.deliver().data['status'], 'already_received')
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+        self.assertEqual(self.relayed(), 2)
+
+    def test_redelivery_of_processed_event_is_not_requeued(self):
+        self.deliver()
+        process_payment_webhook(PaymentWebhookEvent.objects.get().id)
+        self.deliver()
+
+        self.assertEqual(self.relayed(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'successful')
+
+    def test_missing_amount_fails_the_event(self):
+        self.deliver(amount=None)
+        webhook_event = PaymentWebhookEvent.objects.get()
+        process_payment_webhook(webhook_event.id)
+
+        webhook_event.refresh_from_db()
+        self.assertEqual(webhook_event.status, 'failed')
+        self.assertEqual(webhook_event.error, 'Amount mismatch')
+
+    def test_amount_is_checked_in_kobo_at_the_charged_rate(self):
+        self.deliver(amount=500000)
+        webhook_event = PaymentWebhookEvent.objects.get()
+        process_payment_webhook(webhook_event.id)
+
+        webhook_event.refresh_from_db()
+        self.assertEqual(webhook_event.error, 'Amount mismatch')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+
+    def test_stale_received_events_are_retried(self):
+        self.deliver()
+        webhook_event = PaymentWebhookEvent.objects.get()
+        PaymentWebhookEvent.objects.filter(id=webhook_event.id).update(
+            received_at=timezone.now() - timedelta(hours=1)
+        )
+
+        with mock.patch('ticket.tasks.process_payment_webhook.delay') as delay:
+            retry_payment_webhooks()
+        delay.assert_called_once_with(webhook_event.id)
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def test_unfinished_request_holds_key_for_its_lease(self):
+        record, created = idempotency.claim_key('k1', 'order-create:user:1', 'abc')
+        self.assertTrue(created)
+
+        _, created = idempotency.claim_key('k1', 'order-create:user:1', 'abc')
+        self.assertFalse(created)
+
+        # The first request died without storing a response
+        IdempotencyKey.objects.filter(id=record.id).update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        _, created = idempotency.claim_key('k1', 'order-create:user:1', 'other')
+        self.assertFalse(created)
+        taken_over, created = idempotency.claim_key('k1', 'order-create:user:1', 'abc')
+        self.assertTrue(created)
+        self.assertEqual(taken_over.id, record.id)
+
+    def test_anonymous_callers_get_separate_scopes(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        factory = RequestFactory()
+        first = factory.post('/', REMOTE_ADDR='10.0.0.1')
+        second = factory.post('/', HTTP_X_FORWARDED_FOR='10.0.0.2, 10.0.0.9')
+        first.user = second.user = AnonymousUser()
+
+        self.assertEqual(idempotency._scope('order-create', first), 'order-create:anon:10.0.0.1')
+        self.assertEqual(idempotency._scope('order-create', second), 'order-create:anon:10.0.0.2')
+
+
+class StubGateway:
+    """
+    Local HTTP server standing in for Paystack. Answers with the queued
+    (status, delay) pairs in turn, repeating the last one, and records
+    every request it gets.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses) or [(200, 0)]
+        self.requests = []
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                gateway.requests.append((self.command, self.path))
+                status_code, delay = gateway.responses[min(len(gateway.requests), len(gateway.responses)) - 1]
+                if delay:
+                    time.sleep(delay)
+                body = json.dumps({'status': status_code < 400, 'data': {}}).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # Clients that time out hang up mid-response
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FastPaystackClient(PaystackClient):
+    BACKOFF_FACTOR = 0
+    BACKOFF_JITTER = 0
+
+
+class PaystackClientTests(SimpleTestCase):
+
+    def gateway(self, *responses):
+        gateway = StubGateway(*responses)
+        self.addCleanup(gateway.close)
+        client = FastPaystackClient('sk_test', base_url=gateway.url)
+        self.addCleanup(client.session.close)
+        return gateway, client
+
+    def test_get_retries_server_errors(self):
+        gateway, client = self.gateway((503, 0), (502, 0), (200, 0))
+        response = client.get('/transaction/verify/ORD-1', 'verify')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(gateway.requests), 3)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_post_is_not_retried_on_server_errors(self):
+        gateway, client = self.gateway((503, 0), (200, 0))
+        response = client.post('/transaction/initialize', 'initialize', json={})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(gateway.requests), 1)
+
+    def test_read_timeout_raises_and_counts_as_failure(self):
+        gateway, client = self.gateway((200, 0.5))
+        client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+        with self.assertRaises(requests.exceptions.RequestException):
+            client.post('/transaction/initialize', 'initialize', json={}, timeout=(1, 0.1))
+        self.assertTrue(client.breaker.is_open)
+        self.assertEqual(client.metrics.snapshot()['initialize']['errors'], 1)
+
+    def test_open_breaker_fails_fast_then_half_opens(self):
+        gateway, client = self.gateway((500, 0), (500, 0), (200, 0))
+        client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+
+        # Retries are used up against the 500s, then the breaker opens
+        client.post('/transaction/initialize', 'initialize', json={})
+        self.assertTrue(client.breaker.is_open)
+        with self.assertRaises(GatewayUnavailable):
+            client.get('/transaction/verify/ORD-1', 'verify')
+        self.assertEqual(len(gateway.requests), 1)
+
+        time.sleep(0.25)
+        client.post('/transaction/initialize', 'initialize', json={})
+        self.assertEqual(len(gateway.requests), 2)
+        self.assertTrue(client.breaker.is_open)
+
+        time.sleep(0.25)
+        response = client.get('/transaction/verify/ORD-1', 'verify')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(client.breaker.is_open)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_half_open_lets_one_trial_call_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        with mock.patch('ticket.payment_handlers.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+
+class FakeGateway:
+    """Answers verify_payment from a dict of reference -> verification"""
+
+    def __init__(self, verifications):
+        self.verifications = verifications
+        self.verified = []
+
+    def verify_payment(self, reference):
+        self.verified.append(reference)
+        return self.verifications[reference]
+
+
+class PaymentReconcilerTests(TestCase):
+
+    def setUp(self):
+        self.event = make_event()
+        self.general = make_ticket_type(self.event, quantity_sold=5)
+        self.vip = make_ticket_type(self.event, name='VIP', quantity_sold=2)
+
+    def make_order(self, *items):
+        order = make_order(self.event, *items)
+        # Old enough to count as stale
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(hours=1))
+        return order
+
+    def paid(self, order):
+        amount = PaystackPaymentHandler.amount_in_kobo(order.total_amount)
+        return {'status': True, 'transaction_status': 'success', 'data': {'amount': amount}}
+
+    def reconcile(self, verifications):
+        gateway = FakeGateway(verifications)
+        reconciler = PaymentReconciler(gateway=gateway, batch_size=2, concurrency=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = reconciler.run()
+        return counts, gateway
+
+    def test_paid_order_is_completed_and_confirmed(self):
+        order = self.make_order((self.general, 1))
+
+        counts, _ = self.reconcile({order.order_number: self.paid(order)})
+
+        order.refresh_from_db()
+        self.assertEqual(counts['paid'], 1)
+        self.assertEqual((order.status, order.payment_status), ('completed', 'successful'))
+        self.assertTrue(
+            OutboxMessage.objects.filter(dedupe_key=f"ticket-confirmation:{order.id}").exists()
+        )
+
+    def test_unpaid_orders_release_their_seats_in_bulk(self):
+        first = self.make_order((self.general, 2), (self.vip, 1))
+        second = self.make_order((self.general, 1))
+        never_started = self.make_order((self.vip, 1))
+
+        with mock.patch('ticket.inventory.get_inventory') as get_inventory:
+            counts, _ = self.reconcile({
+                first.order_number: {'status': True, 'transaction_status': 'failed'},
+                second.order_number: {'status': True, 'transaction_status': 'abandoned'},
+                never_started.order_number: {'status': False, 'http_status': 404},
+            })
+
+        self.assertEqual(counts['cancelled'], 3)
+        self.assertEqual(
+            Order.objects.filter(status='cancelled', payment_status='failed').count(), 3
+        )
+        self.assertFalse(Ticket.objects.exclude(status='cancelled').exists())
+        self.general.refresh_from_db()
+        self.vip.refresh_from_db()
+        self.assertEqual((self.general.quantity_sold, self.vip.quantity_sold), (2, 0))
+        # One restock per batch of two orders
+        restocked = {}
+        for call in get_inventory.return_value.restock.call_args_list:
+            for ticket_type_id, quantity in call.args[0].items():
+                restocked[ticket_type_id] = restocked.get(ticket_type_id, 0) + quantity
+        self.assertEqual(restocked, {self.general.id: 3, self.vip.id: 2})
+
+    def test_errors_and_mismatches_leave_orders_pending(self):
+        unreachable = self.make_order((self.general, 1))
+        pending = self.make_order((self.general, 1))
+        underpaid = self.make_order((self.vip, 1))
+        verification = self.paid(underpaid)
+        verification['data']['amount'] -= 100
+
+        counts, gateway = self.reconcile({
+            unreachable.order_number: {'status': False, 'message': 'Payment service temporarily unavailable'},
+            pending.order_number: {'status': True, 'transaction_status': 'ongoing'},
+            underpaid.order_number: verification,
+        })
+
+        self.assertEqual(counts['unknown'], 3)
+        self.assertEqual(len(gateway.verified), 3)
+        self.assertEqual(Order.objects.filter(status='pending', payment_status='pending').count(), 3)
+        self.general.refresh_from_db()
+        self.assertEqual(self.general.quantity_sold, 5)
+
+    def test_only_stale_pending_orders_are_verified(self):
+        order = self.make_order((self.general, 1))
+        Order.objects.filter(id=order.id).update(status='completed', payment_status='successful')
+
+        counts, gateway = self.reconcile({})
+
+        self.assertEqual(counts, {})
+        self.assertEqual(gateway.verified, [])
+
+
+@skipUnless(pypdf, 'pypdf is not installed')
+class StreamingTicketPDFTests(SimpleTestCase):
+
+    def ticket(self, number, ticket_type_id=1):
+        return SimpleNamespace(
+            ticket_number=f"TKT-{number:04d}",
+            ticket_code=f"00000000-0000-0000-0000-{number:012d}",
+            holder_name=f"Guest {number}",
+            status='valid',
+            event_id=1,
+            ticket_type_id=ticket_type_id,
+            event=SimpleNamespace(
+                title='Launch Night',
+                event_date=timezone.now(),
+                location='Lagos',
+            ),
+            ticket_type=SimpleNamespace(name='General' if ticket_type_id == 1 else 'VIP'),
+        )
+
+    def stream(self, tickets):
+        pdf = b''.join(StreamingTicketGenerator().stream_tickets_pdf(iter(tickets)))
+
+        # pypdf recovers from bad offsets, so check the xref table directly
+        xref_offset = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(pdf[xref_offset:].startswith(b'xref\n'))
+        entries = pdf[xref_offset:].split(b'trailer')[0].splitlines()[3:]
+        for object_id, entry in enumerate(entries, start=1):
+            offset = int(entry.split()[0])
+            self.assertTrue(pdf[offset:].startswith(f"{object_id} 0 obj\n".encode()))
+
+        return pdf, pypdf.PdfReader(BytesIO(pdf), strict=True)
+
+    def test_two_tickets_per_page(self):
+        tickets = [self.ticket(number, ticket_type_id=1 + number % 2) for number in range(1, 6)]
+        pdf, reader = self.stream(tickets)
+
+        self.assertEqual(len(reader.pages), 3)
+        text = ''.join(page.extract_text() for page in reader.pages)
+        for ticket in tickets:
+            self.assertIn(ticket.ticket_number, text)
+            self.assertIn(ticket.holder_name, text)
+        # One form per tier, shared by every page that uses it
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 2)
+
+    def test_empty_input_is_a_valid_blank_page(self):
+        _, reader = self.stream([])
+
+        self.assertEqual(len(reader.pages), 1)
+        self.assertEqual(reader.pages[0].extract_text().strip(), '')
+
+
+class OrderPDFTests(TestCase):
+
+    def setUp(self):
+        self.event = make_event()
+        self.order = make_order(self.event, (make_ticket_type(self.event), 2))
+        self.ticket = Ticket.objects.filter(order_item__order=self.order).first()
+
+    def get_pdf(self):
+        with mock.patch('ticket.pdf_generator.render_pdfs_batch', wraps=render_pdfs_batch) as render:
+            pdf = get_order_pdf(self.order)
+        return pdf, render.called
+
+    def test_stored_pdf_is_reused(self):
+        pdf, rendered = self.get_pdf()
+        self.assertTrue(rendered)
+
+        self.assertEqual(self.get_pdf(), (pdf, False))
+
+    def test_pdf_is_rendered_again_when_its_inputs_change(self):
+        changes = [
+            lambda: Ticket.objects.filter(id=self.ticket.id).update(holder_name='Grace Hopper'),
+            lambda: Ticket.objects.filter(id=self.ticket.id).update(status='used', checked_in=True),
+            lambda: Event.objects.filter(id=self.event.id).update(location='Abuja'),
+        ]
+        self.get_pdf()
+
+        for change in changes:
+            change()
+            self.assertTrue(self.get_pdf()[1])
+            self.assertFalse(self.get_pdf()[1])
+
+    def test_used_tickets_stay_on_the_order_pdf(self):
+        Ticket.objects.filter(order_item__order=self.order).update(status='used', checked_in=True)
+
+        self.assertEqual(order_pdf_tickets([self.order.id]).count(), 2)
+        self.assertEqual(order_pdf_tickets([self.order.id], admittable_only=True).count(), 0)
+
+
+class ConfirmationEmailTests(TestCase):
+
+    def setUp(self):
+        event = make_event()
+        self.order = make_order(
+            event, (make_ticket_type(event), 1), status='completed', payment_status='successful'
+        )
+
+    def test_confirmation_is_sent_once(self):
+        send_ticket_confirmation_email(self.order.id)
+        result = send_ticket_confirmation_email(self.order.id)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('already sent', result)
+        self.order.refresh_from_db()
+        self.assertIsNotNone(self.order.confirmation_sent_at)
+
+    def test_confirmed_order_is_not_queued_again_after_outbox_purge(self):
+        send_ticket_confirmation_email(self.order.id)
+        OutboxMessage.objects.all().delete()
+
+        enqueue_ticket_confirmation(self.order.id)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def confirm(self, pdf_side_effect):
+        with mock.patch('ticket.tasks.get_order_pdf', side_effect=pdf_side_effect) as get_pdf:
+            with transaction.atomic():
+                enqueue_ticket_confirmation(self.order.id)
+            # Keeps the tracebacks of failed attempts out of the test output
+            with self.assertLogs('celery.app.trace', 'INFO'):
+                relay()
+        return get_pdf.call_count
+
+    def test_failed_send_is_retried(self):
+        attempts = self.confirm([OSError('Storage unavailable'), b'%PDF-1.4'])
+
+        self.assertEqual(attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.order.refresh_from_db()
+        self.assertIsNotNone(self.order.confirmation_sent_at)
+
+    def test_order_can_be_confirmed_again_after_retries_run_out(self):
+        attempts = self.confirm(OSError('Storage unavailable'))
+
+        self.assertEqual(attempts, CONFIRMATION_EMAIL_MAX_RETRIES + 1)
+        self.assertEqual(mail.outbox, [])
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.confirmation_sent_at)
+
+        self.confirm(lambda order: b'%PDF-1.4')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class OrderPlacementEngineTests(TestCase):
+
+    def setUp(self):
+        self.event = make_event()
+        self.general = make_ticket_type(self.event, price=Decimal('50.00'), quantity_available=10)
+        self.vip = make_ticket_type(self.event, name='VIP', price=Decimal('120.00'), quantity_available=2)
+
+    def place(self, items, discount_code=None, ticket_types=None):
+        engine = OrderPlacementEngine(
+            self.event.id, items, discount_code=discount_code, ticket_types=ticket_types
+        )
+        with transaction.atomic():
+            return engine.place(customer_name='Ada Lovelace', customer_email='ada@example.com')
+
+    def test_repeated_ticket_types_are_merged(self):
+        order = self.place([
+            {'ticket_type_id': self.general.id, 'quantity': 2},
+            {'ticket_type_id': self.vip.id, 'quantity': 1},
+            {'ticket_type_id': self.general.id, 'quantity': 1},
+        ])
+
+        self.assertEqual(
+            dict(order.items.values_list('ticket_type_id', 'quantity')),
+            {self.general.id: 3, self.vip.id: 1}
+        )
+        self.assertEqual(order.total_amount, Decimal('270.00'))
+        self.assertEqual(
+            dict(TicketSale.objects.filter(order=order).values_list('ticket_type_id', 'quantity_sold')),
+            {self.general.id: 3, self.vip.id: 1}
+        )
+        self.general.refresh_from_db()
+        self.vip.refresh_from_db()
+        self.assertEqual((self.general.quantity_sold, self.vip.quantity_sold), (3, 1))
+
+    def test_tickets_are_numbered_before_bulk_create(self):
+        order = self.place([{'ticket_type_id': self.general.id, 'quantity': 4}])
+
+        numbers = list(
+            Ticket.objects.filter(order_item__order=order).order_by('id').values_list('ticket_number', flat=True)
+        )
+        self.assertEqual(len(numbers), 4)
+        self.assertTrue(all(numbers))
+        self.assertEqual(numbers, sorted(set(numbers)))
+
+    def test_discount_is_applied_and_counted(self):
+        now = timezone.now()
+        DiscountCode.objects.create(
+            code='LAUNCH10', discount_type='percentage', discount_value=Decimal('10'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+
+        order = self.place([{'ticket_type_id': self.general.id, 'quantity': 2}], discount_code='LAUNCH10')
+
+        self.assertEqual((order.discount_amount, order.total_amount), (Decimal('10.00'), Decimal('90.00')))
+        self.assertEqual(DiscountCode.objects.get(code='LAUNCH10').times_used, 1)
+
+    def test_sold_out_tier_is_named(self):
+        with self.assertRaisesMessage(ValidationError, 'Not enough tickets available for VIP'):
+            self.place([
+                {'ticket_type_id': self.general.id, 'quantity': 1},
+                {'ticket_type_id': self.vip.id, 'quantity': 3},
+            ])
+
+        self.assertFalse(Order.objects.exists())
+        self.general.refresh_from_db()
+        self.assertEqual(self.general.quantity_sold, 0)
+
+    def test_conditional_update_stops_oversell_with_stale_rows(self):
+        # Validation loaded the rows, then another checkout sold the last VIP seats
+        ticket_types = TicketType.objects.in_bulk([self.general.id, self.vip.id])
+        TicketType.objects.filter(id=self.vip.id).update(quantity_sold=2)
+
+        with self.assertRaisesMessage(ValidationError, 'Not enough tickets available'):
+            self.place(
+                [{'ticket_type_id': self.general.id, 'quantity': 1},
+                 {'ticket_type_id': self.vip.id, 'quantity': 1}],
+                ticket_types=ticket_types
+            )
+
+        self.assertFalse(Order.objects.exists())
+        self.general.refresh_from_db()
+        self.vip.refresh_from_db()
+        self.assertEqual((self.general.quantity_sold, self.vip.quantity_sold), (0, 2))
+
+    def test_query_count_does_not_grow_with_the_order(self):
+        # The first order creates the number sequence rows
+        self.place([{'ticket_type_id': self.general.id, 'quantity': 1}])
+
+        with CaptureQueriesContext(connection) as single:
+            self.place([{'ticket_type_id': self.general.id, 'quantity': 1}])
+
+        # Lock, stock UPDATE, order number, order, items, ticket numbers,
+        # tickets and sales, plus the savepoints around them
+        with self.assertNumQueries(16):
+            self.place([
+                {'ticket_type_id': self.general.id, 'quantity': 6},
+                {'ticket_type_id': self.vip.id, 'quantity': 2},
+            ])
+        self.assertEqual(len(single.captured_queries), 16)
+
+
+class OrderCreateAPITests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.event = make_event()
+        self.general = make_ticket_type(self.event, price=Decimal('50.00'), quantity_available=10)
+        self.vip = make_ticket_type(self.event, name='VIP', price=Decimal('120.00'), quantity_available=2)
+
+    def create_order(self, *items):
+        return self.client.post(reverse('order-list'), {
+            'event': self.event.id,
+            'customer_name': 'Ada Lovelace',
+            'customer_email': 'ada@example.com',
+            'items': [
+                {'ticket_type_id': ticket_type.id, 'quantity': quantity} for ticket_type, quantity in items
+            ],
+        }, format='json')
+
+    def assert_order_placed(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_order((self.general, 2), (self.vip, 1), (self.general, 1))
+
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get(order_number=response.data['order_number'])
+        self.assertEqual(order.total_amount, Decimal('270.00'))
+        self.assertEqual(Ticket.objects.filter(order_item__order=order).count(), 4)
+        # The ticket types validation loaded are reused, not fetched again
+        sql = [query['sql'] for query in queries.captured_queries]
+        order_insert = next(i for i, query in enumerate(sql) if query.startswith('INSERT INTO "ticket_order"'))
+        placement = sql[:order_insert]
+        ticket_type_reads = [
+            query for query in placement
+            if query.startswith('SELECT') and 'FROM "ticket_tickettype"' in query
+        ]
+        self.assertEqual(len(ticket_type_reads), 1)
+        return order
+
+    def test_order_is_placed_with_locked_ticket_types(self):
+        self.assert_order_placed()
+        self.general.refresh_from_db()
+        self.assertEqual(self.general.quantity_sold, 3)
+
+    def test_order_is_placed_without_locked_ticket_types(self):
+        get_context = OrderViewSet.get_serializer_context
+
+        def unlocked_context(viewset):
+            context = get_context(viewset)
+            context.pop('lock_ticket_types', None)
+            return context
+
+        with mock.patch.object(OrderViewSet, 'get_serializer_context', unlocked_context):
+            self.assert_order_placed()
+
+    def test_sold_out_tier_is_rejected(self):
+        response = self.create_order((self.general, 1), (self.vip, 3))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Only 2 tickets remaining for VIP', str(response.data))
+        self.assertFalse(Order.objects.exists())
+        self.general.refresh_from_db()
+        self.assertEqual(self.general.quantity_sold, 0)
@@ -3,7 +3,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     TicketTypeViewSet, OrderViewSet, TicketViewSet, DiscountCodeViewSet,
-    paystack_webhook, verify_payment
+    WaitingRoomViewSet,
+    paystack_webhook, verify_payment,
+    initialize_payment_async, verify_payment_async
 )
 
 router = DefaultRouter()
@@ -11,9 +13,12 @@ router.register(r'ticket-types', TicketTypeViewSet, basename='ticket-type')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'tickets', TicketViewSet, basename='ticket')
 router.register(r'discount-codes', DiscountCodeViewSet, basename='discount-code')
+router.register(r'waiting-rooms', WaitingRoomViewSet, basename='waiting-room')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('webhooks/paystack/', paystack_webhook, name='paystack-webhook'),
     path('verify-payment/', verify_payment, name='verify-payment'),
+    path('async/orders/<int:pk>/initialize-payment/', initialize_payment_async, name='initialize-payment-async'),
+    path('async/verify-payment/', verify_payment_async, name='verify-payment-async'),
 ]
\ No newline at end of file
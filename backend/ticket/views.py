@@ -6,18 +6,19 @@ from django.db import transaction
 from django.utils import timezone
 from django.db.models import Sum, Count, Q
 from django.conf import settings
-from decimal import Decimal
 from django.db import models
+from django.http import HttpResponse, StreamingHttpResponse
 
 from .models import (
-    TicketType, Order, OrderItem, Ticket, 
-    DiscountCode, TicketSale
+    TicketType, Order, Ticket, 
+    DiscountCode, WaitingRoom
 )
+from .idempotency import idempotent
 from .serializers import (
     TicketTypeSerializer, TicketTypeCreateSerializer,
     OrderSerializer, OrderCreateSerializer, OrderItemSerializer,
     TicketSerializer, DiscountCodeSerializer, DiscountCodeValidateSerializer,
-    TicketSaleSerializer
+    TicketSaleSerializer, WaitingRoomSerializer
 )
 
 
@@ -60,6 +61,13 @@ class TicketTypeViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def perform_update(self, serializer):
+        from .inventory import get_inventory
+        
+        ticket_type = serializer.save()
+        # Capacity changes reach the seat counters without waiting for the reconciler
+        transaction.on_commit(lambda: get_inventory().refresh([ticket_type.id]))
+    
     @action(detail=True, methods=['post'])
     def add_benefit(self, request, pk=None):
         """Add a benefit to a ticket type"""
@@ -116,104 +124,54 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         return queryset
     
-    @transaction.atomic
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'create':
+            # Validation holds the seats and locks the ticket types it loads
+            context['hold_inventory'] = True
+            context['lock_ticket_types'] = True
+        return context
+    
+    @idempotent('order-create')
     def create(self, request):
         """Create a new ticket order"""
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        
-        data = serializer.validated_data
+        from . import waiting_room
+        from .inventory import get_inventory
+        from .order_placement import OrderPlacementEngine
         
-        # Create order
-        order = Order.objects.create(
-            event_id=data['event'],
-            customer_name=data['customer_name'],
-            customer_email=data['customer_email'],
-            customer_phone=data.get('customer_phone', ''),
-            ip_address=self.get_client_ip(request)
-        )
-        
-        subtotal = Decimal('0.00')
+        serializer = self.get_serializer(data=request.data)
+        inventory = get_inventory()
         
-        # Create order items and calculate totals
-        for item_data in data['items']:
-            ticket_type = TicketType.objects.select_for_update().get(
-                id=item_data['ticket_type_id']
-            )
-            
-            # Check availability again (with lock)
-            if ticket_type.quantity_sold + item_data['quantity'] > ticket_type.quantity_available:
-                raise serializers.ValidationError(
-                    f"Not enough tickets available for {ticket_type.name}"
+        try:
+            with transaction.atomic():
+                serializer.is_valid(raise_exception=True)
+                data = serializer.validated_data
+                hold_id = serializer.context.get('hold_id')
+                
+                engine = OrderPlacementEngine(
+                    event_id=data['event'],
+                    items=data['items'],
+                    discount_code=data.get('discount_code'),
+                    ticket_types=serializer.context['ticket_types']
                 )
-            
-            # Create order item
-            order_item = OrderItem.objects.create(
-                order=order,
-                ticket_type=ticket_type,
-                quantity=item_data['quantity'],
-                unit_price=ticket_type.price
-            )
-            
-            subtotal += order_item.total_price
-            
-            # Update ticket type quantity
-            ticket_type.quantity_sold += item_data['quantity']
-            ticket_type.save()
-            
-            # Create individual tickets
-            for i in range(item_data['quantity']):
-                Ticket.objects.create(
-                    order_item=order_item,
-                    ticket_type=ticket_type,
-                    event=ticket_type.event,
-                    holder_name=order.customer_name,
-                    holder_email=order.customer_email,
-                    holder_phone=order.customer_phone
+                order = engine.place(
+                    customer_name=data['customer_name'],
+                    customer_email=data['customer_email'],
+                    customer_phone=data.get('customer_phone', ''),
+                    ip_address=self.get_client_ip(request)
                 )
-            
-            # Create sales record
-            TicketSale.objects.create(
-                event=ticket_type.event,
-                ticket_type=ticket_type,
-                order=order,
-                quantity_sold=item_data['quantity'],
-                revenue=order_item.total_price
-            )
-        
-        # Apply discount if provided
-        discount_amount = Decimal('0.00')
-        if 'discount_code' in data and data['discount_code']:
-            discount_code = DiscountCode.objects.filter(
-                code=data['discount_code'],
-                is_active=True
-            ).first()
-            
-            if discount_code and discount_code.is_valid:
-                if discount_code.discount_type == 'percentage':
-                    discount_amount = subtotal * (discount_code.discount_value / 100)
-                else:
-                    discount_amount = discount_code.discount_value
-                
-                discount_code.times_used += 1
-                discount_code.save()
-        
-        # Calculate totals
-        tax_amount = Decimal('0.00')  # Add tax calculation if needed
-        total_amount = subtotal - discount_amount + tax_amount
-        
-        # Update order
-        order.subtotal = subtotal
-        order.discount_amount = discount_amount
-        order.tax_amount = tax_amount
-        order.total_amount = total_amount
-        order.save()
+                transaction.on_commit(lambda: inventory.confirm(hold_id, engine.quantities))
+        except Exception:
+            inventory.release(serializer.context.get('hold_id'))
+            waiting_room.release(serializer.context.get('queue_claim'))
+            raise
         
         # Return order details
         order_serializer = OrderSerializer(order)
         return Response(order_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
+    @idempotent('order-initialize-payment')
     def initialize_payment(self, request, pk=None):
         """Initialize Paystack payment for an order"""
         from .payment_handlers import PaystackPaymentHandler
@@ -236,47 +194,41 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=True, methods=['post'])
+    @idempotent('order-confirm-payment')
     def confirm_payment(self, request, pk=None):
         """Confirm payment for an order and create guest"""
         order = self.get_object()
         
         with transaction.atomic():
-            # Update order status
-            order.payment_status = 'successful'
-            order.status = 'completed'
-            order.payment_date = timezone.now()
-            order.payment_method = request.data.get('payment_method', '')
-            order.payment_reference = request.data.get('payment_reference', '')
-            order.save()
-            
-            # Create or get guest for the event
-            from guests.models import Guest
-            guest, created = Guest.objects.get_or_create(
-                event=order.event,
-                email=order.customer_email,
-                defaults={
-                    'name': order.customer_name,
-                    'phone_number': order.customer_phone,
-                    'rsvp_status': 'confirmed',
-                    'invitation_sent': True,
-                    'source': 'ticket_purchase',
-                }
+            order.mark_as_paid(
+                payment_method=request.data.get('payment_method', ''),
+                payment_reference=request.data.get('payment_reference', '')
             )
             
-            # If guest already exists, update their info
-            if not created:
-                guest.name = order.customer_name
-                guest.phone_number = order.customer_phone or guest.phone_number
-                guest.rsvp_status = 'confirmed'
-                guest.save()
-            
-            # Send confirmation email with tickets
-            from .tasks import send_ticket_confirmation_email
-            send_ticket_confirmation_email(order.id)
+            # Send confirmation email with tickets once this commits
+            from .tasks import enqueue_ticket_confirmation
+            enqueue_ticket_confirmation(order.id)
         
         serializer = self.get_serializer(order)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def tickets_pdf(self, request, pk=None):
+        """Download the order's tickets as a PDF"""
+        from .pdf_generator import get_order_pdf
+        
+        order = self.get_object()
+        
+        if order.payment_status != 'successful':
+            return Response(
+                {'error': 'Tickets are available once the order is paid'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        response = HttpResponse(get_order_pdf(order), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="Tickets_{order.order_number}.pdf"'
+        return response
+    
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel an order and refund tickets"""
@@ -295,13 +247,18 @@ class OrderViewSet(viewsets.ModelViewSet):
             order.save()
             
             # Return tickets to inventory
+            returned = {}
             for item in order.items.all():
                 ticket_type = item.ticket_type
                 ticket_type.quantity_sold -= item.quantity
                 ticket_type.save()
+                returned[ticket_type.id] = returned.get(ticket_type.id, 0) + item.quantity
                 
                 # Cancel individual tickets
                 item.tickets.update(status='cancelled')
+            
+            from .inventory import get_inventory
+            transaction.on_commit(lambda: get_inventory().restock(returned))
         
         serializer = self.get_serializer(order)
         return Response(serializer.data)
@@ -344,6 +301,47 @@ class TicketViewSet(viewsets.ReadOnlyModelViewSet):
         
         return queryset
     
+    @action(detail=False, methods=['get'])
+    def pdf(self, request):
+        """
+        Stream the valid tickets of one of your events (?event=) or of
+        one order (?order=) as a PDF, page by page
+        """
+        from .pdf_stream import StreamingTicketGenerator
+        
+        event_id = request.query_params.get('event')
+        order_id = request.query_params.get('order')
+        
+        if not event_id and not order_id:
+            return Response(
+                {'error': 'event or order is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        tickets = Ticket.objects.filter(
+            event__organizer=request.user,
+            status='valid'
+        ).select_related('ticket_type', 'event')
+        if event_id:
+            tickets = tickets.filter(event_id=event_id)
+        if order_id:
+            tickets = tickets.filter(order_item__order_id=order_id)
+        
+        if not tickets.exists():
+            return Response(
+                {'error': 'No tickets found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        generator = StreamingTicketGenerator()
+        response = StreamingHttpResponse(
+            generator.stream_tickets_pdf(tickets.order_by('id').iterator(chunk_size=500)),
+            content_type='application/pdf'
+        )
+        filename = f"Tickets_order_{order_id}.pdf" if order_id else f"Tickets_event_{event_id}.pdf"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
     @action(detail=True, methods=['post'])
     def check_in(self, request, pk=None):
         """Check in a ticket"""
@@ -361,12 +359,15 @@ class TicketViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        ticket.checked_in = True
-        ticket.checked_in_at = timezone.now()
-        ticket.checked_in_by = request.user
-        ticket.status = 'used'
-        ticket.save()
+        # Conditional update: a concurrent scan may have admitted it since
+        if Ticket.admit(ticket.id, user=request.user) is None:
+            ticket.refresh_from_db(fields=['status', 'checked_in'])
+            return Response(
+                {'error': 'Ticket already checked in' if ticket.checked_in else f'Ticket is {ticket.status}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        ticket.refresh_from_db()
         serializer = self.get_serializer(ticket)
         return Response(serializer.data)
 
@@ -433,6 +434,66 @@ class DiscountCodeViewSet(viewsets.ModelViewSet):
         })
 
 
+class WaitingRoomViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for managing event waiting rooms and queueing buyers
+    """
+    queryset = WaitingRoom.objects.all()
+    serializer_class = WaitingRoomSerializer
+    
+    def get_permissions(self):
+        """Buyers can join the queue and poll without an account"""
+        if self.action in ['join', 'position']:
+            return [permissions.AllowAny()]
+        return [permissions.IsAuthenticated()]
+    
+    def get_queryset(self):
+        return WaitingRoom.objects.filter(event__organizer=self.request.user)
+    
+    @action(detail=False, methods=['post'])
+    def join(self, request):
+        """Join the queue for an event and get a signed queue token"""
+        from . import waiting_room
+        
+        try:
+            event_id = int(request.data.get('event'))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'event is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        joined = waiting_room.join(event_id)
+        if joined is None:
+            return Response(
+                {'error': 'Event has no active waiting room'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        token, _ = joined
+        return Response(
+            {'token': token, **waiting_room.get_status(token)},
+            status=status.HTTP_201_CREATED
+        )
+    
+    @action(detail=False, methods=['get'])
+    def position(self, request):
+        """Poll queue position for a token (served from the cache)"""
+        from . import waiting_room
+        
+        token = request.query_params.get('token')
+        if not token:
+            return Response(
+                {'error': 'token is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            return Response(waiting_room.get_status(token))
+        except waiting_room.QueueTokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 # Webhook Views (Outside viewsets)
 from rest_framework.decorators import api_view, permission_classes
 import hmac
@@ -445,7 +506,12 @@ def paystack_webhook(request):
     """
     Handle Paystack webhook for payment verification
     Endpoint: /api/tickets/webhooks/paystack/
+    
+    The event is only verified and stored here; process_payment_webhook
+    applies it, so Paystack gets its 200 without waiting on PDF or SMTP work.
     """
+    from notifications.outbox import enqueue
+    from .models import PaymentWebhookEvent
     
     # Verify webhook signature
     signature = request.headers.get('X-Paystack-Signature', '')
@@ -458,7 +524,7 @@ def paystack_webhook(request):
         hashlib.sha512
     ).hexdigest()
     
-    if computed_hash != signature:
+    if not hmac.compare_digest(computed_hash, signature):
         return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
     
     # Parse webhook data
@@ -468,61 +534,28 @@ def paystack_webhook(request):
         return Response({'error': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
     
     event = webhook_data.get('event')
-    data = webhook_data.get('data', {})
+    reference = (webhook_data.get('data') or {}).get('reference')
     
-    # Handle successful charge
-    if event == 'charge.success':
-        reference = data.get('reference')
-        amount = data.get('amount', 0) / 100  # Convert from kobo
+    # Only successful charges are handled
+    if event != 'charge.success' or not reference:
+        return Response({'status': 'ignored'})
+    
+    # Paystack retries deliveries, the inbox keeps one row per reference
+    with transaction.atomic():
+        webhook_event, created = PaymentWebhookEvent.objects.get_or_create(
+            provider='paystack',
+            event_type=event,
+            reference=reference,
+            defaults={'payload': webhook_data}
+        )
         
-        try:
-            with transaction.atomic():
-                order = Order.objects.select_for_update().get(order_number=reference)
-                
-                # Prevent double processing
-                if order.payment_status == 'successful':
-                    return Response({'status': 'already_processed'})
-                
-                # Verify amount matches
-                if Decimal(str(amount)) != order.total_amount:
-                    return Response({'error': 'Amount mismatch'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Update order
-                order.payment_status = 'successful'
-                order.status = 'completed'
-                order.payment_date = timezone.now()
-                order.payment_method = 'paystack'
-                order.payment_reference = reference
-                order.save()
-                
-                # Create/update guest
-                from guests.models import Guest
-                guest, created = Guest.objects.get_or_create(
-                    event=order.event,
-                    email=order.customer_email,
-                    defaults={
-                        'name': order.customer_name,
-                        'phone_number': order.customer_phone,
-                        'rsvp_status': 'confirmed',
-                        'invitation_sent': True,
-                        'source': 'ticket_purchase',
-                    }
-                )
-                
-                if not created:
-                    guest.name = order.customer_name
-                    guest.phone_number = order.customer_phone or guest.phone_number
-                    guest.rsvp_status = 'confirmed'
-                    guest.save()
-                
-                # Send confirmation email
-                from .tasks import send_ticket_confirmation_email
-                send_ticket_confirmation_email(order.id)
-                
-        except Order.DoesNotExist:
-            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # A redelivery of an event that was never applied (its task was
+        # lost, or processing failed) is queued again
+        if created or webhook_event.status in ('received', 'failed'):
+            enqueue('ticket.tasks.process_payment_webhook', webhook_event.id)
+    
+    if not created:
+        return Response({'status': 'already_received'})
     
     return Response({'status': 'success'})
 
@@ -553,9 +586,9 @@ def verify_payment(request):
         
         # Check if payment is successful
         if verification.get('transaction_status') == 'success':
-            # Send confirmation email
-            from .tasks import send_ticket_confirmation_email
-            send_ticket_confirmation_email(order.id)
+            # Send confirmation email (once, however often this is called)
+            from .tasks import enqueue_ticket_confirmation
+            enqueue_ticket_confirmation(order.id)
             return Response({
                 'status': 'success',
                 'order_status': order.status,
@@ -573,4 +606,93 @@ def verify_payment(request):
     except Order.DoesNotExist:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Async payment views (plain Django views, DRF views can't be async)
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+async def _authenticate_jwt(request):
+    """Return the JWT-authenticated user for a plain Django view, or None"""
+    from asgiref.sync import sync_to_async
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@csrf_exempt
+@require_POST
+async def initialize_payment_async(request, pk):
+    """
+    Async variant of OrderViewSet.initialize_payment for ASGI deployments
+    Endpoint: /api/ticket/async/orders/<pk>/initialize-payment/
+    """
+    from .payment_handlers import AsyncPaystackPaymentHandler
+    
+    if await _authenticate_jwt(request) is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided.'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    try:
+        order = await Order.objects.select_related('event').aget(pk=pk)
+    except Order.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if order.payment_status == 'successful':
+        return JsonResponse(
+            {'error': 'Order already paid'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    payment_data = await AsyncPaystackPaymentHandler.initialize_payment(order)
+    return JsonResponse(payment_data)
+
+
+@require_GET
+async def verify_payment_async(request):
+    """
+    Async variant of verify_payment for ASGI deployments
+    Endpoint: /api/ticket/async/verify-payment/?reference=ORD-XXX
+    """
+    from asgiref.sync import sync_to_async
+    from .payment_handlers import AsyncPaystackPaymentHandler
+    from .tasks import enqueue_ticket_confirmation
+    
+    reference = request.GET.get('reference')
+    
+    if not reference:
+        return JsonResponse({'error': 'Reference required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    verification = await AsyncPaystackPaymentHandler.verify_payment(reference)
+    
+    if not verification.get('status'):
+        return JsonResponse(verification, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        order = await Order.objects.aget(order_number=reference)
+    except Order.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if verification.get('transaction_status') == 'success':
+        # Queued rather than rendered here, so the event loop is not blocked
+        await sync_to_async(enqueue_ticket_confirmation)(order.id)
+        return JsonResponse({
+            'status': 'success',
+            'order_status': order.status,
+            'payment_status': order.payment_status,
+            'order_number': order.order_number,
+            'amount': float(order.total_amount),
+        })
+    
+    return JsonResponse({
+        'status': 'failed',
+        'message': 'Payment not successful',
+    }, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,175 @@
+# tickets/waiting_room.py
+import math
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+
+TOKEN_SALT = 'ticket.waiting_room'
+
+# Queue tokens older than this are rejected outright
+TOKEN_MAX_AGE = 24 * 60 * 60
+
+# Room settings are read from the cache on every poll; edits through
+# WaitingRoom.save() invalidate them, the timeout bounds anything missed
+CONFIG_CACHE_TIMEOUT = 60
+
+UNAVAILABLE_MESSAGE = 'Waiting rooms need a shared Redis cache (REDIS_URL)'
+
+
+class QueueTokenError(Exception):
+    """Raised for queue tokens that are forged, expired or not yet admitted"""
+
+
+def _config_key(event_id):
+    return f"waiting_room:{event_id}:config"
+
+
+def _tail_key(event_id):
+    return f"waiting_room:{event_id}:tail"
+
+
+def _used_key(event_id, position):
+    return f"waiting_room:{event_id}:used:{position}"
+
+
+def available():
+    """
+    Queue positions and single-use tokens live in the cache, so they only
+    hold across processes when every process shares it (Redis). Without
+    REDIS_URL the cache is per process and waiting rooms are disabled.
+    """
+    return bool(settings.REDIS_URL)
+
+
+def invalidate_config(event_id):
+    cache.delete(_config_key(event_id))
+
+
+def get_config(event_id):
+    """
+    Return the active waiting room settings for an event as a dict, or None
+    (also when waiting rooms are not available). Only hits the database on
+    a cache miss.
+    """
+    if not available():
+        return None
+
+    config = cache.get(_config_key(event_id))
+    if config is None:
+        from .models import WaitingRoom
+
+        room = WaitingRoom.objects.filter(event_id=event_id, is_active=True).first()
+        config = {
+            'active': room is not None,
+            'opens_at': room.opens_at.timestamp() if room else 0,
+            'rate': room.admit_per_minute if room else 0,
+            'window': room.admission_window_minutes * 60 if room else 0,
+        }
+        cache.set(_config_key(event_id), config, CONFIG_CACHE_TIMEOUT)
+
+    return config if config['active'] else None
+
+
+def admitted_through(config, now=None):
+    """Highest queue position admitted so far"""
+    now = time.time() if now is None else now
+    if now < config['opens_at'] or not config['rate']:
+        return 0
+    return math.floor((now - config['opens_at']) * config['rate'] / 60)
+
+
+def admission_time(config, position, joined_at=0):
+    """
+    Unix time at which a queue position is let in: its slot in the
+    schedule, or when it joined if the queue had already moved past it
+    """
+    return max(joined_at, config['opens_at'] + math.ceil(position * 60 / config['rate']))
+
+
+def join(event_id):
+    """
+    Put a buyer in the queue for an event.
+    Returns (token, position), or None if the event has no active room.
+    """
+    if get_config(event_id) is None:
+        return None
+
+    cache.add(_tail_key(event_id), 0, timeout=None)
+    position = cache.incr(_tail_key(event_id))
+    token = signing.dumps(
+        {'e': event_id, 'p': position, 'j': int(time.time())}, salt=TOKEN_SALT
+    )
+    return token, position
+
+
+def read_token(token):
+    """Return (event_id, position, joined_at) from a queue token"""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise QueueTokenError('Queue token has expired')
+    except signing.BadSignature:
+        raise QueueTokenError('Invalid queue token')
+    return data['e'], data['p'], data.get('j', 0)
+
+
+def get_status(token):
+    """Queue position details for a token, computed without the database"""
+    event_id, position, joined_at = read_token(token)
+    config = get_config(event_id)
+    now = time.time()
+
+    if config is None:
+        return {'event': event_id, 'position': position, 'admitted': True, 'ahead': 0}
+
+    through = admitted_through(config, now)
+    admitted_at = admission_time(config, position, joined_at)
+    return {
+        'event': event_id,
+        'position': position,
+        'admitted': position <= through and now <= admitted_at + config['window'],
+        'expired': now > admitted_at + config['window'],
+        'ahead': max(0, position - through - 1),
+        'estimated_wait_seconds': max(0, math.ceil(admitted_at - now)),
+    }
+
+
+def check_admission(event_id, token):
+    """
+    Raise QueueTokenError unless ``token`` lets its holder check out for
+    ``event_id`` right now, and claim the token so that no other checkout
+    can use it. Returns the claim, to be given back with release() if the
+    checkout fails, or None for events without an active room (no token
+    needed).
+    """
+    config = get_config(event_id)
+    if config is None:
+        return None
+
+    if not token:
+        raise QueueTokenError('This event has a waiting room, join the queue first')
+
+    token_event_id, position, joined_at = read_token(token)
+    if token_event_id != event_id:
+        raise QueueTokenError('Queue token is for a different event')
+
+    now = time.time()
+    if position > admitted_through(config, now):
+        raise QueueTokenError('You have not been admitted from the queue yet')
+    closes_at = admission_time(config, position, joined_at) + config['window']
+    if now > closes_at:
+        raise QueueTokenError('Your admission window has expired')
+
+    # Atomic, so concurrent checkouts with the same token cannot both pass
+    if not cache.add(_used_key(event_id, position), True, max(1, math.ceil(closes_at - now))):
+        raise QueueTokenError('Queue token has already been used')
+    return event_id, position
+
+
+def release(claim):
+    """Give a claimed token back when its checkout did not go through"""
+    if claim is not None:
+        cache.delete(_used_key(*claim))